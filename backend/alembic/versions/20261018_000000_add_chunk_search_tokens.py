@@ -0,0 +1,55 @@
+"""add document_chunks.search_tokens for lexical retrieval
+
+Revision ID: 20261018_000000
+Revises: 20260410_000000
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.lexical import build_search_tokens
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20261018_000000'
+down_revision: Union[str, None] = '20260410_000000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    op.add_column('document_chunks', sa.Column('search_tokens', sa.Text(), nullable=True))
+
+    # 回填已有分块的词元（分词在 Python 侧完成，数据库 C locale 下无法切分中文）
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(
+                "SELECT id, content FROM document_chunks "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            sa.text("UPDATE document_chunks SET search_tokens = :tokens WHERE id = :id"),
+            [{"id": row.id, "tokens": build_search_tokens(row.content)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    op.execute(
+        "CREATE INDEX ix_document_chunks_search_tokens ON document_chunks "
+        "USING gin (array_to_tsvector(string_to_array(search_tokens, ' ')))"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_document_chunks_search_tokens', table_name='document_chunks')
+    op.drop_column('document_chunks', 'search_tokens')
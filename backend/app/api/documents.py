@@ -6,11 +6,14 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
+from loguru import logger
 
 from app.core.database import get_db
 from app.models import Document, User
 from app.core.config import settings
 from app.core.auth import get_current_user
+from app.services.answer_cache import answer_cache
+from app.services.vector_store import vector_store
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
@@ -154,8 +157,19 @@ async def delete_document(
     if not document:
         raise HTTPException(status_code=404, detail="文档不存在")
 
-    # TODO: 删除文件和向量
+    # TODO: 删除文件
+    department_id = document.department_id
+    # 先删除向量：失败时保留文档记录以便重试，避免已删除文档的分块仍能被检索到
+    try:
+        await vector_store.delete_by_document(document_id, department_id=department_id)
+    except Exception as e:
+        logger.error(f"删除文档向量失败 | 文档ID: {document_id} | 错误: {e}")
+        raise HTTPException(status_code=503, detail="删除文档向量失败，请稍后重试")
+
     await db.delete(document)
     await db.commit()
 
+    # 已缓存的答案可能引用了被删除的文档
+    await answer_cache.invalidate_department(department_id)
+
     return {"message": "文档已删除"}
@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 
 from app.core.database import get_db
+from app.core.metrics import metrics
 from app.models import User, Document, Department
 
 router = APIRouter(prefix="/health", tags=["Health"])
@@ -32,3 +33,9 @@ async def get_stats(db: AsyncSession = Depends(get_db)):
         "documents": doc_count or 0,
         "departments": dept_count or 0
     }
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """获取当前进程的运行指标"""
+    return metrics.snapshot()
@@ -1,33 +1,163 @@
 """
 查询 API - RAG 问答接口
 """
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from loguru import logger
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
+from app.services.admission import AdmissionRejected, AdmissionTicket, admission_controller
 from app.services.rag import rag_service
+from app.core.config import settings
 from app.core.auth import get_current_user
+from app.core.metrics import metrics
 from app.models.models import User
 
 router = APIRouter(prefix="/query", tags=["Query"])
 
+client_disconnects = metrics.counter(
+    "query_client_disconnects_total", "处理完成前客户端已断开、被取消的查询数（按接口）"
+)
+
+# 客户端在服务端返回前关闭连接（沿用 nginx 的约定状态码）
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """客户端在查询完成前断开连接"""
+
 
 class QueryRequest(BaseModel):
     """查询请求"""
     question: str
     history: Optional[List[dict]] = None
     top_k: int = 5
+    conversation_id: Optional[str] = None
+    include_timings: bool = False
 
 
 class QueryResponse(BaseModel):
     """查询响应"""
     answer: str
     sources: List[dict]
+    timings: Optional[dict] = None
+    cached: bool = False
+    suggestions: Optional[List[dict]] = None
+
+
+class BatchQueryRequest(BaseModel):
+    """批量查询请求"""
+    questions: List[str]
+    top_k: int = 5
+
+
+class BatchQueryItem(BaseModel):
+    """批量查询中单个问题的结果"""
+    question: str
+    answer: Optional[str] = None
+    sources: List[dict] = []
+    cached: bool = False
+    suggestions: Optional[List[dict]] = None
+    error: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """批量查询响应"""
+    results: List[BatchQueryItem]
+    timings: Optional[dict] = None
+
+
+def conversation_key(user: User, request: QueryRequest) -> Optional[str]:
+    """会话缓存键，按用户隔离
+
+    未提供 conversation_id 时以首条历史消息识别同一会话
+    """
+    if request.conversation_id:
+        return f"{user.id}:{request.conversation_id}"
+    if request.history:
+        first = json.dumps(request.history[0], ensure_ascii=False, sort_keys=True)
+        return f"{user.id}:{hashlib.sha1(first.encode('utf-8')).hexdigest()}"
+    return None
+
+
+async def admit(user: User) -> Optional[AdmissionTicket]:
+    """获取查询准入额度（按部门和用户限流），被拒绝时返回 429 + Retry-After"""
+    if not settings.admission_enabled:
+        return None
+    try:
+        return await admission_controller.acquire(user.department_id or 1, user.id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+async def admit_batch(user: User, slots: int) -> List[AdmissionTicket]:
+    """批量查询的准入：每个并发 LLM 调用占一个额度
+
+    第一个额度与单条查询一样排队获取（被拒绝时返回 429），其余额度只取当前空闲的，
+    批量查询的并发数等于实际取得的额度数
+    """
+    ticket = await admit(user)
+    if ticket is None:
+        return []
+    tickets = [ticket]
+    while len(tickets) < slots:
+        extra = admission_controller.try_acquire(ticket.department_id, user.id)
+        if extra is None:
+            break
+        tickets.append(extra)
+    return tickets
+
+
+def release(ticket: Optional[AdmissionTicket]):
+    if ticket is not None:
+        ticket.release()
+
+
+async def until_disconnected(http_request: Request, work: Awaitable[Any], endpoint: str) -> Any:
+    """执行查询，期间轮询客户端连接；客户端断开时取消查询并抛出 ClientDisconnected
+
+    取消会沿 await 链传到进行中的向量化、检索和 LLM HTTP 调用；
+    合并的请求只有在所有等待者都离开后才取消共享的计算
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.query_disconnect_poll_ms / 1000)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    client_disconnects.inc(endpoint=endpoint)
+    logger.info(f"客户端已断开，取消查询（{endpoint}）")
+    raise ClientDisconnected()
+
+
+def format_sse(event: str, data: dict) -> str:
+    """格式化为 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @router.post("/", response_model=QueryResponse)
 async def query(
     request: QueryRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -36,19 +166,137 @@ async def query(
     - **question**: 用户问题
     - **history**: 对话历史（可选）
     - **top_k**: 返回的文档数量（默认5）
-    
+    - **conversation_id**: 会话ID（可选，用于缓存早先历史的摘要）
+    - **include_timings**: 是否在响应中返回各阶段耗时（embed/search/context/prompt/llm，毫秒）
+
+    没有检索到相关内容时直接返回提示答案（不调用 LLM），suggestions 中给出相近的文档。
+    客户端在返回前断开时取消进行中的检索与生成（包括排队等待准入）。
+    部门或用户的并发查询超限且无法排队时返回 429，Retry-After 给出建议的重试间隔
+
     部门ID自动从当前用户获取
     """
+    # 使用当前用户的部门ID
+    department_id = current_user.department_id or 1  # 默认部门为1
+
+    async def answer():
+        ticket = await admit(current_user)
+        try:
+            return await rag_service.query(
+                question=request.question,
+                department_id=department_id,
+                history=request.history,
+                top_k=request.top_k,
+                conversation_key=conversation_key(current_user, request),
+            )
+        finally:
+            release(ticket)
+
+    try:
+        result = await until_disconnected(http_request, answer(), endpoint="query")
+        if not request.include_timings:
+            result["timings"] = None
+        return result
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/batch", response_model=BatchQueryResponse)
+async def query_batch(
+    request: BatchQueryRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量执行 RAG 查询（需要登录）
+
+    适用于 FAQ 生成、评测等离线任务。所有问题一次向量化、一次多向量检索，
+    LLM 调用按 QUERY_BATCH_CONCURRENCY 并发
+
+    - **questions**: 问题列表（最多 QUERY_BATCH_MAX_SIZE 个）
+    - **top_k**: 每个问题返回的文档数量（默认5）
+
+    单个问题生成失败时该项 answer 为空并附带 error，不影响其余问题。
+    每个并发 LLM 调用占用一个准入额度，额度不足时降低并发；一个额度也拿不到时返回 429
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="问题列表不能为空")
+    if len(request.questions) > settings.query_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多提交 {settings.query_batch_max_size} 个问题",
+        )
+
+    slots = min(settings.query_batch_concurrency, len(request.questions))
+    tickets = await admit_batch(current_user, slots)
     try:
-        # 使用当前用户的部门ID
         department_id = current_user.department_id or 1  # 默认部门为1
-        
-        result = await rag_service.query(
-            question=request.question,
+
+        return await rag_service.batch_query(
+            questions=request.questions,
             department_id=department_id,
-            history=request.history,
             top_k=request.top_k,
+            concurrency=len(tickets) or None,
         )
-        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for ticket in tickets:
+            ticket.release()
+
+
+@router.post("/stream")
+async def query_stream(
+    request: QueryRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式执行 RAG 查询（需要登录，Server-Sent Events）
+
+    事件顺序：
+    - **sources**: 检索完成后立即发送来源文档
+    - **token**: LLM 生成的增量文本（多次；命中答案缓存时一次给出完整答案）
+    - **done**: 生成结束，附带是否命中缓存、无相关内容时推荐的文档（include_timings 为真时附带各阶段耗时）
+    - **error**: 处理失败时发送，随后关闭连接
+
+    客户端断开时停止发送，进行中的检索与生成随之取消。准入限制与 /query/ 相同
+    """
+    department_id = current_user.department_id or 1  # 默认部门为1
+    ticket = await admit(current_user)
+
+    async def event_source():
+        try:
+            async for event, data in rag_service.stream_query(
+                question=request.question,
+                department_id=department_id,
+                history=request.history,
+                top_k=request.top_k,
+                conversation_key=conversation_key(current_user, request),
+            ):
+                if not request.include_timings:
+                    # 合并的请求共享事件数据，不能原地修改
+                    data = {k: v for k, v in data.items() if k != "timings"}
+                yield format_sse(event, data)
+        except asyncio.CancelledError:
+            # StreamingResponse 检测到客户端断开后取消发送任务，取消沿迭代链传到生成过程
+            client_disconnects.inc(endpoint="stream")
+            logger.info("客户端已断开，取消流式查询")
+            raise
+        except Exception as e:
+            logger.error(f"❌ 流式查询失败: {str(e)}")
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            release(ticket)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 禁止 nginx 缓冲，保证 token 实时下发
+        },
+        # 事件流未被迭代时 finally 不会执行，由后台任务兜底归还准入额度（release 可重复调用）
+        background=BackgroundTask(release, ticket),
+    )
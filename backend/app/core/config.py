@@ -2,11 +2,24 @@
 核心配置模块
 """
 from functools import lru_cache
-from typing import List
+from typing import Dict, List
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 
 
+def _parse_float_mapping(raw: str) -> Dict[str, float]:
+    """解析 "a=1,b=2.5" 形式的配置，键转小写，忽略格式不正确的项"""
+    mapping = {}
+    for item in raw.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            try:
+                mapping[key.strip().lower()] = float(value)
+            except ValueError:
+                continue
+    return mapping
+
+
 class Settings(BaseSettings):
     """应用配置"""
 
@@ -32,11 +45,30 @@ class Settings(BaseSettings):
         return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
 
     # Vector Database - Chroma Cloud
-    chroma_mode: str = "cloud"  # "cloud" or "local"
+    chroma_mode: str = "cloud"  # "cloud"、"local"、"flat"（进程内 NumPy 平铺索引）或 "sharded"（多实例分片）
     chroma_api_key: str = ""
     chroma_tenant: str = ""
     chroma_database: str = ""
     chroma_persist_directory: str = "./data/chroma"  # 仅用于本地模式
+    # HNSW 索引参数，创建集合时写入集合配置（configuration.hnsw）；construction_ef 和 M 修改后需重建集合，
+    # search_ef 在打开已有集合时同步。cloud 模式使用 SPANN 索引，不使用这些参数
+    chroma_hnsw_construction_ef: int = 100  # 建索引时的候选列表大小，越大图质量越高、写入越慢
+    chroma_hnsw_search_ef: int = 10  # 检索时的候选列表大小，越大召回越高、延迟越大
+    chroma_hnsw_m: int = 16  # 每个节点的最大邻居数，越大召回越高、内存越大
+    vector_store_max_workers: int = 8  # Chroma 同步调用专用线程池的大小
+    vector_upsert_batch_size: int = 5000  # 单次写入的分块数上限（不超过后端的最大批大小）
+    vector_upsert_concurrency: int = 4  # 批量写入时并发执行的批次数
+    flat_index_directory: str = "./data/flat_index"  # 仅用于 flat 模式，API 与 worker 可共用（须为本地文件系统）
+    flat_index_compaction_ratio: float = 0.2  # 分片死行占比达到该值时压缩
+    flat_index_compaction_interval_seconds: int = 3600  # Celery beat 定期压缩的间隔，0 表示不定期压缩
+    vector_partition_by_department: bool = False  # 每个部门的分块存放在独立的集合中
+    vector_shards_raw: str = ""  # sharded 模式的分片地址，逗号分隔，http://host:port 或本地目录
+    vector_shard_timeout_ms: int = 500  # 单个分片的检索超时，超时的分片被跳过（返回部分结果）
+    vector_shard_workers: int = 4  # 每个分片专用的线程数，全部被慢查询占用时该分片被跳过
+
+    @property
+    def vector_shards(self) -> List[str]:
+        return [item.strip() for item in self.vector_shards_raw.split(",") if item.strip()]
 
     # File Storage - MinIO
     minio_endpoint: str = "localhost:9000"
@@ -50,6 +82,7 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_password: str = ""
     redis_db: int = 0
+    redis_socket_timeout: float = 0.5  # 缓存场景下快速失败，避免拖慢查询
 
     @property
     def redis_url(self) -> str:
@@ -76,6 +109,117 @@ class Settings(BaseSettings):
     # Expected vector dimensions for validation
     embedding_dimension: int = 1536  # OpenAI text-embedding-3-small default
 
+    # Model Clients - 模型调用连接池（查询与文档入库共享）
+    model_http_max_connections: int = 100  # 每个提供商连接池的最大连接数
+    model_http_max_keepalive_connections: int = 20
+    model_http_keepalive_expiry: float = 30.0  # 空闲连接保留秒数
+    model_http_connect_timeout: float = 5.0
+    model_http_timeout: float = 60.0  # 未单独配置的提供商的读写超时（秒）
+    model_http_timeouts_raw: str = "openai=30,glm=30,qwen=30,llm=60"  # 按提供商的读写超时，llm 为生成模型
+
+    @property
+    def model_http_timeouts(self) -> Dict[str, float]:
+        """各提供商的读写超时（秒）"""
+        return _parse_float_mapping(self.model_http_timeouts_raw)
+
+    # Hierarchical Retrieval - 文档级索引与两阶段检索
+    document_index_enabled: bool = True  # 写入分块时同步维护文档级向量（分块向量均值）
+    hierarchical_search_enabled: bool = False  # 先检索文档级索引，再只在候选文档的分块中检索
+    hierarchical_top_documents: int = 20  # 第一阶段选出的候选文档数
+
+    # Embedding Cache - 查询向量缓存
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 4096  # 进程内 LRU 条数
+    embedding_cache_ttl_seconds: int = 604800  # 7 天
+
+    # Answer Cache - 语义答案缓存（按部门隔离）
+    answer_cache_enabled: bool = True
+    answer_cache_similarity_threshold: float = 0.95  # 问题向量余弦相似度阈值
+    answer_cache_ttl_seconds: int = 3600
+    answer_cache_max_entries: int = 256  # 每个部门的最大缓存条数（LRU 淘汰）
+    answer_cache_redis_scan_entries: int = 32  # 进程内未命中时从 Redis 取回比对的最近使用条数
+
+    # Hybrid Retrieval - 词法 + 向量混合检索（RRF 融合）
+    hybrid_search_enabled: bool = True
+    hybrid_vector_k: int = 10  # 向量检索召回条数（不少于 top_k）
+    hybrid_lexical_k: int = 10  # 词法检索召回条数（不少于 top_k）
+    hybrid_vector_weight: float = 1.0
+    hybrid_lexical_weight: float = 1.0
+    hybrid_rrf_k: int = 60
+    hybrid_lexical_timeout_ms: int = 150  # 词法检索延迟预算，超时仅使用向量结果
+
+    # Retrieval Carry-over - 会话追问复用上一轮的检索结果
+    retrieval_carryover_enabled: bool = True
+    retrieval_carryover_reuse_similarity: float = 0.9  # 问题向量相似度不低于该值时直接复用，不做检索
+    retrieval_carryover_augment_similarity: float = 0.75  # 不低于该值时复用并补充一次小规模向量检索
+    retrieval_carryover_augment_k: int = 3  # 补充检索的条数
+    retrieval_carryover_ttl_seconds: int = 3600
+
+    # Context Packing - 上下文打包
+    context_max_tokens: int = 3000  # 检索上下文的 token 预算
+    context_compression_enabled: bool = False  # 抽取与问题相关的句子（需要一次句子批量向量化）
+    context_compression_max_tokens: int = 1200  # 压缩后句子的 token 预算，原文未超出时不压缩
+    context_compression_neighbors: int = 1  # 入选句子前后各保留的相邻句子数
+
+    # Conversation History - 对话历史窗口
+    history_recent_turns: int = 3  # 原文保留的最近轮数（一问一答为一轮）
+    history_max_tokens: int = 1000  # 原文历史的 token 预算
+    history_summary_enabled: bool = True  # 早先消息折叠为滚动摘要
+    history_summary_max_tokens: int = 300
+    history_summary_ttl_seconds: int = 86400
+
+    # Relevance - 检索相关度阈值与无上下文快速返回
+    relevance_threshold_default: float = 0.3  # 向量检索余弦相似度阈值，低于阈值的分块不进入上下文
+    relevance_thresholds_raw: str = ""  # 按向量模型覆盖阈值，如 text-embedding-3-small=0.3,embedding-3=0.4
+    no_context_fast_path_enabled: bool = True  # 没有相关分块时直接返回模板答案，不调用 LLM
+    no_context_suggestions: int = 3  # 快速返回时推荐的相近文档数
+
+    @property
+    def relevance_threshold(self) -> float:
+        """当前向量模型的相关度阈值
+
+        不同向量模型的相似度分布差异很大，阈值按模型配置
+        """
+        model = self.get_embedding_config()["model"].lower()
+        return _parse_float_mapping(self.relevance_thresholds_raw).get(
+            model, self.relevance_threshold_default
+        )
+
+    # Intent Router - 闲聊意图路由（寒暄、致谢、询问能力直接固定回答，不做检索）
+    intent_router_enabled: bool = True
+
+    # Hedged LLM - 对冲生成（主模型首 token 超时后向备用模型发出同一请求）
+    llm_hedge_enabled: bool = False
+    llm_hedge_model: str = ""  # 备用模型，为空时与 llm_model 相同
+    llm_hedge_base_url: str = ""  # 备用端点，为空时与 openai_base_url 相同
+    llm_hedge_api_key: str = ""  # 为空时使用 openai_api_key
+    llm_hedge_percentile: float = 0.95  # 截止时间取主模型首 token 延迟的分位数
+    llm_hedge_min_deadline_ms: int = 500
+    llm_hedge_max_deadline_ms: int = 5000  # 样本不足时使用
+    llm_hedge_min_samples: int = 20
+
+    # Single-flight - 相同的并发请求合并为一次计算
+    single_flight_enabled: bool = True
+
+    # Batch Query - 批量查询
+    query_batch_max_size: int = 200  # 单次请求的最大问题数
+    query_batch_concurrency: int = 8  # 批量查询中并发的 LLM 调用数
+
+    # Admission Control - 查询准入控制（按部门加权、按用户限制并发）
+    admission_enabled: bool = True
+    admission_department_concurrency: int = 16  # 权重为 1 的部门的并发查询上限
+    admission_department_weights_raw: str = ""  # 按部门 ID 的并发权重，如 1=2,7=0.5
+    admission_user_concurrency: int = 4  # 每个用户的并发查询上限
+    admission_queue_size: int = 32  # 每个部门等待队列的容量，满后直接返回 429
+    admission_queue_timeout_ms: int = 10000  # 排队截止时间，预计或实际超时返回 429
+
+    @property
+    def admission_department_weights(self) -> Dict[str, float]:
+        return _parse_float_mapping(self.admission_department_weights_raw)
+
+    # Client Disconnect - 客户端断开后取消进行中的检索与生成
+    query_disconnect_poll_ms: int = 200  # 非流式查询检测客户端断开的轮询间隔
+
     # JWT
     jwt_secret_key: str = "your-secret-key"
     jwt_algorithm: str = "HS256"
@@ -0,0 +1,194 @@
+"""
+进程内运行指标
+
+轻量的计数器 / 仪表 / 直方图注册表，通过 /api/v1/health/metrics 以 JSON 形式暴露。
+指标按进程统计，多 worker 部署时由采集端按实例汇总。
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# 默认延迟分桶（毫秒），覆盖缓存命中的亚毫秒级到 LLM 生成的数十秒
+DEFAULT_LATENCY_BUCKETS_MS = (
+    1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000,
+)
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_name(key: LabelKey) -> str:
+    return ",".join(f"{k}={v}" for k, v in key)
+
+
+class Counter:
+    """单调递增计数器，支持标签"""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {_label_name(k): v for k, v in self._values.items()}
+
+
+class Gauge:
+    """可增可减的瞬时值（如队列深度），支持标签"""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {_label_name(k): v for k, v in self._values.items()}
+
+
+class Histogram:
+    """分桶直方图，支持标签
+
+    每个标签组合记录各桶的计数、总次数和总和，快照中附带按桶上界估算的分位数
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS,
+    ):
+        self.name = name
+        self.description = description
+        self.buckets: List[float] = sorted(buckets)
+        # 标签 → [各桶计数（最后一个为 +Inf）, 次数, 总和]
+        self._values: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0, 0.0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_label_key(labels))
+        return entry[1] if entry else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """按桶上界估算分位数，落在 +Inf 桶时返回最大桶上界"""
+        with self._lock:
+            entry = self._values.get(_label_key(labels))
+            if not entry or not entry[1]:
+                return None
+            counts, total = list(entry[0]), entry[1]
+        return self._quantile(counts, total, q)
+
+    def _quantile(self, counts: List[int], total: int, q: float) -> float:
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return self.buckets[min(i, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+
+        result = {}
+        for key, counts, total, value_sum in items:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            result[_label_name(key)] = {
+                "count": total,
+                "sum": round(value_sum, 2),
+                "buckets": buckets,
+                "p50": self._quantile(counts, total, 0.5),
+                "p95": self._quantile(counts, total, 0.95),
+                "p99": self._quantile(counts, total, 0.99),
+            }
+        return result
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, description: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, description, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(
+        self,
+        name: str,
+        description: str = "",
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """所有指标的当前值"""
+        return {
+            name: {
+                "type": type(metric).__name__.lower(),
+                "description": metric.description,
+                "values": metric.snapshot(),
+            }
+            for name, metric in sorted(self._metrics.items())
+        }
+
+
+# 全局实例
+metrics = MetricsRegistry()
@@ -0,0 +1,181 @@
+"""
+模型客户端注册表 - 查询链路与文档入库共享的 HTTP 连接池
+
+每个提供商一个 httpx.AsyncClient（keep-alive 连接池），OpenAI SDK 客户端和
+LangChain ChatOpenAI 都通过它发出请求：
+- 查询与入库复用同一批 TCP/TLS 连接，不再各自建连
+- 连接池上限、空闲连接保留时间和各提供商的超时统一由配置控制
+- 同一 (提供商, base_url, api_key) 只创建一个 AsyncOpenAI 客户端
+
+httpx 连接绑定创建它的事件循环。Celery 任务每次 asyncio.run 都会新建事件循环，
+因此连接池按事件循环分开：客户端对象全进程共享，实际的连接按当前运行的事件循环各自持有。
+"""
+import asyncio
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+from loguru import logger
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+
+# LLM 调用使用的连接池名称
+LLM_POOL = "llm"
+LLM_HEDGE_POOL = "llm_hedge"
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """按事件循环分配连接池的传输层
+
+    每个事件循环第一次发请求时创建自己的 AsyncHTTPTransport，之后在该循环内复用 keep-alive 连接；
+    事件循环被回收后对应的连接池随之释放，不会把已关闭循环上的连接交给新的循环
+    """
+
+    def __init__(self, limits: httpx.Limits):
+        self.limits = limits
+        self._transports = weakref.WeakKeyDictionary()  # 事件循环 → 连接池
+
+    def current(self) -> httpx.AsyncHTTPTransport:
+        """当前事件循环的连接池"""
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=self.limits)
+            self._transports[loop] = transport
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.current().handle_async_request(request)
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池，其他事件循环上的连接无法在此关闭，直接丢弃"""
+        transport = self._transports.get(asyncio.get_running_loop())
+        self._transports.clear()
+        if transport is not None:
+            await transport.aclose()
+
+
+class ModelClientRegistry:
+    """按提供商管理共享连接池和模型客户端"""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        default_timeout: float = 60.0,
+        timeouts: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            max_connections: 每个连接池的最大连接数
+            max_keepalive_connections: 每个连接池保留的最大空闲连接数
+            keepalive_expiry: 空闲连接保留秒数
+            connect_timeout: 建连超时（秒）
+            default_timeout: 未单独配置的提供商的读写超时（秒）
+            timeouts: 提供商 → 读写超时（秒）
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._openai_clients: Dict[Tuple[str, str, str], AsyncOpenAI] = {}
+
+    def timeout_for(self, provider: str) -> httpx.Timeout:
+        """提供商的请求超时"""
+        return httpx.Timeout(
+            self.timeouts.get(provider, self.default_timeout),
+            connect=self.connect_timeout,
+        )
+
+    def http_client(self, provider: str) -> httpx.AsyncClient:
+        """提供商共享的 keep-alive 连接池（连接按事件循环分开）"""
+        client = self._http_clients.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                transport=LoopLocalTransport(self.limits),
+                timeout=self.timeout_for(provider),
+            )
+            self._http_clients[provider] = client
+            logger.info(
+                f"创建模型连接池 | 提供商: {provider} | "
+                f"最大连接: {self.limits.max_connections} | "
+                f"超时: {self.timeouts.get(provider, self.default_timeout)}s"
+            )
+        return client
+
+    def openai_client(
+        self,
+        provider: str,
+        api_key: str,
+        base_url: str,
+        max_retries: int = 0,
+    ) -> AsyncOpenAI:
+        """共享连接池上的 AsyncOpenAI 客户端
+
+        默认不在 SDK 内部重试，重试由调用方（如 EmbeddingService）控制
+        """
+        key = (provider, base_url, api_key)
+        client = self._openai_clients.get(key)
+        if client is None or client.is_closed():
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=self.http_client(provider),
+                timeout=self.timeout_for(provider),
+                max_retries=max_retries,
+            )
+            self._openai_clients[key] = client
+        return client
+
+    def chat_model(
+        self,
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        pool: str = LLM_POOL,
+    ) -> ChatOpenAI:
+        """共享连接池的 ChatOpenAI
+
+        Args:
+            model: 模型名称，默认 settings.llm_model
+            temperature: 采样温度
+            base_url: API 基础 URL，默认 settings.openai_base_url
+            api_key: API 密钥，默认 settings.openai_api_key
+            pool: 使用的连接池（及超时配置）名称
+        """
+        return ChatOpenAI(
+            model=model or settings.llm_model,
+            openai_api_key=api_key or settings.openai_api_key,
+            openai_api_base=base_url or settings.openai_base_url,
+            temperature=temperature,
+            http_async_client=self.http_client(pool),
+            timeout=self.timeout_for(pool),
+        )
+
+    async def aclose(self):
+        """关闭所有连接池"""
+        for client in self._http_clients.values():
+            await client.aclose()
+        self._http_clients.clear()
+        self._openai_clients.clear()
+
+
+# 全局实例
+model_clients = ModelClientRegistry(
+    max_connections=settings.model_http_max_connections,
+    max_keepalive_connections=settings.model_http_max_keepalive_connections,
+    keepalive_expiry=settings.model_http_keepalive_expiry,
+    connect_timeout=settings.model_http_connect_timeout,
+    default_timeout=settings.model_http_timeout,
+    timeouts=settings.model_http_timeouts,
+)
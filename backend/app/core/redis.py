@@ -0,0 +1,91 @@
+"""
+Redis 连接管理
+"""
+import asyncio
+import time
+import weakref
+from typing import Callable, Optional
+import redis.asyncio as aioredis
+from loguru import logger
+
+from app.core.config import settings
+
+
+class LoopLocalRedis:
+    """按事件循环分配底层客户端的异步 Redis 代理
+
+    redis.asyncio 的连接绑定创建它的事件循环。Celery 任务每次 asyncio.run 都会新建事件循环，
+    进程内共享一个客户端会复用已关闭循环上的连接。代理对象全进程共享，每个事件循环各自创建客户端，
+    事件循环被回收后对应的客户端随之释放
+    """
+
+    def __init__(self, factory: Callable[[], aioredis.Redis]):
+        self._factory = factory
+        self._clients = weakref.WeakKeyDictionary()  # 事件循环 → 客户端
+        self._default: Optional[aioredis.Redis] = None
+
+    def current(self) -> aioredis.Redis:
+        """当前事件循环的客户端（不在事件循环中时返回一个共用的客户端）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self._default is None:
+                self._default = self._factory()
+            return self._default
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._factory()
+            self._clients[loop] = client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+_redis_client: Optional[LoopLocalRedis] = None
+
+
+def get_redis() -> LoopLocalRedis:
+    """获取共享的异步 Redis 客户端（懒加载，进程内单例，连接按事件循环分开）
+
+    客户端创建时不会建立连接，Redis 不可用时由调用方自行降级处理
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = LoopLocalRedis(
+            lambda: aioredis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                password=settings.redis_password or None,
+                db=settings.redis_db,
+                socket_timeout=settings.redis_socket_timeout,
+                socket_connect_timeout=settings.redis_socket_timeout,
+            )
+        )
+    return _redis_client
+
+
+class RedisCircuitBreaker:
+    """Redis 故障熔断器
+
+    缓存类功能在 Redis 故障时降级为仅进程内缓存。失败后的冷却期内直接跳过 Redis，
+    避免每个请求都等待一次连接超时
+    """
+
+    def __init__(self, name: str, cooldown_seconds: float = 30.0):
+        self.name = name
+        self.cooldown_seconds = cooldown_seconds
+        self._open_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        """当前是否允许访问 Redis"""
+        return time.monotonic() >= self._open_until
+
+    def record_failure(self, error: Exception):
+        """记录一次失败并进入冷却期"""
+        if self.available:
+            logger.warning(
+                f"{self.name} Redis 访问失败，{self.cooldown_seconds:.0f}秒内降级为进程内缓存: {error}"
+            )
+        self._open_until = time.monotonic() + self.cooldown_seconds
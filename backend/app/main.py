@@ -70,6 +70,10 @@ async def lifespan(app: FastAPI):
 
     # 关闭时执行
     logger.info("👋 应用关闭中...")
+    from app.core.model_clients import model_clients
+    await model_clients.aclose()
+    from app.services.vector_store import vector_store
+    vector_store.shutdown()
 
 
 # 创建 FastAPI 应用
@@ -2,10 +2,11 @@
 用户和部门模型
 """
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, Text, func
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
+from app.utils.lexical import build_search_tokens
 
 
 def get_utc_now():
@@ -13,6 +14,11 @@ def get_utc_now():
     return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
+def get_chunk_search_tokens(context):
+    """根据分块内容生成词法检索词元（插入分块时自动填充）"""
+    return build_search_tokens(context.get_current_parameters().get("content") or "")
+
+
 class Department(Base):
     """部门表"""
     __tablename__ = "departments"
@@ -109,11 +115,22 @@ class DocumentChunk(Base):
     page_number = Column(Integer, nullable=True)
     chunk_metadata = Column(Text, nullable=True)  # JSON string
 
+    # 词法检索词元（中文二元组 + 英文/数字词，空格分隔）
+    search_tokens = Column(Text, nullable=True, default=get_chunk_search_tokens)
+
     created_at = Column(DateTime, default=get_utc_now)
 
     # 关系
     document = relationship("Document")
 
+    __table_args__ = (
+        Index(
+            "ix_document_chunks_search_tokens",
+            func.array_to_tsvector(func.string_to_array(search_tokens, " ")),
+            postgresql_using="gin",
+        ),
+    )
+
 
 class Conversation(Base):
     """对话会话表"""
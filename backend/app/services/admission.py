@@ -0,0 +1,225 @@
+"""
+查询准入控制 - 按部门和用户限制并发查询
+
+单个部门用脚本批量调用 /query/ 会占满 LLM 配额、拖慢其他部门。准入控制位于 RAGService 之前：
+- 每个部门的并发上限为 基础并发 × 部门权重，每个用户另有并发上限
+- 超出上限的请求进入该部门的有界等待队列（FIFO，跳过已达用户上限的请求）
+- 按近期查询耗时估算排队时间，预计超过排队截止时间的请求直接拒绝；排队超时同样拒绝
+- 队列已满时立即拒绝，拒绝时给出建议的重试间隔（秒），接口层转为 429 + Retry-After
+
+队列深度、排队耗时和拒绝数记入指标。
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+queue_depth = metrics.gauge("admission_queue_depth", "准入等待队列深度（按部门）")
+in_flight = metrics.gauge("admission_in_flight", "已准入、执行中的查询数（按部门）")
+queue_wait = metrics.histogram("admission_wait_ms", "准入排队耗时（毫秒，按部门）")
+rejected_requests = metrics.counter(
+    "admission_rejected_total", "被准入控制拒绝的查询数（按部门和原因）"
+)
+
+# 查询耗时滑动平均的平滑系数
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """查询被准入控制拒绝"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"查询繁忙（{reason}），请 {retry_after} 秒后重试")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """等待准入的请求"""
+
+    def __init__(self, user_id: Any):
+        self.user_id = user_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+
+
+class AdmissionTicket:
+    """一次准入，release() 可重复调用"""
+
+    def __init__(self, controller: "AdmissionController", department_id: int, user_id: Any):
+        self._controller = controller
+        self.department_id = department_id
+        self.user_id = user_id
+        self.admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """按部门加权、按用户限制并发的准入控制"""
+
+    def __init__(
+        self,
+        department_concurrency: int = 16,
+        user_concurrency: int = 4,
+        queue_size: int = 32,
+        queue_timeout_ms: float = 10000,
+        department_weights: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            department_concurrency: 权重为 1 的部门的并发上限
+            user_concurrency: 每个用户的并发上限
+            queue_size: 每个部门等待队列的容量
+            queue_timeout_ms: 排队截止时间（毫秒）
+            department_weights: 部门 ID（字符串）→ 并发权重，未配置的部门权重为 1
+        """
+        self.department_concurrency = department_concurrency
+        self.user_concurrency = user_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout_ms = queue_timeout_ms
+        self.department_weights = department_weights or {}
+        self._running: Dict[int, int] = {}
+        self._user_running: Dict[Any, int] = {}
+        self._queues: Dict[int, Deque[_Waiter]] = {}
+        self._service_ms: Dict[int, float] = {}  # 各部门查询耗时的滑动平均
+
+    def department_limit(self, department_id: int) -> int:
+        weight = self.department_weights.get(str(department_id), 1.0)
+        return max(1, round(self.department_concurrency * weight))
+
+    @asynccontextmanager
+    async def slot(self, department_id: int, user_id: Any):
+        """在准入额度内执行，退出时释放额度"""
+        ticket = await self.acquire(department_id, user_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def acquire(self, department_id: int, user_id: Any) -> AdmissionTicket:
+        """获取准入额度，需要排队时等待；被拒绝时抛出 AdmissionRejected"""
+        queue = self._queues.setdefault(department_id, deque())
+        # 部门有空闲额度时，队列中剩下的只可能是已达用户上限的请求，直接准入不会插队
+        if self._has_capacity(department_id, user_id):
+            queue_wait.observe(0, department=department_id)
+            return self._admit(department_id, user_id)
+
+        if len(queue) >= self.queue_size:
+            self._reject(department_id, "queue_full")
+        if self._expected_wait_ms(department_id, len(queue) + 1) > self.queue_timeout_ms:
+            # 按当前队列长度注定等不到准入，提前拒绝，不占用队列位置
+            self._reject(department_id, "deadline")
+
+        waiter = _Waiter(user_id)
+        queue.append(waiter)
+        queue_depth.inc(department=department_id)
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.queue_timeout_ms / 1000)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已获准入但调用方放弃，归还额度
+                waiter.future.result().release()
+            else:
+                self._dequeue(department_id, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(department_id, "timeout")
+            raise
+        return waiter.future.result()
+
+    def try_acquire(self, department_id: int, user_id: Any) -> Optional[AdmissionTicket]:
+        """有空闲额度时立即准入，否则返回 None（不排队、不计入拒绝）"""
+        if not self._has_capacity(department_id, user_id):
+            return None
+        return self._admit(department_id, user_id)
+
+    def _has_capacity(self, department_id: int, user_id: Any) -> bool:
+        return (
+            self._running.get(department_id, 0) < self.department_limit(department_id)
+            and self._user_running.get(user_id, 0) < self.user_concurrency
+        )
+
+    def _admit(self, department_id: int, user_id: Any) -> AdmissionTicket:
+        self._running[department_id] = self._running.get(department_id, 0) + 1
+        self._user_running[user_id] = self._user_running.get(user_id, 0) + 1
+        in_flight.inc(department=department_id)
+        return AdmissionTicket(self, department_id, user_id)
+
+    def _release(self, ticket: AdmissionTicket):
+        department_id, user_id = ticket.department_id, ticket.user_id
+        self._running[department_id] -= 1
+        self._user_running[user_id] -= 1
+        if not self._user_running[user_id]:
+            del self._user_running[user_id]
+        in_flight.dec(department=department_id)
+
+        elapsed_ms = (time.perf_counter() - ticket.admitted_at) * 1000
+        average = self._service_ms.get(department_id)
+        self._service_ms[department_id] = (
+            elapsed_ms if average is None
+            else average + _SERVICE_TIME_ALPHA * (elapsed_ms - average)
+        )
+        self._dispatch(department_id)
+
+    def _dispatch(self, department_id: int):
+        """按 FIFO 准入等待中的请求，跳过已达用户并发上限的请求"""
+        queue = self._queues.get(department_id)
+        # 已超时或被取消、但调用方尚未出队的请求不能再准入，否则 set_result 报错且额度泄漏
+        for waiter in [w for w in queue or () if w.future.done()]:
+            self._dequeue(department_id, waiter)
+        while queue and self._running.get(department_id, 0) < self.department_limit(department_id):
+            waiter = next(
+                (w for w in queue if self._user_running.get(w.user_id, 0) < self.user_concurrency),
+                None,
+            )
+            if waiter is None:
+                break
+            self._dequeue(department_id, waiter)
+            queue_wait.observe(
+                round((time.perf_counter() - waiter.enqueued_at) * 1000, 2),
+                department=department_id,
+            )
+            waiter.future.set_result(self._admit(department_id, waiter.user_id))
+
+    def _dequeue(self, department_id: int, waiter: _Waiter):
+        queue = self._queues.get(department_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            queue_depth.dec(department=department_id)
+
+    def _expected_wait_ms(self, department_id: int, position: int) -> float:
+        """排在第 position 位的请求的预计等待时间，没有耗时样本时为 0"""
+        average = self._service_ms.get(department_id)
+        if average is None:
+            return 0.0
+        return average * math.ceil(position / self.department_limit(department_id))
+
+    def _reject(self, department_id: int, reason: str):
+        queue = self._queues.get(department_id) or ()
+        expected_ms = self._expected_wait_ms(department_id, len(queue) + 1)
+        retry_after = max(1, math.ceil(expected_ms / 1000))
+        rejected_requests.inc(department=department_id, reason=reason)
+        logger.warning(f"⚠️  部门 {department_id} 查询被准入控制拒绝（{reason}），{retry_after}s 后可重试")
+        raise AdmissionRejected(reason, retry_after)
+
+
+# 全局实例
+admission_controller = AdmissionController(
+    department_concurrency=settings.admission_department_concurrency,
+    user_concurrency=settings.admission_user_concurrency,
+    queue_size=settings.admission_queue_size,
+    queue_timeout_ms=settings.admission_queue_timeout_ms,
+    department_weights=settings.admission_department_weights,
+)
@@ -0,0 +1,317 @@
+"""
+语义答案缓存
+
+按 (部门, top_k) 缓存历史问答。新问题向量与已缓存问题向量的余弦相似度超过阈值时，
+直接复用缓存的答案和来源，跳过向量检索和 LLM 调用。
+
+两级结构：
+- 进程内 LRU：每个 uvicorn worker 独享，命中无网络开销
+- Redis 共享层：所有 worker 共用，按 LRU 有序集合限制条数，按 TTL 过期。
+  查找时只取最近使用的 redis_scan_entries 条向量比对，单次查询的传输量与总条数无关
+
+失效策略：每个部门在 Redis 中维护一个版本号，部门向量写入或删除时递增版本号，
+旧版本的缓存键不再被读取并随 TTL 自然过期；进程内缓存在发现版本变化时整体清空。
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis import RedisCircuitBreaker, get_redis
+
+KEY_PREFIX = "askit:answer_cache"
+
+
+@dataclass
+class CachedAnswer:
+    """缓存的问答条目"""
+
+    question: str
+    vector: np.ndarray                    # 已归一化的 float32 问题向量
+    answer: str
+    sources: List[Dict[str, Any]]
+    created_at: float
+    similarity: float = 1.0               # 命中时与新问题的相似度
+
+
+def normalize_vector(vector) -> np.ndarray:
+    """转换为 float32 并做 L2 归一化，之后的点积即余弦相似度"""
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm > 0 else arr
+
+
+def question_key(question: str) -> str:
+    """问题文本的规范化哈希（忽略大小写和多余空白），同一问题重复写入时覆盖旧条目"""
+    normalized = " ".join(question.split()).lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """按部门隔离的语义答案缓存"""
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: int = 3600,
+        max_entries: int = 256,
+        redis_scan_entries: int = 32,
+        redis_client=None,
+    ):
+        """
+        Args:
+            similarity_threshold: 命中所需的最小余弦相似度
+            ttl_seconds: 缓存条目有效期（秒）
+            max_entries: 每个 (部门, top_k) 范围内的最大条数
+            redis_scan_entries: 进程内未命中时从 Redis 取回比对的最近使用条数
+            redis_client: 异步 Redis 客户端，为 None 时仅使用进程内缓存
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis_scan_entries = redis_scan_entries
+        self.redis = redis_client
+        self._breaker = RedisCircuitBreaker("答案缓存")
+        self._local: Dict[Tuple[int, int], "OrderedDict[str, CachedAnswer]"] = {}
+        self._versions: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def lookup(
+        self,
+        department_id: int,
+        top_k: int,
+        vector: List[float],
+    ) -> Optional[CachedAnswer]:
+        """查找与问题向量足够相似的缓存答案"""
+        query = normalize_vector(vector)
+        version = await self._sync_version(department_id)
+
+        entry = self._lookup_local(department_id, top_k, query)
+        if entry is None:
+            entry = await self._lookup_redis(department_id, top_k, version, query)
+            if entry is not None:
+                self._put_local(department_id, top_k, question_key(entry.question), entry)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def store(
+        self,
+        department_id: int,
+        top_k: int,
+        question: str,
+        vector: List[float],
+        answer: str,
+        sources: List[Dict[str, Any]],
+    ):
+        """写入一条问答"""
+        entry = CachedAnswer(
+            question=question,
+            vector=normalize_vector(vector),
+            answer=answer,
+            sources=sources,
+            created_at=time.time(),
+        )
+        key = question_key(question)
+        version = await self._sync_version(department_id)
+        self._put_local(department_id, top_k, key, entry)
+        await self._store_redis(department_id, top_k, version, key, entry)
+
+    async def invalidate_department(self, department_id: int):
+        """使部门的全部缓存失效（部门向量写入或删除后调用）"""
+        for scope in [s for s in self._local if s[0] == department_id]:
+            del self._local[scope]
+        self._versions[department_id] = self._versions.get(department_id, 0) + 1
+
+        if self.redis is not None and self._breaker.available:
+            try:
+                self._versions[department_id] = await self.redis.incr(
+                    self._version_key(department_id)
+                )
+            except Exception as e:
+                self._breaker.record_failure(e)
+        logger.info(f"答案缓存已失效 | 部门: {department_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "local_entries": sum(len(entries) for entries in self._local.values()),
+        }
+
+    # ------------------------------------------------------------------
+    # 进程内 LRU
+    # ------------------------------------------------------------------
+
+    def _lookup_local(
+        self,
+        department_id: int,
+        top_k: int,
+        query: np.ndarray,
+    ) -> Optional[CachedAnswer]:
+        entries = self._local.get((department_id, top_k))
+        if not entries:
+            return None
+
+        now = time.time()
+        for key in [k for k, e in entries.items() if now - e.created_at > self.ttl_seconds]:
+            del entries[key]
+        if not entries:
+            return None
+
+        keys = list(entries.keys())
+        matrix = np.stack([entries[k].vector for k in keys])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+
+        entries.move_to_end(keys[best])
+        entry = entries[keys[best]]
+        entry.similarity = float(scores[best])
+        return entry
+
+    def _put_local(self, department_id: int, top_k: int, key: str, entry: CachedAnswer):
+        entries = self._local.setdefault((department_id, top_k), OrderedDict())
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Redis 共享层
+    # ------------------------------------------------------------------
+
+    def _version_key(self, department_id: int) -> str:
+        return f"{KEY_PREFIX}:{department_id}:version"
+
+    def _scope_key(self, department_id: int, top_k: int, version: int) -> str:
+        return f"{KEY_PREFIX}:{department_id}:v{version}:k{top_k}"
+
+    async def _sync_version(self, department_id: int) -> int:
+        """读取部门版本号，版本变化时清空该部门的进程内缓存"""
+        version = self._versions.get(department_id, 0)
+        if self.redis is not None and self._breaker.available:
+            try:
+                raw = await self.redis.get(self._version_key(department_id))
+                version = int(raw) if raw is not None else 0
+            except Exception as e:
+                self._breaker.record_failure(e)
+
+        if self._versions.get(department_id, 0) != version:
+            for scope in [s for s in self._local if s[0] == department_id]:
+                del self._local[scope]
+            self._versions[department_id] = version
+        return version
+
+    async def _lookup_redis(
+        self,
+        department_id: int,
+        top_k: int,
+        version: int,
+        query: np.ndarray,
+    ) -> Optional[CachedAnswer]:
+        if self.redis is None or not self._breaker.available:
+            return None
+
+        scope = self._scope_key(department_id, top_k, version)
+        try:
+            # 只比对最近使用的若干条，避免每次取回整个向量哈希
+            recent = await self.redis.zrevrange(f"{scope}:lru", 0, self.redis_scan_entries - 1)
+            if not recent:
+                return None
+            raw_vectors = await self.redis.hmget(f"{scope}:vec", recent)
+            found = [(k, v) for k, v in zip(recent, raw_vectors) if v is not None]
+            if not found:
+                return None
+
+            keys = [k for k, _ in found]
+            matrix = np.stack([np.frombuffer(v, dtype=np.float32) for _, v in found])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+
+            raw_data = await self.redis.hget(f"{scope}:data", keys[best])
+            if raw_data is None:
+                return None
+            data = json.loads(raw_data)
+            if time.time() - data["created_at"] > self.ttl_seconds:
+                return None
+
+            await self.redis.zadd(f"{scope}:lru", {keys[best]: time.time()})
+        except Exception as e:
+            self._breaker.record_failure(e)
+            return None
+
+        return CachedAnswer(
+            question=data["question"],
+            vector=matrix[best],
+            answer=data["answer"],
+            sources=data["sources"],
+            created_at=data["created_at"],
+            similarity=float(scores[best]),
+        )
+
+    async def _store_redis(
+        self,
+        department_id: int,
+        top_k: int,
+        version: int,
+        key: str,
+        entry: CachedAnswer,
+    ):
+        if self.redis is None or not self._breaker.available:
+            return
+
+        scope = self._scope_key(department_id, top_k, version)
+        data = json.dumps(
+            {
+                "question": entry.question,
+                "answer": entry.answer,
+                "sources": entry.sources,
+                "created_at": entry.created_at,
+            },
+            ensure_ascii=False,
+        )
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(f"{scope}:vec", key, entry.vector.tobytes())
+                pipe.hset(f"{scope}:data", key, data)
+                pipe.zadd(f"{scope}:lru", {key: entry.created_at})
+                for suffix in ("vec", "data", "lru"):
+                    pipe.expire(f"{scope}:{suffix}", self.ttl_seconds)
+                pipe.zcard(f"{scope}:lru")
+                results = await pipe.execute()
+
+            overflow = results[-1] - self.max_entries
+            if overflow > 0:
+                evicted = [k for k, _ in await self.redis.zpopmin(f"{scope}:lru", overflow)]
+                if evicted:
+                    await self.redis.hdel(f"{scope}:vec", *evicted)
+                    await self.redis.hdel(f"{scope}:data", *evicted)
+        except Exception as e:
+            self._breaker.record_failure(e)
+
+
+# 全局实例
+answer_cache = AnswerCache(
+    similarity_threshold=settings.answer_cache_similarity_threshold,
+    ttl_seconds=settings.answer_cache_ttl_seconds,
+    max_entries=settings.answer_cache_max_entries,
+    redis_scan_entries=settings.answer_cache_redis_scan_entries,
+    redis_client=get_redis(),
+)
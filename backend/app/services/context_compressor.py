@@ -0,0 +1,182 @@
+"""
+上下文抽取式压缩 - 只保留与问题相关的句子
+
+DocumentChunker 的 500 字分块中常有大量与问题无关的句子。压缩流程（位于检索与上下文打包之间）：
+1. 将检索到的分块切分为句子，跨分块去重（重叠分块中的同一句只保留一份）
+2. 所有句子一次批量向量化，与问题向量做矩阵化的余弦相似度
+3. 按相似度从高到低选择句子，连同同一分块内的前后相邻句子，直到用完 token 预算
+4. 每个分块只保留选中的句子（按原文顺序，不连续处以省略号连接），没有句子入选的分块丢弃
+
+压缩后的分块内容与 start_pos/end_pos 不再对应，上下文打包时不会按位置合并。
+"""
+import re
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics
+from app.utils.tokens import estimate_tokens
+
+compression_ratio = metrics.histogram(
+    "rag_context_compression_ratio",
+    "上下文压缩后与压缩前的 token 比例",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+# 中文句末标点之后、英文句末标点加空白处、换行处切分
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？；!?;])|(?<=\.)\s+|\n+")
+_GAP = "……"
+
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+@dataclass
+class CompressedContext:
+    """压缩结果"""
+
+    results: List[Dict[str, Any]]
+    input_tokens: int = 0
+    output_tokens: int = 0
+    sentences: int = 0
+    kept_sentences: int = 0
+    skipped: bool = False                 # 原文已在预算内，未压缩
+
+    @property
+    def ratio(self) -> float:
+        return round(self.output_tokens / self.input_tokens, 3) if self.input_tokens else 1.0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """写入响应 timings 的统计项"""
+        return {
+            "compression_input_tokens": self.input_tokens,
+            "compression_output_tokens": self.output_tokens,
+            "compression_ratio": self.ratio,
+            "compression_sentences": self.sentences,
+            "compression_sentences_kept": self.kept_sentences,
+        }
+
+
+def split_sentences(text: str) -> List[str]:
+    """切分句子，保留句末标点"""
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+
+
+def _join(sentences: List[str]) -> str:
+    parts = []
+    for sentence in sentences:
+        if parts and parts[-1][-1:].isascii() and sentence[:1].isascii():
+            parts.append(" ")
+        parts.append(sentence)
+    return "".join(parts)
+
+
+class ContextCompressor:
+    """抽取式上下文压缩器"""
+
+    async def compress(
+        self,
+        search_results: List[Dict[str, Any]],
+        query_vector: List[float],
+        embed: Embedder,
+        max_tokens: int,
+        neighbors: int = 1,
+    ) -> CompressedContext:
+        """
+        压缩检索结果
+
+        Args:
+            search_results: 按相关度降序排列的检索结果
+            query_vector: 问题向量
+            embed: 批量向量化函数（句子列表 → 向量列表），与问题向量处于同一空间
+            max_tokens: 压缩后句子的 token 预算
+            neighbors: 每个入选句子前后各保留的相邻句子数
+
+        Returns:
+            CompressedContext: 压缩后的检索结果（新列表，不修改输入）及统计
+        """
+        # (分块序号, 句子) 列表，跨分块去重
+        sentences: List[Tuple[int, str]] = []
+        per_chunk: List[List[int]] = []
+        seen: Set[str] = set()
+        input_tokens = 0
+        for chunk_index, result in enumerate(search_results):
+            content = result.get("payload", {}).get("content", "")
+            input_tokens += estimate_tokens(content)
+            indexes = []
+            for sentence in split_sentences(content):
+                if sentence in seen:
+                    continue
+                seen.add(sentence)
+                indexes.append(len(sentences))
+                sentences.append((chunk_index, sentence))
+            per_chunk.append(indexes)
+
+        if input_tokens <= max_tokens or not sentences:
+            return CompressedContext(
+                results=search_results, input_tokens=input_tokens, output_tokens=input_tokens,
+                sentences=len(sentences), kept_sentences=len(sentences), skipped=True,
+            )
+
+        scores = self._score(query_vector, await embed([s for _, s in sentences]))
+        # 句子序号 → (分块序号, 在分块内的位置)
+        position = {
+            index: (chunk, i)
+            for chunk, indexes in enumerate(per_chunk)
+            for i, index in enumerate(indexes)
+        }
+
+        kept: Set[int] = set()
+        used_tokens = 0
+        for best in np.argsort(-scores, kind="stable"):
+            chunk, i = position[int(best)]
+            indexes = per_chunk[chunk]
+            window = indexes[max(0, i - neighbors): i + neighbors + 1]
+            added = [index for index in window if index not in kept]
+            cost = sum(estimate_tokens(sentences[index][1]) for index in added)
+            if used_tokens + cost > max_tokens:
+                if not kept:
+                    # 至少保留最相关的一句
+                    kept.add(int(best))
+                    used_tokens += estimate_tokens(sentences[int(best)][1])
+                continue
+            kept.update(added)
+            used_tokens += cost
+
+        results = []
+        for result, indexes in zip(search_results, per_chunk):
+            selected = [i for i in indexes if i in kept]
+            if not selected:
+                continue
+            pieces, run = [], []
+            for index in selected:
+                if run and index != run[-1] + 1:
+                    pieces.append(_join([sentences[i][1] for i in run]))
+                    run = []
+                run.append(index)
+            pieces.append(_join([sentences[i][1] for i in run]))
+            content = _GAP.join(pieces)
+            results.append({**result, "payload": {**result.get("payload", {}), "content": content}})
+
+        compressed = CompressedContext(
+            results=results,
+            input_tokens=input_tokens,
+            output_tokens=sum(estimate_tokens(r["payload"]["content"]) for r in results),
+            sentences=len(sentences),
+            kept_sentences=len(kept),
+        )
+        compression_ratio.observe(compressed.ratio)
+        return compressed
+
+    def _score(self, query_vector: List[float], vectors: List[List[float]]) -> np.ndarray:
+        """句子向量与问题向量的余弦相似度（矩阵运算）"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        norms[norms == 0] = 1.0
+        return matrix @ query / norms
+
+
+# 全局实例
+context_compressor = ContextCompressor()
@@ -0,0 +1,173 @@
+"""
+上下文打包 - 去重、合并重叠分块并按 token 预算填充
+
+DocumentChunker 使用 chunk_overlap 分块，同一文档的相邻分块会在提示词中重复出现重叠文本。
+打包流程：
+1. 丢弃内容完全相同的分块（保留排名靠前的一个）
+2. 同一文档内按 start_pos/end_pos 合并重叠或首尾相接的分块，重叠部分只保留一份
+3. 按检索排名（输入顺序）依次放入，直到用完 token 预算；放不下的块截断后结束
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.utils.tokens import estimate_tokens, truncate_to_tokens
+
+EMPTY_CONTEXT = "知识库中没有找到相关信息"
+
+
+@dataclass
+class _Block:
+    """合并后的连续文本块"""
+
+    document_id: Any
+    page_number: Optional[int]
+    filename: str
+    content: str
+    start_pos: Optional[int]
+    end_pos: Optional[int]
+    rank: int                             # 组成部分中最靠前的检索排名
+    chunk_count: int = 1
+
+
+@dataclass
+class PackedContext:
+    """打包结果"""
+
+    text: str
+    tokens: int = 0
+    input_chunks: int = 0
+    blocks: int = 0
+    duplicates_dropped: int = 0
+    chunks_merged: int = 0
+    truncated: bool = False
+    dropped_blocks: int = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """写入响应 timings 的统计项"""
+        return {
+            "context_tokens": self.tokens,
+            "context_chunks": self.input_chunks,
+            "context_blocks": self.blocks,
+            "context_duplicates_dropped": self.duplicates_dropped,
+            "context_chunks_merged": self.chunks_merged,
+        }
+
+
+class ContextPacker:
+    """上下文打包器"""
+
+    def pack(self, search_results: List[Dict[str, Any]], max_tokens: int) -> PackedContext:
+        """
+        将检索结果打包为提示词上下文
+
+        Args:
+            search_results: 按相关度降序排列的检索结果
+            max_tokens: 上下文 token 预算
+
+        Returns:
+            PackedContext: 上下文文本及统计
+        """
+        if not search_results:
+            return PackedContext(text=EMPTY_CONTEXT)
+
+        blocks, duplicates = self._deduplicate(search_results)
+        merged_blocks = self._merge_overlaps(blocks)
+        merged_blocks.sort(key=lambda b: b.rank)
+
+        parts = []
+        used_tokens = 0
+        truncated = False
+        dropped = 0
+        for i, block in enumerate(merged_blocks):
+            part = f"【{block.filename}】\n{block.content}"
+            # 块之间的 "\n\n" 分隔符约计 1 token
+            cost = estimate_tokens(part) + (1 if parts else 0)
+            if used_tokens + cost <= max_tokens:
+                parts.append(part)
+                used_tokens += cost
+                continue
+
+            remaining = max_tokens - used_tokens - estimate_tokens(f"【{block.filename}】\n") - 1
+            if remaining > 0:
+                part = f"【{block.filename}】\n{truncate_to_tokens(block.content, remaining)}"
+                parts.append(part)
+                used_tokens += estimate_tokens(part) + 1
+                truncated = True
+                dropped = len(merged_blocks) - i - 1
+            else:
+                dropped = len(merged_blocks) - i
+            break
+
+        return PackedContext(
+            text="\n\n".join(parts) if parts else EMPTY_CONTEXT,
+            tokens=used_tokens,
+            input_chunks=len(search_results),
+            blocks=len(parts),
+            duplicates_dropped=duplicates,
+            chunks_merged=len(blocks) - len(merged_blocks),
+            truncated=truncated,
+            dropped_blocks=dropped,
+        )
+
+    def _deduplicate(self, search_results: List[Dict[str, Any]]):
+        """去除内容完全相同的分块，返回 (块列表, 丢弃数量)"""
+        seen = set()
+        blocks = []
+        for rank, result in enumerate(search_results):
+            payload = result.get("payload", {})
+            content = payload.get("content", "")
+            key = content.strip()
+            if key in seen:
+                continue
+            seen.add(key)
+            blocks.append(_Block(
+                document_id=payload.get("document_id"),
+                page_number=payload.get("page_number"),
+                filename=payload.get("filename", ""),
+                content=content,
+                start_pos=payload.get("start_pos"),
+                end_pos=payload.get("end_pos"),
+                rank=rank,
+            ))
+        return blocks, len(search_results) - len(blocks)
+
+    def _merge_overlaps(self, blocks: List[_Block]) -> List[_Block]:
+        """合并同一文档（同一页）内位置重叠或首尾相接的块
+
+        只有内容长度与 end_pos - start_pos 一致的块才按位置拼接，其余原样保留
+        """
+        mergeable: Dict[Any, List[_Block]] = {}
+        result = []
+        for block in blocks:
+            if (
+                block.document_id is not None
+                and isinstance(block.start_pos, int)
+                and isinstance(block.end_pos, int)
+                and block.end_pos - block.start_pos == len(block.content)
+            ):
+                mergeable.setdefault((block.document_id, block.page_number), []).append(block)
+            else:
+                result.append(block)
+
+        for doc_blocks in mergeable.values():
+            doc_blocks.sort(key=lambda b: b.start_pos)
+            current = doc_blocks[0]
+            for block in doc_blocks[1:]:
+                if block.start_pos > current.end_pos:
+                    result.append(current)
+                    current = block
+                    continue
+                if block.end_pos > current.end_pos:
+                    overlap = current.end_pos - block.start_pos
+                    current.content += block.content[overlap:]
+                    current.end_pos = block.end_pos
+                current.rank = min(current.rank, block.rank)
+                current.chunk_count += block.chunk_count
+            result.append(current)
+
+        return result
+
+
+# 全局实例
+context_packer = ContextPacker()
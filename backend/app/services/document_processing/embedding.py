@@ -5,7 +5,7 @@ Embedding 服务模块
 通过 OpenAI SDK 的 base_url 参数实现提供商切换
 """
 import asyncio
-from typing import List
+from typing import List, Optional
 from loguru import logger
 
 try:
@@ -23,7 +23,10 @@ except ImportError:
 from .exceptions import EmbeddingAPIError
 
 
-def create_embedding_service_from_config(config: dict) -> "EmbeddingService":
+def create_embedding_service_from_config(
+    config: dict,
+    client: Optional["AsyncOpenAI"] = None,
+) -> "EmbeddingService":
     """从配置字典创建 EmbeddingService 实例
     
     这是一个工厂方法，用于从配置文件或 Settings 对象创建服务实例
@@ -35,6 +38,7 @@ def create_embedding_service_from_config(config: dict) -> "EmbeddingService":
             - api_key: API 密钥
             - base_url: API 基础 URL
             - expected_dimension: 预期向量维度（可选）
+        client: 指定的 AsyncOpenAI 客户端（可选，默认使用共享连接池）
             
     Returns:
         EmbeddingService: 配置好的服务实例
@@ -52,6 +56,7 @@ def create_embedding_service_from_config(config: dict) -> "EmbeddingService":
         api_key=config["api_key"],
         base_url=config["base_url"],
         expected_dimension=config.get("expected_dimension"),
+        client=client,
     )
 
 
@@ -75,6 +80,7 @@ class EmbeddingService:
         batch_size: int = 100,
         max_retries: int = 3,
         expected_dimension: int = None,
+        client: Optional["AsyncOpenAI"] = None,
     ):
         """初始化 Embedding 服务
         
@@ -86,6 +92,8 @@ class EmbeddingService:
             batch_size: 批处理大小（每批最多处理的文本数量）
             max_retries: 最大重试次数
             expected_dimension: 预期向量维度（用于验证）
+            client: 指定的 AsyncOpenAI 客户端，为空时从共享的模型客户端注册表获取
+                （与查询链路复用同一连接池）
         """
         self.provider = provider
         self.model = model
@@ -101,10 +109,11 @@ class EmbeddingService:
                 "需要安装 openai 包以使用 EmbeddingService。请运行: uv add openai"
             )
         
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-        )
+        if client is None:
+            # 延迟导入，文档处理模块本身不依赖应用配置即可导入
+            from app.core.model_clients import model_clients
+            client = model_clients.openai_client(provider, api_key, base_url)
+        self.client = client
         
         # 需求 3.11: 在日志中记录使用的提供商、模型名称和向量维度
         logger.info(
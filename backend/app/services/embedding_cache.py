@@ -0,0 +1,157 @@
+"""
+查询向量缓存
+
+以内容寻址的方式缓存 问题文本 → 向量：键由规范化文本、模型名称和向量维度共同哈希得到，
+更换模型或维度后旧缓存自然不再命中。
+
+两级结构：
+- 进程内 LRU：命中无网络开销
+- Redis 共享层：所有 uvicorn worker 共用，向量以 float32 字节存储并按 TTL 过期
+"""
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis import RedisCircuitBreaker, get_redis
+
+KEY_PREFIX = "askit:embedding_cache"
+
+cache_hits = metrics.counter("embedding_cache_hits_total", "查询向量缓存命中次数（按缓存层）")
+cache_misses = metrics.counter("embedding_cache_misses_total", "查询向量缓存未命中次数")
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：Unicode NFKC（全角转半角等）并压缩空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """问题文本 → 向量 的两级缓存"""
+
+    def __init__(
+        self,
+        model: str,
+        dimension: int,
+        max_entries: int = 4096,
+        ttl_seconds: int = 7 * 24 * 3600,
+        redis_client=None,
+    ):
+        """
+        Args:
+            model: Embedding 模型名称（参与缓存键计算）
+            dimension: 向量维度（参与缓存键计算）
+            max_entries: 进程内缓存的最大条数
+            ttl_seconds: 缓存有效期（秒）
+            redis_client: 异步 Redis 客户端，为 None 时仅使用进程内缓存
+        """
+        self.model = model
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self._breaker = RedisCircuitBreaker("向量缓存")
+        self._local: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+
+    def cache_key(self, text: str) -> str:
+        """计算内容寻址的缓存键"""
+        raw = f"{self.model}\x00{self.dimension}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        """读取单个文本的向量"""
+        return (await self.get_many([text]))[0]
+
+    async def set(self, text: str, vector: List[float]):
+        """写入单个文本的向量"""
+        await self.set_many([text], [vector])
+
+    async def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """批量读取，未命中的位置为 None"""
+        keys = [self.cache_key(t) for t in texts]
+        results: List[Optional[List[float]]] = [self._get_local(k) for k in keys]
+        cache_hits.inc(sum(r is not None for r in results), tier="local")
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing and self.redis is not None and self._breaker.available:
+            try:
+                raw_values = await self.redis.mget([f"{KEY_PREFIX}:{keys[i]}" for i in missing])
+            except Exception as e:
+                self._breaker.record_failure(e)
+                raw_values = [None] * len(missing)
+
+            for i, raw in zip(missing, raw_values):
+                if raw is None:
+                    continue
+                vector = np.frombuffer(raw, dtype=np.float32).tolist()
+                self._put_local(keys[i], vector)
+                results[i] = vector
+                cache_hits.inc(tier="redis")
+
+        cache_misses.inc(sum(r is None for r in results))
+        return results
+
+    async def set_many(self, texts: List[str], vectors: List[List[float]]):
+        """批量写入"""
+        keys = [self.cache_key(t) for t in texts]
+        for key, vector in zip(keys, vectors):
+            self._put_local(key, vector)
+
+        if self.redis is None or not self._breaker.available:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, vector in zip(keys, vectors):
+                    pipe.set(
+                        f"{KEY_PREFIX}:{key}",
+                        np.asarray(vector, dtype=np.float32).tobytes(),
+                        ex=self.ttl_seconds,
+                    )
+                await pipe.execute()
+        except Exception as e:
+            self._breaker.record_failure(e)
+
+    def stats(self) -> Dict[str, float]:
+        """命中统计"""
+        hits = cache_hits.value(tier="local") + cache_hits.value(tier="redis")
+        misses = cache_misses.value()
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "local_entries": len(self._local),
+        }
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        created_at, vector = item
+        if time.time() - created_at > self.ttl_seconds:
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return vector
+
+    def _put_local(self, key: str, vector: List[float]):
+        self._local[key] = (time.time(), vector)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+# 全局实例
+_embedding_config = settings.get_embedding_config()
+embedding_cache = EmbeddingCache(
+    model=f"{_embedding_config['provider']}/{_embedding_config['model']}",
+    dimension=_embedding_config["expected_dimension"],
+    max_entries=settings.embedding_cache_max_entries,
+    ttl_seconds=settings.embedding_cache_ttl_seconds,
+    redis_client=get_redis(),
+)
@@ -0,0 +1,508 @@
+"""
+进程内精确向量检索后端 - NumPy 平铺索引 + 内存映射持久化
+
+中小规模部门和测试场景下，对连续 float32 矩阵做暴力检索比访问一次 Chroma Cloud 更快，且结果精确。
+实现 VectorStore 用到的 Chroma 客户端/集合接口子集（get/create/list/delete_collection，
+add/upsert/get/query/delete/count），通过 CHROMA_MODE=flat 启用：
+- 每个集合按 department_id 分片，每个分片是一个内存映射的 vectors.npy 和一个追加写的 rows.jsonl 日志
+- 写入只追加；删除和覆盖写只在日志中记录墓碑，死行占比超过 compaction_ratio 时压缩重写分片
+- 检索对候选分片做一次矩阵乘法得到余弦相似度，argpartition 取 top-k 后合并各分片结果；
+  按部门过滤只扫描对应分片，document_id 过滤用向量化的 np.isin
+- 返回与 Chroma 相同的余弦距离（1 - 相似度）
+
+API 进程和 Celery worker 可以共用同一个目录：每个集合用一个 flock 文件锁协调多进程，
+写入持有排他锁，读取持有共享锁；每次操作前检查各分片日志的 (inode, 大小, 修改时间)，
+其他进程写入或压缩过的分片会重新加载。文件锁依赖本地文件系统，不要把目录放在 NFS 等网络存储上。
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 flock，只能单进程使用
+    fcntl = None
+
+import numpy as np
+from loguru import logger
+
+VECTORS_FILE = "vectors.npy"
+LOG_FILE = "rows.jsonl"
+LOCK_FILE = ".lock"
+SHARED_SHARD = "shared"                 # 没有 department_id 的向量
+MIN_CAPACITY = 256
+SPARSE_FILTER_RATIO = 8                 # 过滤后剩余行数不足 1/8 时只取这些行计算，否则扫描整个分片
+
+
+def _shard_key(metadata: Dict[str, Any]) -> str:
+    department_id = metadata.get("department_id")
+    return SHARED_SHARD if department_id is None else str(department_id)
+
+
+def _conditions(where: Optional[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+    """把 Chroma where 条件展开为 (字段, 期望值) 列表，只支持 $and 组合"""
+    if not where:
+        return []
+    if "$and" in where:
+        return [item for condition in where["$and"] for item in _conditions(condition)]
+    return list(where.items())
+
+
+def _allowed_values(expected: Any) -> Optional[List[Any]]:
+    if isinstance(expected, dict):
+        if "$in" in expected:
+            return list(expected["$in"])
+        if "$eq" in expected:
+            return [expected["$eq"]]
+        raise ValueError(f"不支持的过滤条件: {expected}")
+    return [expected]
+
+
+class _Shard:
+    """一个部门的向量分片"""
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+        self._reset()
+
+    def _reset(self):
+        self.vectors: Optional[np.memmap] = None
+        self.size = 0
+        self.dead = 0
+        self.ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.document_ids = np.zeros(0, dtype=np.int64)
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    def load(self):
+        """打开向量文件并回放日志；日志是行数的唯一依据，未写入日志的向量行被忽略"""
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        if not os.path.exists(vectors_path):
+            return
+        self.vectors = np.load(vectors_path, mmap_mode="r+")
+        self._resize_columns(self.capacity)
+        log_path = os.path.join(self.path, LOG_FILE)
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["op"] == "add":
+                        self._track(entry["row"], entry["id"], entry["metadata"])
+                    elif self.alive[entry["row"]]:
+                        self.alive[entry["row"]] = False
+                        self.dead += 1
+        if self.size:
+            self.norms[:self.size] = np.linalg.norm(self.vectors[:self.size], axis=1)
+
+    def append(self, ids: List[str], matrix: np.ndarray, metadatas: List[Dict[str, Any]]) -> List[int]:
+        """追加写入，返回新行号"""
+        self._reserve(self.size + len(ids), matrix.shape[1])
+        start = self.size
+        self.vectors[start:start + len(ids)] = matrix
+        self.vectors.flush()
+        rows = list(range(start, start + len(ids)))
+        self._write_log(
+            {"op": "add", "row": row, "id": row_id, "metadata": metadata}
+            for row, row_id, metadata in zip(rows, ids, metadatas)
+        )
+        for row, row_id, metadata in zip(rows, ids, metadatas):
+            self._track(row, row_id, metadata)
+        self.norms[start:self.size] = np.linalg.norm(matrix, axis=1)
+        return rows
+
+    def remove(self, rows: List[int]):
+        """以墓碑方式删除"""
+        rows = [row for row in rows if self.alive[row]]
+        if not rows:
+            return
+        self._write_log({"op": "delete", "row": row} for row in rows)
+        self.alive[rows] = False
+        self.dead += len(rows)
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive[:self.size])
+
+    def mask(self, conditions: List[Tuple[str, Any]]) -> np.ndarray:
+        """满足过滤条件的存活行"""
+        mask = self.alive[:self.size].copy()
+        for key, expected in conditions:
+            allowed = _allowed_values(expected)
+            if key == "document_id":
+                mask &= np.isin(self.document_ids[:self.size], allowed)
+            elif key == "department_id":
+                if self.key not in {str(value) for value in allowed}:
+                    mask[:] = False
+            else:
+                for row in np.flatnonzero(mask):
+                    if self.metadatas[row].get(key) not in allowed:
+                        mask[row] = False
+        return mask
+
+    def compact(self) -> Dict[int, int]:
+        """重写分片，只保留存活行，返回旧行号到新行号的映射"""
+        keep = self.live_rows()
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        log_path = os.path.join(self.path, LOG_FILE)
+        dimension = self.vectors.shape[1]
+        capacity = max(MIN_CAPACITY, len(keep) * 2)
+
+        tmp_vectors = vectors_path + ".tmp"
+        compacted = np.lib.format.open_memmap(
+            tmp_vectors, mode="w+", dtype=np.float32, shape=(capacity, dimension)
+        )
+        compacted[:len(keep)] = self.vectors[keep]
+        compacted.flush()
+        del compacted
+
+        tmp_log = log_path + ".tmp"
+        with open(tmp_log, "w", encoding="utf-8") as f:
+            for new_row, row in enumerate(keep):
+                f.write(json.dumps(
+                    {"op": "add", "row": new_row, "id": self.ids[row], "metadata": self.metadatas[row]},
+                    ensure_ascii=False, default=str,
+                ) + "\n")
+
+        self.vectors = None
+        os.replace(tmp_vectors, vectors_path)
+        os.replace(tmp_log, log_path)
+
+        mapping = {int(row): new_row for new_row, row in enumerate(keep)}
+        self._reset()
+        self.load()
+        return mapping
+
+    def _track(self, row: int, row_id: str, metadata: Dict[str, Any]):
+        if row >= len(self.ids):
+            self.ids.extend([""] * (row + 1 - len(self.ids)))
+            self.metadatas.extend([{}] * (row + 1 - len(self.metadatas)))
+        self.ids[row] = row_id
+        self.metadatas[row] = metadata
+        self.alive[row] = True
+        document_id = metadata.get("document_id")
+        self.document_ids[row] = document_id if isinstance(document_id, int) else -1
+        self.size = max(self.size, row + 1)
+
+    def _reserve(self, rows: int, dimension: int):
+        """容量不足时按倍数扩容向量文件"""
+        if self.vectors is not None and self.vectors.shape[1] != dimension:
+            raise ValueError(f"向量维度不一致: {dimension} != {self.vectors.shape[1]}")
+        if rows <= self.capacity:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        capacity = max(MIN_CAPACITY, self.capacity * 2, rows)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        tmp_path = vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(capacity, dimension)
+        )
+        if self.size:
+            grown[:self.size] = self.vectors[:self.size]
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp_path, vectors_path)
+        self.vectors = np.load(vectors_path, mmap_mode="r+")
+        self._resize_columns(capacity)
+
+    def _resize_columns(self, capacity: int):
+        for name, dtype in (("alive", bool), ("norms", np.float32), ("document_ids", np.int64)):
+            column = getattr(self, name)
+            resized = np.zeros(capacity, dtype=dtype)
+            resized[:len(column)] = column[:capacity]
+            setattr(self, name, resized)
+
+    def _write_log(self, entries: Iterable[Dict[str, Any]]):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOG_FILE), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in entries)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class FlatIndexCollection:
+    """按部门分片的平铺向量集合（Chroma 集合接口子集）"""
+
+    def __init__(self, name: str, path: str, compaction_ratio: float = 0.2):
+        self.name = name
+        self.path = path
+        self.compaction_ratio = compaction_ratio
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._shards: Dict[str, _Shard] = {}
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        os.makedirs(path, exist_ok=True)
+        with self._locked():
+            pass
+
+    def add(self, ids: List[str], embeddings: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None):
+        self.upsert(ids, embeddings, metadatas)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None):
+        """写入向量，已存在的 id 先标记删除再追加"""
+        metadatas = metadatas or [{} for _ in ids]
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        with self._locked(exclusive=True):
+            self._remove(ids)
+            groups: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(metadatas):
+                groups.setdefault(_shard_key(metadata), []).append(i)
+            for key, positions in groups.items():
+                shard = self._shard(key)
+                rows = shard.append(
+                    [ids[i] for i in positions], matrix[positions], [dict(metadatas[i]) for i in positions]
+                )
+                for i, row in zip(positions, rows):
+                    self._index[ids[i]] = (key, row)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """按 id 或过滤条件读取，结果顺序稳定（分片顺序 + 行号），可分页"""
+        include = include or ["metadatas"]
+        with self._locked():
+            if ids is not None:
+                locations = [self._index[row_id] for row_id in ids if row_id in self._index]
+            else:
+                conditions = _conditions(where)
+                locations = [
+                    (key, int(row))
+                    for key in sorted(self._shards)
+                    for row in np.flatnonzero(self._shards[key].mask(conditions))
+                ]
+            end = None if limit is None else offset + limit
+            locations = locations[offset:end]
+            result: Dict[str, Any] = {"ids": [self._shards[k].ids[r] for k, r in locations]}
+            if "embeddings" in include:
+                result["embeddings"] = [self._shards[k].vectors[r].tolist() for k, r in locations]
+            if "metadatas" in include:
+                result["metadatas"] = [dict(self._shards[k].metadatas[r]) for k, r in locations]
+            return result
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """精确余弦检索，返回与 Chroma 相同结构的 ids/distances/metadatas"""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        query_norms = np.linalg.norm(queries, axis=1)
+        query_norms[query_norms == 0] = 1.0
+        queries = queries / query_norms[:, None]
+
+        conditions = _conditions(where)
+        departments = [
+            {str(value) for value in _allowed_values(expected)}
+            for key, expected in conditions if key == "department_id"
+        ]
+
+        with self._locked():
+            # 每个分片各取 top-k 候选：(分片, 相似度矩阵, 行号矩阵)，矩阵形状均为 (查询数, k)
+            candidates = []
+            for key, shard in self._shards.items():
+                if any(key not in allowed for allowed in departments) or not shard.size:
+                    continue
+                mask = shard.mask(conditions)
+                selected = int(mask.sum())
+                if not selected or n_results <= 0:
+                    continue
+                if selected * SPARSE_FILTER_RATIO < shard.size:
+                    # 过滤后只剩少量行（如限定文档）：只取这些行计算，复制量很小
+                    rows = np.flatnonzero(mask)
+                    norms = shard.norms[rows].copy()
+                    norms[norms == 0] = 1.0
+                    scores = queries @ shard.vectors[rows].T / norms
+                else:
+                    # 直接对内存映射的连续区间做矩阵乘法，不复制分片；墓碑和被过滤的行置为 -inf
+                    rows = np.arange(shard.size)
+                    norms = shard.norms[:shard.size].copy()
+                    norms[norms == 0] = 1.0
+                    scores = queries @ shard.vectors[:shard.size].T / norms
+                    scores[:, ~mask] = -np.inf
+                k = min(n_results, selected)
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                candidates.append((key, np.take_along_axis(scores, top, axis=1), rows[top]))
+
+            result: Dict[str, Any] = {"ids": [], "distances": [], "metadatas": []}
+            for i in range(len(queries)):
+                scores = np.concatenate([s[i] for _, s, _ in candidates]) if candidates else np.zeros(0)
+                locations = [
+                    (self._shards[key], int(row))
+                    for key, _, rows in candidates
+                    for row in rows[i]
+                ]
+                order = np.argsort(-scores, kind="stable")[:n_results]
+                result["ids"].append([locations[j][0].ids[locations[j][1]] for j in order])
+                result["distances"].append([float(1 - scores[j]) for j in order])
+                result["metadatas"].append(
+                    [dict(locations[j][0].metadatas[locations[j][1]]) for j in order]
+                )
+            return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """按 id 或过滤条件删除（墓碑），死行过多的分片自动压缩"""
+        with self._locked(exclusive=True):
+            if ids is None:
+                ids = self.get(where=where, include=[])["ids"] if where else []
+            touched = self._remove(ids)
+            for key in touched:
+                shard = self._shards[key]
+                if shard.dead and shard.dead >= self.compaction_ratio * shard.size:
+                    self._compact_shard(key)
+
+    def count(self) -> int:
+        with self._locked():
+            return len(self._index)
+
+    def compact(self) -> int:
+        """压缩所有含墓碑的分片，返回回收的行数"""
+        with self._locked(exclusive=True):
+            reclaimed = 0
+            for key, shard in list(self._shards.items()):
+                if shard.dead:
+                    reclaimed += shard.dead
+                    self._compact_shard(key)
+            return reclaimed
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """线程锁 + 跨进程文件锁（可重入）
+
+        最外层进入时加载其他进程的写入；排他锁退出前记录本进程写入后的日志状态，避免重复加载自己的写入
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            with open(os.path.join(self.path, LOCK_FILE), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_depth = 1
+                try:
+                    self._refresh()
+                    yield
+                    if exclusive:
+                        self._signatures = {key: self._signature(key) for key in self._shards}
+                finally:
+                    self._lock_depth = 0
+                    # 关闭文件时释放 flock
+
+    def _signature(self, key: str) -> Optional[Tuple[int, int, int]]:
+        """分片日志的 (inode, 大小, 修改时间)：追加写改变大小，压缩重写改变 inode"""
+        try:
+            stat = os.stat(os.path.join(self.path, key, LOG_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _refresh(self):
+        """重新加载日志有变化的分片（包括其他进程新建的分片）"""
+        for key in sorted(os.listdir(self.path)):
+            if not os.path.isdir(os.path.join(self.path, key)):
+                continue
+            signature = self._signature(key)
+            if key in self._shards and self._signatures.get(key) == signature:
+                continue
+            if key in self._shards:
+                self._index = {row_id: loc for row_id, loc in self._index.items() if loc[0] != key}
+            shard = _Shard(os.path.join(self.path, key), key)
+            shard.load()
+            self._shards[key] = shard
+            self._signatures[key] = signature
+            for row in shard.live_rows():
+                self._index[shard.ids[row]] = (key, int(row))
+
+    def _shard(self, key: str) -> _Shard:
+        if key not in self._shards:
+            self._shards[key] = _Shard(os.path.join(self.path, key), key)
+        return self._shards[key]
+
+    def _remove(self, ids: List[str]) -> List[str]:
+        """标记删除，返回涉及的分片"""
+        rows: Dict[str, List[int]] = {}
+        for row_id in ids:
+            location = self._index.pop(row_id, None)
+            if location is not None:
+                rows.setdefault(location[0], []).append(location[1])
+        for key, shard_rows in rows.items():
+            self._shards[key].remove(shard_rows)
+        return list(rows)
+
+    def _compact_shard(self, key: str):
+        shard = self._shards[key]
+        dead, size = shard.dead, shard.size
+        mapping = shard.compact()
+        for row, new_row in mapping.items():
+            self._index[shard.ids[new_row]] = (key, new_row)
+        logger.info(f"平铺索引分片压缩完成: {self.name}/{key}, 回收 {dead}/{size} 行")
+
+
+class FlatIndexClient:
+    """平铺索引客户端（Chroma 客户端接口子集），集合存放在 path 下的同名目录中"""
+
+    def __init__(self, path: str, compaction_ratio: float = 0.2):
+        self.path = path
+        self.compaction_ratio = compaction_ratio
+        self._collections: Dict[str, FlatIndexCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get_collection(self, name: str) -> FlatIndexCollection:
+        with self._lock:
+            if name not in self._collections:
+                if not os.path.isdir(os.path.join(self.path, name)):
+                    raise ValueError(f"集合不存在: {name}")
+                self._collections[name] = FlatIndexCollection(
+                    name, os.path.join(self.path, name), self.compaction_ratio
+                )
+            return self._collections[name]
+
+    def create_collection(
+        self,
+        name: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        configuration: Optional[Dict[str, Any]] = None,
+    ) -> FlatIndexCollection:
+        """创建集合（HNSW 配置对精确检索无意义，忽略）"""
+        with self._lock:
+            if name in self._collections or os.path.isdir(os.path.join(self.path, name)):
+                raise ValueError(f"集合已存在: {name}")
+            self._collections[name] = FlatIndexCollection(
+                name, os.path.join(self.path, name), self.compaction_ratio
+            )
+            return self._collections[name]
+
+    def list_collections(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name))
+        )
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
@@ -0,0 +1,186 @@
+"""
+对冲生成（hedged requests）- 用备用模型压低 LLM 尾延迟
+
+主模型在截止时间内没有产出首个 token 时，把同一提示词发给备用模型（另一个模型或端点），
+先产出首个 token 的一方胜出，另一方立即取消：
+
+- 截止时间取主模型最近首 token 延迟的分位数（默认 p95），并限制在 [min, max] 区间；
+  样本不足时使用 max，避免冷启动阶段过早对冲
+- 主模型在截止时间前失败时直接转向备用模型
+- 胜出方和对冲浪费的 token（败者的提示词 + 已产出的输出，按估算）记入指标
+
+对外提供与 ChatOpenAI 相同的 ainvoke / astream 接口，可直接替换 RAGService.llm。
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, List, Tuple
+
+from langchain_core.messages import AIMessage
+from loguru import logger
+
+from app.core.metrics import metrics
+from app.utils.tokens import estimate_tokens
+
+hedge_requests = metrics.counter(
+    "llm_hedge_requests_total", "LLM 生成请求数（按胜出方和是否触发对冲）"
+)
+hedge_wasted_tokens = metrics.counter(
+    "llm_hedge_wasted_tokens_total", "对冲中败者消耗的估算 token 数（提示词 + 已产出输出）"
+)
+first_token_latency = metrics.histogram(
+    "llm_first_token_ms", "LLM 首 token 延迟（毫秒，按模型角色）"
+)
+
+
+class _Attempt:
+    """一路生成请求，后台读取到首个非空 token 为止"""
+
+    def __init__(self, role: str, llm, prompt: Any):
+        self.role = role
+        self.started_at = time.perf_counter()
+        self.stream = llm.astream(prompt).__aiter__()
+        self.chunks: List[Any] = []
+        self.task = asyncio.ensure_future(self._first_token())
+
+    async def _first_token(self) -> bool:
+        """读取到首个非空 token 返回 True，流直接结束返回 False"""
+        async for chunk in self.stream:
+            self.chunks.append(chunk)
+            if chunk.content:
+                return True
+        return False
+
+    @property
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started_at) * 1000, 2)
+
+    def output_tokens(self) -> int:
+        return estimate_tokens("".join(str(c.content) for c in self.chunks))
+
+    async def cancel(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await self.stream.aclose()
+
+
+class HedgedLLM:
+    """主模型 + 备用模型的对冲生成"""
+
+    def __init__(
+        self,
+        primary,
+        secondary,
+        percentile: float = 0.95,
+        min_deadline_ms: float = 500,
+        max_deadline_ms: float = 5000,
+        min_samples: int = 20,
+        window: int = 500,
+    ):
+        """
+        Args:
+            primary: 主模型（需提供 astream）
+            secondary: 备用模型（需提供 astream）
+            percentile: 用于推导截止时间的首 token 延迟分位数
+            min_deadline_ms: 截止时间下限
+            max_deadline_ms: 截止时间上限，样本不足时使用
+            min_samples: 开始按分位数推导截止时间所需的最少样本数
+            window: 保留的最近首 token 延迟样本数
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_deadline_ms = min_deadline_ms
+        self.max_deadline_ms = max_deadline_ms
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+
+    def deadline_ms(self) -> float:
+        """当前的对冲截止时间（毫秒）"""
+        if len(self._samples) < self.min_samples:
+            return self.max_deadline_ms
+        ordered = sorted(self._samples)
+        index = min(int(self.percentile * len(ordered)), len(ordered) - 1)
+        return min(max(ordered[index], self.min_deadline_ms), self.max_deadline_ms)
+
+    async def ainvoke(self, prompt: Any) -> AIMessage:
+        """对冲生成完整回答"""
+        parts = [str(chunk.content) async for chunk in self.astream(prompt)]
+        return AIMessage(content="".join(parts))
+
+    async def astream(self, prompt: Any) -> AsyncIterator[Any]:
+        """对冲流式生成，首个 token 决出胜者后只转发胜者的输出"""
+        winner = await self._race(prompt)
+        try:
+            for chunk in winner.chunks:
+                yield chunk
+            async for chunk in winner.stream:
+                yield chunk
+        finally:
+            await winner.stream.aclose()
+
+    async def _race(self, prompt: Any) -> _Attempt:
+        """返回先产出首个 token 的一路请求；调用方被取消时一并取消所有请求"""
+        attempts: List[_Attempt] = []
+        try:
+            return await self._run_race(prompt, attempts)
+        except BaseException:
+            for attempt in attempts:
+                await attempt.cancel()
+            raise
+
+    async def _run_race(self, prompt: Any, attempts: List[_Attempt]) -> _Attempt:
+        primary = _Attempt("primary", self.primary, prompt)
+        attempts.append(primary)
+        deadline = self.deadline_ms()
+        done, _ = await asyncio.wait({primary.task}, timeout=deadline / 1000)
+        if done and primary.task.exception() is None:
+            self._record_primary(primary)
+            hedge_requests.inc(winner="primary", hedged="false")
+            return primary
+
+        errors: List[Tuple[str, BaseException]] = []
+        if done:
+            errors.append(("primary", primary.task.exception()))
+            logger.warning(f"⚠️  主模型生成失败，转向备用模型: {primary.task.exception()}")
+        else:
+            logger.info(f"主模型 {deadline:.0f}ms 内没有首 token，向备用模型发出对冲请求")
+        secondary = _Attempt("secondary", self.secondary, prompt)
+        attempts.append(secondary)
+
+        pending = {a.task: a for a in attempts if not a.task.done()}
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempt = pending.pop(task)
+                if task.exception() is not None:
+                    errors.append((attempt.role, task.exception()))
+                    continue
+                for loser in pending.values():
+                    await self._abandon(loser, prompt)
+                if attempt is primary:
+                    self._record_primary(primary)
+                else:
+                    first_token_latency.observe(attempt.elapsed_ms, model="secondary")
+                    if not errors:
+                        # 被截断的主模型延迟至少为当前耗时，计入样本避免截止时间偏低
+                        self._samples.append(primary.elapsed_ms)
+                hedge_requests.inc(winner=attempt.role, hedged="true")
+                return attempt
+
+        hedge_requests.inc(winner="none", hedged="true")
+        raise dict(errors).get("primary") or errors[0][1]
+
+    async def _abandon(self, loser: _Attempt, prompt: Any):
+        """取消败者，统计浪费的 token"""
+        await loser.cancel()
+        wasted = estimate_tokens(str(prompt)) + loser.output_tokens()
+        hedge_wasted_tokens.inc(wasted)
+        logger.debug("对冲败者 {} 已取消，浪费约 {} tokens", loser.role, wasted)
+
+    def _record_primary(self, attempt: _Attempt):
+        self._samples.append(attempt.elapsed_ms)
+        first_token_latency.observe(attempt.elapsed_ms, model="primary")
@@ -0,0 +1,227 @@
+"""
+对话历史窗口 - 最近轮次原文 + 早先轮次滚动摘要
+
+客户端每次请求都会带上完整的 history，长会话会让提示词无限增长。这里：
+- 最近 history_recent_turns 轮（一问一答为一轮）在 history_max_tokens 预算内原文保留
+- 更早的消息折叠为滚动摘要，摘要按会话缓存（进程内 LRU + Redis 共享层）
+- 窗口滑动时只把新滑出窗口的消息与已有摘要合并，不重复总结整段历史
+
+缓存条目记录已摘要的消息数和这些消息的指纹，客户端改写历史导致指纹不一致时从头重新摘要。
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis import RedisCircuitBreaker, get_redis
+from app.utils.tokens import estimate_tokens, truncate_to_tokens
+
+KEY_PREFIX = "askit:history_summary"
+
+SUMMARY_PROMPT = """请将以下对话压缩为一段简洁的摘要，保留关键事实、涉及的文档或实体以及用户的核心诉求，不超过 {max_chars} 字。
+
+{previous}新增对话：
+{dialogue}
+
+摘要："""
+
+
+@dataclass
+class HistoryWindow:
+    """构建好的历史上下文"""
+
+    text: str
+    tokens: int = 0
+    full_tokens: int = 0                  # 不做窗口化时完整历史的 token 数
+    recent_messages: int = 0
+    summarized_messages: int = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """写入响应 timings 的统计项"""
+        return {
+            "history_tokens": self.tokens,
+            "history_tokens_full": self.full_tokens,
+            "history_tokens_saved": max(self.full_tokens - self.tokens, 0),
+            "history_summarized_messages": self.summarized_messages,
+        }
+
+
+def format_messages(messages: List[Dict[str, str]]) -> List[str]:
+    """格式化为 "用户：..." / "助手：..." 行"""
+    lines = []
+    for msg in messages:
+        role = "用户" if msg.get("role") == "user" else "助手"
+        lines.append(f"{role}：{msg.get('content', '')}")
+    return lines
+
+
+def messages_fingerprint(messages: List[Dict[str, str]]) -> str:
+    """消息列表的指纹，用于校验缓存的摘要是否仍对应同一段历史"""
+    raw = json.dumps(
+        [[m.get("role"), m.get("content")] for m in messages],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ConversationHistory:
+    """对话历史窗口构建器"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: int = 86400,
+        redis_client=None,
+    ):
+        """
+        Args:
+            max_entries: 进程内缓存的会话摘要条数
+            ttl_seconds: 摘要缓存有效期（秒）
+            redis_client: 异步 Redis 客户端，为 None 时仅使用进程内缓存
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self._breaker = RedisCircuitBreaker("会话摘要")
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    async def build(
+        self,
+        history: List[Dict[str, str]],
+        conversation_key: Optional[str] = None,
+        llm=None,
+    ) -> HistoryWindow:
+        """
+        构建历史上下文
+
+        Args:
+            history: 客户端提交的完整对话历史（按时间顺序）
+            conversation_key: 会话缓存键，为空时不缓存摘要
+            llm: 用于生成摘要的 LLM，为空或摘要关闭时直接丢弃早先消息
+        """
+        if not history:
+            return HistoryWindow(text="")
+
+        full_tokens = estimate_tokens("\n".join(["对话历史："] + format_messages(history)))
+        recent = self._select_recent(history)
+        older = history[:len(history) - len(recent)]
+
+        summary = ""
+        if older and llm is not None and settings.history_summary_enabled:
+            try:
+                summary = await self._summarize(older, conversation_key, llm)
+            except Exception as e:
+                logger.warning(f"⚠️  对话摘要生成失败，丢弃早先的 {len(older)} 条消息: {str(e)}")
+
+        lines = ["对话历史："]
+        if summary:
+            lines.append(f"（早先对话摘要）{summary}")
+        lines.extend(format_messages(recent))
+        text = "\n".join(lines)
+
+        return HistoryWindow(
+            text=text,
+            tokens=estimate_tokens(text),
+            full_tokens=full_tokens,
+            recent_messages=len(recent),
+            summarized_messages=len(older) if summary else 0,
+        )
+
+    def _select_recent(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """从最新消息往前选取，不超过最近轮数和 token 预算"""
+        max_messages = settings.history_recent_turns * 2
+        budget = settings.history_max_tokens
+        selected = []
+        for msg in reversed(history[-max_messages:] if max_messages > 0 else []):
+            cost = estimate_tokens(format_messages([msg])[0]) + 1
+            if cost > budget:
+                break
+            selected.append(msg)
+            budget -= cost
+        selected.reverse()
+        return selected
+
+    async def _summarize(
+        self,
+        older: List[Dict[str, str]],
+        conversation_key: Optional[str],
+        llm,
+    ) -> str:
+        """返回早先消息的滚动摘要，只对新滑出窗口的消息增量调用 LLM"""
+        previous_summary, start = "", 0
+        cached = await self._get(conversation_key) if conversation_key else None
+        if cached and cached["count"] <= len(older):
+            if messages_fingerprint(older[:cached["count"]]) == cached["fingerprint"]:
+                previous_summary, start = cached["summary"], cached["count"]
+
+        if start == len(older):
+            return previous_summary
+
+        max_tokens = settings.history_summary_max_tokens
+        prompt = SUMMARY_PROMPT.format(
+            max_chars=max_tokens,
+            previous=f"已有摘要：\n{previous_summary}\n\n" if previous_summary else "",
+            dialogue="\n".join(format_messages(older[start:])),
+        )
+        response = await llm.ainvoke(prompt)
+        summary = truncate_to_tokens(str(response.content).strip(), max_tokens)
+        logger.info(f"📝 会话摘要已更新 | 新增消息: {len(older) - start} | 已摘要: {len(older)}")
+
+        if conversation_key:
+            await self._set(conversation_key, {
+                "count": len(older),
+                "fingerprint": messages_fingerprint(older),
+                "summary": summary,
+            })
+        return summary
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._local.get(key)
+        if item is not None and time.time() - item[0] <= self.ttl_seconds:
+            self._local.move_to_end(key)
+            return item[1]
+
+        if self.redis is None or not self._breaker.available:
+            return None
+        try:
+            raw = await self.redis.get(f"{KEY_PREFIX}:{key}")
+        except Exception as e:
+            self._breaker.record_failure(e)
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._put_local(key, value)
+        return value
+
+    async def _set(self, key: str, value: Dict[str, Any]):
+        self._put_local(key, value)
+        if self.redis is None or not self._breaker.available:
+            return
+        try:
+            await self.redis.set(
+                f"{KEY_PREFIX}:{key}",
+                json.dumps(value, ensure_ascii=False),
+                ex=self.ttl_seconds,
+            )
+        except Exception as e:
+            self._breaker.record_failure(e)
+
+    def _put_local(self, key: str, value: Dict[str, Any]):
+        self._local[key] = (time.time(), value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+# 全局实例
+conversation_history = ConversationHistory(
+    ttl_seconds=settings.history_summary_ttl_seconds,
+    redis_client=get_redis(),
+)
@@ -0,0 +1,182 @@
+"""
+混合检索 - 词法检索 + 倒数排名融合（RRF）
+
+纯向量检索对错误码、合同号、SKU 等精确标识符召回很差。词法检索基于
+document_chunks.search_tokens 上的 GIN 索引（见 app.utils.lexical），按部门过滤，
+结果与向量检索结果通过 RRF 融合：
+
+    score(d) = Σ weight_s / (rrf_k + rank_s(d))
+
+RRF 只依赖排名，不需要对两路得分做归一化。
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.database import AsyncSessionLocal
+from app.utils.lexical import build_tsquery
+
+LEXICAL_SEARCH_SQL = text(
+    """
+    SELECT c.id, c.document_id, c.chunk_index, c.content, c.vector_id,
+           c.page_number, c.chunk_metadata, d.original_filename, d.department_id,
+           ts_rank(array_to_tsvector(string_to_array(c.search_tokens, ' ')), q.query) AS score
+    FROM document_chunks c
+    JOIN documents d ON d.id = c.document_id
+    CROSS JOIN (SELECT CAST(:tsquery AS tsquery) AS query) q
+    WHERE d.department_id = :department_id
+      AND array_to_tsvector(string_to_array(c.search_tokens, ' ')) @@ q.query
+    ORDER BY score DESC
+    LIMIT :limit
+    """
+)
+
+# 批量词法检索：每个 tsquery 通过 LATERAL 子查询各取 limit 条，一次往返完成
+LEXICAL_BATCH_SEARCH_SQL = text(
+    """
+    SELECT q.idx, hit.*
+    FROM unnest(CAST(:tsqueries AS text[])) WITH ORDINALITY AS q(query_text, idx)
+    CROSS JOIN LATERAL (
+        SELECT c.id, c.document_id, c.chunk_index, c.content, c.vector_id,
+               c.page_number, c.chunk_metadata, d.original_filename, d.department_id,
+               ts_rank(array_to_tsvector(string_to_array(c.search_tokens, ' ')),
+                       CAST(q.query_text AS tsquery)) AS score
+        FROM document_chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE d.department_id = :department_id
+          AND array_to_tsvector(string_to_array(c.search_tokens, ' ')) @@ CAST(q.query_text AS tsquery)
+        ORDER BY score DESC
+        LIMIT :limit
+    ) hit
+    ORDER BY q.idx, hit.score DESC
+    """
+)
+
+
+class LexicalSearcher:
+    """基于 PostgreSQL 的部门级词法检索"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def search(
+        self,
+        query: str,
+        department_id: int,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """词法检索，返回格式与 VectorStore.search 一致"""
+        tsquery = build_tsquery(query)
+        if not tsquery:
+            return []
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                LEXICAL_SEARCH_SQL,
+                {"tsquery": tsquery, "department_id": department_id, "limit": limit},
+            )
+            rows = result.mappings().all()
+
+        return [self._format_row(row) for row in rows]
+
+    async def search_many(
+        self,
+        queries: List[str],
+        department_id: int,
+        limit: int = 10,
+    ) -> List[List[Dict[str, Any]]]:
+        """批量词法检索，一条 SQL 检索所有问题
+
+        Returns:
+            与 queries 一一对应的结果列表
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        tsqueries, positions = [], []
+        for i, query in enumerate(queries):
+            tsquery = build_tsquery(query)
+            if tsquery:
+                tsqueries.append(tsquery)
+                positions.append(i)
+        if not tsqueries:
+            return results
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                LEXICAL_BATCH_SEARCH_SQL,
+                {"tsqueries": tsqueries, "department_id": department_id, "limit": limit},
+            )
+            rows = result.mappings().all()
+
+        for row in rows:
+            # WITH ORDINALITY 从 1 开始编号
+            results[positions[row["idx"] - 1]].append(self._format_row(row))
+        return results
+
+    def _format_row(self, row) -> Dict[str, Any]:
+        metadata = {}
+        if row["chunk_metadata"]:
+            try:
+                metadata = json.loads(row["chunk_metadata"])
+            except ValueError:
+                metadata = {}
+
+        payload = {
+            **metadata,
+            "document_id": row["document_id"],
+            "chunk_id": row["id"],
+            "chunk_index": row["chunk_index"],
+            "filename": row["original_filename"],
+            "content": row["content"],
+            "department_id": row["department_id"],
+        }
+        if row["page_number"] is not None:
+            payload["page_number"] = row["page_number"]
+
+        return {
+            # 与向量库中的 ID 对齐，便于融合时识别同一分块
+            "id": row["vector_id"] or f"chunk-{row['id']}",
+            "score": float(row["score"]),
+            "payload": payload,
+        }
+
+
+def reciprocal_rank_fusion(
+    result_lists: Dict[str, List[Dict[str, Any]]],
+    weights: Optional[Dict[str, float]] = None,
+    rrf_k: int = 60,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """倒数排名融合
+
+    Args:
+        result_lists: 检索来源名称 → 按相关度降序排列的结果列表
+        weights: 各来源权重，缺省为 1.0
+        rrf_k: RRF 平滑常数，越大排名靠后的结果影响越大
+        limit: 返回的最大条数
+
+    Returns:
+        融合后的结果列表。每条结果保留首个来源的 score 和 payload，
+        新增 fusion_score 和 retrievers（命中的来源列表）
+    """
+    weights = weights or {}
+    fused: Dict[str, Dict[str, Any]] = {}
+
+    for source, results in result_lists.items():
+        weight = weights.get(source, 1.0)
+        if weight <= 0:
+            continue
+        for rank, result in enumerate(results, 1):
+            entry = fused.get(result["id"])
+            if entry is None:
+                entry = {**result, "fusion_score": 0.0, "retrievers": []}
+                fused[result["id"]] = entry
+            entry["fusion_score"] += weight / (rrf_k + rank)
+            entry["retrievers"].append(source)
+
+    ranked = sorted(fused.values(), key=lambda r: r["fusion_score"], reverse=True)
+    return ranked[:limit] if limit is not None else ranked
+
+
+# 全局实例
+lexical_searcher = LexicalSearcher()
@@ -0,0 +1,96 @@
+"""
+意图路由 - 识别寒暄、致谢、询问能力等闲聊消息
+
+相当比例的提问是"你好"、"谢谢"、"你能做什么"，走完整 RAG 流程要付出一次向量化、
+一次向量检索和一个很大的提示词。这里用规则在进程内判断（微秒级），命中时直接给出固定回答：
+- 消息先做 NFKC 归一化、转小写、去掉空白标点和表情，只有整句都是闲聊才命中
+  （"你好，年假几天？" 仍然走检索）
+- 归一化后超过 MAX_CHARS 个字符的消息不做判断
+- 寒暄和询问能力只在对话的第一条消息上判断：对话中途的"怎么用"、"help"多半是在追问上文，
+  交给检索和 LLM 结合历史回答；致谢和道别在对话中途仍直接回答
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.core.metrics import metrics
+
+routed_queries = metrics.counter("rag_intent_routed_total", "意图路由判定的查询数（按意图，rag 为走检索）")
+
+# 超过该长度的消息视为正常提问
+MAX_CHARS = 24
+
+# 去掉空白、标点、表情等非文字字符
+_NOISE_RE = re.compile(r"[^\w]|_", re.UNICODE)
+_PARTICLE = r"(?:呀|啊|哇|呢|哦|噢|嘛|哈|啦|了)*"
+
+_GREETING_RE = re.compile(
+    rf"(?:(?:hi|hello|hey|嗨|哈[喽啰罗]|[你您]好|大家好|早上好|上午好|中午好|下午好|晚上好|"
+    rf"早安|早|在吗|在不在|有人吗){_PARTICLE})+"
+)
+_THANKS_RE = re.compile(
+    rf"(?:好的|好|ok|okay|嗯|明白了?|知道了)?"
+    rf"(?:(?:谢谢|多谢|感谢|谢啦|谢了|thanks|thankyou|thx|辛苦了?)(?:你|您)?{_PARTICLE})+"
+)
+_GOODBYE_RE = re.compile(rf"(?:(?:再见|拜拜|bye|byebye|goodbye|回头见){_PARTICLE})+")
+_CAPABILITY_RE = re.compile(
+    rf"(?:[你您](?:能|可以|会)(?:做|干|帮我做|帮我干)?(?:什么|啥|哪些事)|[你您]是谁|[你您]是什么|"
+    rf"[你您]叫什么(?:名字)?|介绍一?下?[你您]?自己|[你您]有(?:什么|哪些)功能|怎么用[你您]?|"
+    rf"whatcanyoudo|whoareyou|help|帮助){_PARTICLE}"
+)
+
+GREETING_ANSWER = "您好！我是 AskIt 知识库助手，可以根据您所在部门的文档回答问题。请问有什么可以帮您？"
+THANKS_ANSWER = "不客气！如果还有其他问题，随时问我。"
+GOODBYE_ANSWER = "再见！有需要随时回来找我。"
+CAPABILITY_ANSWER = (
+    "我是 AskIt 知识库助手，可以根据您所在部门上传的文档（制度、流程、手册等）回答问题，"
+    "并给出答案引用的文档来源。直接输入您的问题即可，例如：\"年假有几天？\""
+)
+
+
+@dataclass
+class Intent:
+    """路由结果"""
+
+    name: str
+    answer: str
+
+
+class IntentRouter:
+    """基于规则的闲聊意图识别"""
+
+    RULES = (
+        ("greeting", _GREETING_RE, GREETING_ANSWER),
+        ("thanks", _THANKS_RE, THANKS_ANSWER),
+        ("goodbye", _GOODBYE_RE, GOODBYE_ANSWER),
+        ("capability", _CAPABILITY_RE, CAPABILITY_ANSWER),
+    )
+    # 有对话历史时不判断的意图（含义依赖上下文）
+    FIRST_MESSAGE_ONLY = frozenset({"greeting", "capability"})
+
+    def route(
+        self,
+        question: str,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> Optional[Intent]:
+        """判断问题是否为闲聊，是则返回意图和固定回答，否则返回 None（走检索）
+
+        Args:
+            question: 用户问题
+            history: 对话历史，非空时跳过 FIRST_MESSAGE_ONLY 中的意图
+        """
+        text = _NOISE_RE.sub("", unicodedata.normalize("NFKC", question).lower())
+        if text and len(text) <= MAX_CHARS:
+            for name, pattern, answer in self.RULES:
+                if history and name in self.FIRST_MESSAGE_ONLY:
+                    continue
+                if pattern.fullmatch(text):
+                    routed_queries.inc(intent=name)
+                    return Intent(name=name, answer=answer)
+        routed_queries.inc(intent="rag")
+        return None
+
+
+# 全局实例
+intent_router = IntentRouter()
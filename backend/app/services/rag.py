@@ -1,32 +1,178 @@
 """
 RAG 服务 - 基于 LangChain 1.x
 """
-from typing import List, Dict, Any, Optional
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import asyncio
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from loguru import logger
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.model_clients import LLM_HEDGE_POOL, model_clients
+from app.services.answer_cache import answer_cache
+from app.services.context_compressor import context_compressor
+from app.services.context_packer import context_packer
+from app.services.document_processing.embedding import create_embedding_service_from_config
+from app.services.embedding_cache import embedding_cache, normalize_text
+from app.services.hedging import HedgedLLM
+from app.services.history import conversation_history, messages_fingerprint
+from app.services.hybrid_search import lexical_searcher, reciprocal_rank_fusion
+from app.services.intent_router import intent_router
+from app.services.retrieval_memory import retrieval_memory
+from app.services.single_flight import SingleFlight
 from app.services.vector_store import vector_store
+from app.utils.lexical import has_identifier
+
+
+stage_latency = metrics.histogram("rag_stage_latency_ms", "RAG 查询各阶段耗时（毫秒，按阶段）")
+cancelled_stages = metrics.counter(
+    "rag_cancelled_total", "被取消的查询工作（客户端断开等，按取消时所处阶段）"
+)
+no_context_answers = metrics.counter("rag_no_context_total", "未检索到相关内容、跳过 LLM 直接返回的查询数")
+
+NO_CONTEXT_ANSWER = "抱歉，知识库中没有找到与您的问题相关的信息。您可以换一种问法，或联系相关部门获取帮助。"
+NO_CONTEXT_SUGGESTIONS = "\n\n您可以查看以下可能相关的文档：\n{documents}"
+
+
+def _elapsed_ms(start: float) -> float:
+    """计算从 start 到现在的毫秒数"""
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _preview(text: str, limit: int = 100) -> str:
+    """日志用的文本预览"""
+    return text if len(text) <= limit else f"{text[:limit]}..."
+
+
+def _preview_results(search_results: List[Dict[str, Any]]) -> str:
+    """日志用的检索结果预览"""
+    return "\n".join(
+        f"  [{i}] {r['payload'].get('filename', '未知文件')} (相似度: {r.get('score', 0):.4f}) "
+        f"{_preview(r['payload'].get('content', ''))}"
+        for i, r in enumerate(search_results, 1)
+    )
+
+
+def _flight_key(
+    question: str,
+    department_id: int,
+    history: Optional[List[Dict[str, str]]],
+    top_k: int,
+    conversation_key: Optional[str] = None,
+) -> str:
+    """请求合并键：部门 + top_k + 会话 + 对话历史指纹 + 归一化问题
+
+    检索结果延续和历史摘要按会话写入，只由领头请求执行一次，不同会话的请求不能合并；
+    没有会话键的请求不写会话状态，仍按问题合并
+    """
+    history_hash = messages_fingerprint(history) if history else "-"
+    return f"{department_id}:{top_k}:{conversation_key or '-'}:{history_hash}:{normalize_text(question)}"
+
+
+class StageTimer:
+    """查询阶段计时器
+
+    阶段耗时写入 timings 的 {stage}_ms，并上报 rag_stage_latency_ms 直方图。
+    阶段内抛出异常时不记录，被取消时计入 rag_cancelled_total
+    """
+
+    def __init__(self, timings: Dict[str, Any]):
+        self.timings = timings
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        with self.cancellable(stage):
+            yield
+        self.record(stage, _elapsed_ms(start))
+
+    @contextmanager
+    def cancellable(self, stage: str):
+        """阶段内的工作被取消（任务取消或流被提前关闭）时按阶段计数"""
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled_stages.inc(stage=stage)
+            raise
+
+    def record(self, stage: str, elapsed_ms: float):
+        self.timings[f"{stage}_ms"] = elapsed_ms
+        stage_latency.observe(elapsed_ms, stage=stage)
+
+
+@dataclass
+class PreparedQuery:
+    """检索完成、等待生成的查询
+
+    query() 与 stream_query() 共用检索和提示词构建流程，只在生成阶段分叉
+    """
+
+    prompt: str
+    sources: List[Dict[str, Any]]
+    timings: Dict[str, float] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.perf_counter)
+    answer: Optional[str] = None          # 不需要调用 LLM 时直接给出的答案
+    answer_path: str = "llm"              # 答案来源：llm / answer_cache / no_context / intent
+    intent: str = "rag"                   # 意图路由结果，闲聊意图不做检索
+    cache_scope: Optional[Tuple[int, int]] = None  # (部门, top_k)，可写入答案缓存时设置
+    question: str = ""
+    query_vector: Optional[List[float]] = None
+    department_id: Optional[int] = None
+    suggestions: Optional[List[Dict[str, Any]]] = None  # 无相关内容时推荐的相近文档
+
+    @property
+    def timer(self) -> StageTimer:
+        return StageTimer(self.timings)
+
+    @property
+    def cached(self) -> bool:
+        return self.answer_path == "answer_cache"
+
+    def result(self, answer: Optional[str]) -> Dict[str, Any]:
+        """query() / batch_query() 的返回结构"""
+        result = {
+            "answer": answer,
+            "sources": self.sources,
+            "timings": self.timings,
+            "cached": self.cached,
+        }
+        if self.suggestions is not None:
+            result["suggestions"] = self.suggestions
+        return result
 
 
 class RAGService:
     """RAG 问答服务 - LangChain 1.x"""
 
     def __init__(self):
-        # 初始化 LLM
-        self.llm = ChatOpenAI(
-            model=settings.llm_model,
-            openai_api_key=settings.openai_api_key,
-            openai_api_base=settings.openai_base_url,
-            temperature=0.7,
+        # LLM 与向量化都通过共享的模型客户端注册表获取，复用 keep-alive 连接池；
+        # 向量化与文档入库使用同一提供商和模型，查询向量与入库向量处于同一空间
+        self.llm = model_clients.chat_model(temperature=0.7)
+        if settings.llm_hedge_enabled:
+            # 主模型首 token 过慢时向备用模型发出同一请求，取先响应者
+            self.llm = HedgedLLM(
+                self.llm,
+                model_clients.chat_model(
+                    model=settings.llm_hedge_model or None,
+                    temperature=0.7,
+                    base_url=settings.llm_hedge_base_url or None,
+                    api_key=settings.llm_hedge_api_key or None,
+                    pool=LLM_HEDGE_POOL,
+                ),
+                percentile=settings.llm_hedge_percentile,
+                min_deadline_ms=settings.llm_hedge_min_deadline_ms,
+                max_deadline_ms=settings.llm_hedge_max_deadline_ms,
+                min_samples=settings.llm_hedge_min_samples,
+            )
+        self.embedding_service = create_embedding_service_from_config(
+            settings.get_embedding_config()
         )
 
-        # 初始化 Embeddings
-        self.embeddings = OpenAIEmbeddings(
-            model=settings.embedding_model,
-            openai_api_key=settings.openai_api_key,
-            openai_api_base=settings.openai_base_url,
-        )
+        # 相同的并发请求只计算一次
+        self.query_flights = SingleFlight("query")
+        self.stream_flights = SingleFlight("stream")
 
     async def query(
         self,
@@ -34,6 +180,7 @@ class RAGService:
         department_id: int,
         history: Optional[List[Dict[str, str]]] = None,
         top_k: int = 5,
+        conversation_key: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         执行 RAG 查询
@@ -43,60 +190,674 @@ class RAGService:
             department_id: 部门ID（用于权限过滤）
             history: 对话历史
             top_k: 返回的文档数量
+            conversation_key: 会话缓存键（用于缓存早先历史的摘要）
 
         Returns:
-            包含答案和来源文档的字典
+            包含答案、来源文档和各阶段耗时的字典
         """
-        logger.info("=" * 60)
-        logger.info("📋 RAG 查询开始")
-        logger.info(f"👤 用户问题: {question}")
-        logger.info(f"🏢 部门ID: {department_id}")
-        logger.info(f"📊 返回文档数: {top_k}")
+        if not settings.single_flight_enabled:
+            return await self._query(question, department_id, history, top_k, conversation_key)
 
-        # 1. 对问题进行向量化
-        logger.info("🔄 步骤 1/6: 问题向量化...")
-        query_vector = await self.embeddings.aembed_query(question)
-        logger.info(f"✅ 向量化完成，维度: {len(query_vector)}")
+        result = await self.query_flights.do(
+            _flight_key(question, department_id, history, top_k, conversation_key),
+            lambda: self._query(question, department_id, history, top_k, conversation_key),
+        )
+        # 合并的请求共享同一结果，各自返回副本以免调用方修改互相影响
+        return dict(result)
 
-        # 2. 向量搜索
-        logger.info("🔍 步骤 2/6: 向量搜索...")
-        search_results = await vector_store.search(
-            vector=query_vector,
-            limit=top_k,
-            department_id=department_id,
+    async def stream_query(
+        self,
+        question: str,
+        department_id: int,
+        history: Optional[List[Dict[str, str]]] = None,
+        top_k: int = 5,
+        conversation_key: Optional[str] = None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式执行 RAG 查询
+
+        检索完成后立即产出来源文档，随后逐个转发 LLM token，最后产出耗时统计。
+        相同的并发请求共享同一个生成过程，后加入的请求先回放已产生的事件
+
+        Yields:
+            (事件名, 数据) 元组，事件名依次为 sources、token（多次）、done
+        """
+        def start():
+            return self._stream_query(question, department_id, history, top_k, conversation_key)
+
+        if not settings.single_flight_enabled:
+            events = start()
+        else:
+            events = self.stream_flights.stream(
+                _flight_key(question, department_id, history, top_k, conversation_key), start
+            )
+        try:
+            async for event in events:
+                yield event
+        finally:
+            # 调用方提前关闭时立即退出订阅，所有订阅者都离开后后台生成随之取消
+            await events.aclose()
+
+    async def _query(
+        self,
+        question: str,
+        department_id: int,
+        history: Optional[List[Dict[str, str]]],
+        top_k: int,
+        conversation_key: Optional[str],
+    ) -> Dict[str, Any]:
+        """执行一次完整的 RAG 查询"""
+        prepared = await self._prepare(
+            question, department_id, history, top_k, conversation_key
+        )
+        if prepared.answer is not None:
+            self._finish(prepared, prepared.answer)
+            return prepared.result(prepared.answer)
+
+        # 6. 生成回答
+        with prepared.timer.span("llm"):
+            response = await self.llm.ainvoke(prepared.prompt)
+        self._finish(prepared, response.content)
+
+        await self._remember(prepared, response.content)
+        return prepared.result(response.content)
+
+    async def _stream_query(
+        self,
+        question: str,
+        department_id: int,
+        history: Optional[List[Dict[str, str]]],
+        top_k: int,
+        conversation_key: Optional[str],
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """执行一次完整的流式 RAG 查询"""
+        prepared = await self._prepare(
+            question, department_id, history, top_k, conversation_key
+        )
+        yield "sources", {"sources": prepared.sources, "timings": dict(prepared.timings)}
+
+        if prepared.answer is not None:
+            yield "token", {"content": prepared.answer}
+            self._finish(prepared, prepared.answer)
+            done = {"timings": prepared.timings, "cached": prepared.cached}
+            if prepared.suggestions is not None:
+                done["suggestions"] = prepared.suggestions
+            yield "done", done
+            return
+
+        timer = prepared.timer
+        llm_start = time.perf_counter()
+        parts = []
+        stream = self.llm.astream(prepared.prompt)
+        try:
+            with timer.cancellable("llm"):
+                async for chunk in stream:
+                    if not chunk.content:
+                        continue
+                    if "first_token_ms" not in prepared.timings:
+                        timer.record("first_token", _elapsed_ms(llm_start))
+                    parts.append(chunk.content)
+                    yield "token", {"content": chunk.content}
+        finally:
+            # 提前关闭时立即关闭上游流，释放 LLM 连接
+            await stream.aclose()
+
+        timer.record("llm", _elapsed_ms(llm_start))
+        answer = "".join(parts)
+        self._finish(prepared, answer)
+        await self._remember(prepared, answer)
+        yield "done", {"timings": prepared.timings, "cached": False}
+
+    async def batch_query(
+        self,
+        questions: List[str],
+        department_id: int,
+        top_k: int = 5,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        批量执行 RAG 查询
+
+        所有问题共用一次批量向量化和一次多向量检索，随后在 concurrency（默认 query_batch_concurrency）
+        限制下并发调用 LLM。单个问题生成失败不影响其余问题，失败项带 error 字段
+
+        Args:
+            questions: 问题列表
+            department_id: 部门ID（用于权限过滤）
+            top_k: 每个问题返回的文档数量
+            concurrency: LLM 并发数（接口层按取得的准入额度数传入）
+
+        Returns:
+            {"results": 与 questions 一一对应的结果列表, "timings": 批次各阶段耗时}
+        """
+        started_at = time.perf_counter()
+        logger.info(f"📦 批量查询开始 | 问题数: {len(questions)} | 部门ID: {department_id}")
+
+        # 1. 一次批量向量化
+        vectors = await self._embed_many(questions)
+        timings = {"embedding_ms": _elapsed_ms(started_at)}
+
+        # 答案缓存命中的问题跳过检索和生成
+        prepared: List[Optional[PreparedQuery]] = [None] * len(questions)
+        pending = []
+        for i, (question, vector) in enumerate(zip(questions, vectors)):
+            if settings.answer_cache_enabled:
+                cached = await answer_cache.lookup(department_id, top_k, vector)
+                if cached is not None:
+                    prepared[i] = PreparedQuery(
+                        prompt="", sources=cached.sources, question=question,
+                        answer=cached.answer, answer_path="answer_cache",
+                    )
+                    continue
+            pending.append(i)
+
+        # 2. 一次多向量检索，3-5. 逐个构建提示词
+        retrieval_start = time.perf_counter()
+        search_results = await self._retrieve_many(
+            [questions[i] for i in pending],
+            [vectors[i] for i in pending],
+            department_id,
+            top_k,
         )
-        logger.info(f"✅ 搜索完成，找到 {len(search_results)} 个相关文档")
+        timings["retrieval_ms"] = _elapsed_ms(retrieval_start)
+        for i, results in zip(pending, search_results):
+            no_context = self._no_context(questions[i], results)
+            if no_context is not None:
+                prepared[i] = no_context
+                continue
+            results = self._select_relevant(questions[i], results)
+            prompt = await self._compose_prompt(
+                questions[i], results, None, None, StageTimer({}), vectors[i]
+            )
+            prepared[i] = PreparedQuery(
+                prompt=prompt,
+                sources=self._build_sources(results),
+                cache_scope=(department_id, top_k) if settings.answer_cache_enabled else None,
+                question=questions[i],
+                query_vector=vectors[i],
+            )
 
-        # 打印搜索结果详情
+        # 6. 并发生成回答
+        llm_start = time.perf_counter()
+        semaphore = asyncio.Semaphore(max(concurrency or settings.query_batch_concurrency, 1))
+
+        async def generate(item: PreparedQuery) -> Dict[str, Any]:
+            if item.answer is not None:
+                return {"question": item.question, **item.result(item.answer)}
+            try:
+                async with semaphore:
+                    response = await self.llm.ainvoke(item.prompt)
+            except Exception as e:
+                logger.error(f"❌ 批量查询中的问题生成失败: {item.question[:50]} | {str(e)}")
+                return {"question": item.question, **item.result(None), "error": str(e)}
+            await self._remember(item, response.content)
+            return {"question": item.question, **item.result(response.content)}
+
+        results = await asyncio.gather(*(generate(item) for item in prepared))
+        timings["llm_ms"] = _elapsed_ms(llm_start)
+        timings["total_ms"] = _elapsed_ms(started_at)
+        logger.info(
+            f"✅ 批量查询完成 | 问题数: {len(questions)} | 缓存命中: {len(questions) - len(pending)} | "
+            f"耗时: {timings['total_ms']}ms"
+        )
+        return {"results": results, "timings": timings}
+
+    async def _prepare(
+        self,
+        question: str,
+        department_id: int,
+        history: Optional[List[Dict[str, str]]],
+        top_k: int,
+        conversation_key: Optional[str] = None,
+    ) -> PreparedQuery:
+        """执行向量化、检索并构建提示词（步骤 1-5）"""
+        started_at = time.perf_counter()
+        timings: Dict[str, Any] = {}
+        timer = StageTimer(timings)
+        logger.debug(
+            "RAG 查询开始 | 部门ID: {} | top_k: {} | 问题: {}", department_id, top_k, question
+        )
+
+        # 0. 寒暄、致谢、询问能力等闲聊直接给出固定回答，不做向量化和检索（对话中途只判断致谢和道别）
+        if settings.intent_router_enabled:
+            with timer.span("route"):
+                intent = intent_router.route(question, history)
+            if intent is not None:
+                return PreparedQuery(
+                    prompt="",
+                    sources=[],
+                    timings=timings,
+                    started_at=started_at,
+                    answer=intent.answer,
+                    answer_path="intent",
+                    intent=intent.name,
+                    department_id=department_id,
+                )
+
+        # 1. 对问题进行向量化
+        with timer.span("embed"):
+            query_vector = await self._embed_query(question)
+
+        # 带对话历史的问题依赖上下文，不参与答案缓存
+        cache_scope = None
+        if settings.answer_cache_enabled and not history:
+            cache_scope = (department_id, top_k)
+            cached = await answer_cache.lookup(department_id, top_k, query_vector)
+            if cached is not None:
+                logger.info("⚡ 命中答案缓存 (相似度: {:.4f})，跳过检索和生成", cached.similarity)
+                timings["retrieval_ms"] = _elapsed_ms(started_at)
+                return PreparedQuery(
+                    prompt="",
+                    sources=cached.sources,
+                    timings=timings,
+                    started_at=started_at,
+                    answer=cached.answer,
+                    answer_path="answer_cache",
+                    department_id=department_id,
+                )
+
+        # 2. 检索（会话中的追问可复用上一轮的检索结果）
+        with timer.span("search"):
+            search_results = await self._retrieve_in_conversation(
+                question, query_vector, department_id, top_k, history, conversation_key, timings
+            )
+        timings["retrieval_ms"] = _elapsed_ms(started_at)
         if search_results:
-            logger.info("📄 搜索结果详情:")
-            for i, r in enumerate(search_results, 1):
-                score = r.get("score", 0)
-                filename = r["payload"].get("filename", "未知文件")
-                content = r["payload"].get("content", "")
-                logger.info(f"  [{i}] {filename} (相似度: {score:.4f})")
-                logger.info(f"      内容预览: {content[:100]}...")
+            logger.opt(lazy=True).debug(
+                "检索到 {} 个相关分块:\n{}",
+                lambda: len(search_results),
+                lambda: _preview_results(search_results),
+            )
         else:
-            logger.warning("⚠️  未找到任何相关文档")
-
-        # 3. 构建上下文
-        logger.info("📝 步骤 3/6: 构建上下文...")
-        context = self._build_context(search_results)
-        logger.info(f"✅ 上下文构建完成，长度: {len(context)} 字符")
-        logger.debug(f"📖 上下文内容:\n{context}")
-
-        # 4. 构建历史上下文
-        logger.info("💬 步骤 4/6: 构建历史上下文...")
-        history_context = self._build_history_context(history or [])
-        if history_context:
-            logger.info(f"✅ 历史上下文构建完成，轮数: {len(history or [])}")
-            logger.debug(f"📖 历史内容:\n{history_context}")
+            logger.warning("⚠️  未找到任何相关文档 | 部门ID: {}", department_id)
+
+        # 带对话历史的追问可能只靠历史就能回答，不走快速返回
+        no_context = None if history else self._no_context(question, search_results)
+        if no_context is not None:
+            no_context.timings = timings
+            no_context.started_at = started_at
+            no_context.department_id = department_id
+            return no_context
+        search_results = self._select_relevant(question, search_results)
+
+        prompt = await self._compose_prompt(
+            question, search_results, history, conversation_key, timer, query_vector
+        )
+
+        return PreparedQuery(
+            prompt=prompt,
+            sources=self._build_sources(search_results),
+            timings=timings,
+            started_at=started_at,
+            cache_scope=cache_scope,
+            question=question,
+            query_vector=query_vector,
+            department_id=department_id,
+        )
+
+    async def _compose_prompt(
+        self,
+        question: str,
+        search_results: List[Dict[str, Any]],
+        history: Optional[List[Dict[str, str]]],
+        conversation_key: Optional[str],
+        timer: StageTimer,
+        query_vector: Optional[List[float]] = None,
+    ) -> str:
+        """压缩并打包上下文、构建历史窗口并生成提示词（步骤 3-5），耗时与统计项写入 timer.timings"""
+        # 3. 抽取与问题相关的句子（可选），构建上下文
+        if settings.context_compression_enabled and query_vector is not None and search_results:
+            with timer.span("compress"):
+                compressed = await context_compressor.compress(
+                    search_results,
+                    query_vector,
+                    # 句子向量都是一次性的，不经过问题向量缓存，以免挤掉缓存的问题向量
+                    embed=self.embedding_service.embed_texts,
+                    max_tokens=settings.context_compression_max_tokens,
+                    neighbors=settings.context_compression_neighbors,
+                )
+            search_results = compressed.results
+            timer.timings.update(compressed.stats)
+
+        with timer.span("context"):
+            packed = context_packer.pack(search_results, max_tokens=settings.context_max_tokens)
+        timer.timings.update(packed.stats)
+        logger.debug("上下文内容:\n{}", packed.text)
+
+        # 4-5. 构建历史上下文和提示词
+        with timer.span("prompt"):
+            window = await conversation_history.build(
+                history or [], conversation_key=conversation_key, llm=self.llm
+            )
+            prompt = self._build_prompt(question, packed.text, window.text)
+        if window.text:
+            timer.timings.update(window.stats)
+        logger.debug("完整提示词:\n{}", prompt)
+
+        return prompt
+
+    def _finish(self, prepared: PreparedQuery, answer: str):
+        """记录总耗时并输出一条查询摘要日志"""
+        total_ms = _elapsed_ms(prepared.started_at)
+        prepared.timings["total_ms"] = total_ms
+        stage_latency.observe(total_ms, stage="total", path=prepared.answer_path)
+        logger.info(
+            "RAG 查询完成 | 部门ID: {} | 意图: {} | 来源: {} | 答案来源: {} | 耗时: {}",
+            prepared.department_id, prepared.intent, len(prepared.sources),
+            prepared.answer_path, prepared.timings,
+        )
+        logger.opt(lazy=True).debug("回答内容: {}", lambda: _preview(answer, 500))
+
+    def _is_relevant(
+        self,
+        result: Dict[str, Any],
+        question_has_identifier: bool,
+        threshold: float,
+    ) -> bool:
+        """检索结果是否足够相关
+
+        向量命中按当前向量模型的相关度阈值判断；仅词法命中时，只有问题包含错误码、SKU 等
+        标识符才视为相关（中文二元词元的 OR 匹配过于宽松，单独命中不能说明相关）
+        """
+        retrievers = result.get("retrievers", ["vector"])
+        if "vector" in retrievers and result.get("score", 0) >= threshold:
+            return True
+        return "lexical" in retrievers and question_has_identifier
+
+    def _select_relevant(
+        self,
+        question: str,
+        search_results: List[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """过滤掉相关度不足的检索结果"""
+        question_has_identifier = has_identifier(question)
+        # relevance_threshold 每次读取都要解析配置，每次过滤只取一次
+        threshold = settings.relevance_threshold
+        return [r for r in search_results if self._is_relevant(r, question_has_identifier, threshold)]
+
+    def _no_context(
+        self,
+        question: str,
+        search_results: List[Dict[str, Any]],
+    ) -> Optional[PreparedQuery]:
+        """没有任何相关结果时直接给出模板答案，不调用 LLM
+
+        相关度不足的结果中排名靠前的文档作为推荐返回
+        """
+        if not settings.no_context_fast_path_enabled:
+            return None
+        if self._select_relevant(question, search_results):
+            return None
+
+        suggestions = []
+        seen = set()
+        for r in search_results:
+            if len(suggestions) >= settings.no_context_suggestions:
+                break
+            document_id = r["payload"].get("document_id")
+            if document_id is None or document_id in seen:
+                continue
+            seen.add(document_id)
+            suggestions.append({
+                "document_id": document_id,
+                "filename": r["payload"].get("filename", ""),
+            })
+
+        no_context_answers.inc()
+        logger.info(
+            "未检索到相关内容，跳过 LLM | 候选: {} | 最高相似度: {}",
+            len(search_results),
+            max((r.get("score", 0) for r in search_results), default=None),
+        )
+        answer = NO_CONTEXT_ANSWER
+        if suggestions:
+            answer += NO_CONTEXT_SUGGESTIONS.format(
+                documents="\n".join(f"- {s['filename']}" for s in suggestions)
+            )
+        return PreparedQuery(
+            prompt="",
+            sources=[],
+            question=question,
+            answer=answer,
+            answer_path="no_context",
+            suggestions=suggestions,
+        )
+
+    async def _retrieve_in_conversation(
+        self,
+        question: str,
+        query_vector: List[float],
+        department_id: int,
+        top_k: int,
+        history: Optional[List[Dict[str, str]]],
+        conversation_key: Optional[str],
+        timings: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        """会话中的检索：追问与上一轮问题足够相近时复用（或补充）上一轮的检索结果"""
+        if not (settings.retrieval_carryover_enabled and conversation_key):
+            return await self._retrieve(question, query_vector, department_id, top_k)
+
+        carry_over = None
+        if history:
+            carry_over = await retrieval_memory.lookup(
+                conversation_key, query_vector, department_id, top_k
+            )
+
+        anchor_vector = query_vector
+        if carry_over is None:
+            results = await self._retrieve(question, query_vector, department_id, top_k)
+        elif carry_over.outcome == "reuse":
+            results, anchor_vector = carry_over.results, carry_over.anchor_vector
         else:
-            logger.info("✅ 无对话历史")
+            # 上一轮的结果在前，补充的纯向量检索结果去重后追加，合并后仍取 top_k
+            fresh = await self._vector_search(
+                query_vector, settings.retrieval_carryover_augment_k, department_id
+            )
+            results = carry_over.results[:top_k]
+            seen = {r["id"] for r in results}
+            results = (results + [r for r in fresh if r["id"] not in seen])[:top_k]
 
-        # 5. 构建提示词
-        logger.info("✍️  步骤 5/6: 构建提示词...")
-        prompt = f"""你是一个专业的企业知识库助手。请基于以下上下文信息回答用户问题。
+        if carry_over is not None:
+            timings["retrieval_carryover"] = carry_over.outcome
+            logger.debug(
+                "复用上一轮检索结果 | 方式: {} | 问题相似度: {:.4f}",
+                carry_over.outcome, carry_over.similarity,
+            )
+        await retrieval_memory.remember(
+            conversation_key, anchor_vector, department_id, top_k, list(results)
+        )
+        return results
+
+    async def _retrieve(
+        self,
+        question: str,
+        query_vector: List[float],
+        department_id: int,
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        """检索相关分块
+
+        启用混合检索时，向量检索与词法检索并发执行，结果经 RRF 融合后取 top_k。
+        词法检索超时或失败时退化为纯向量检索，融合后的检索耗时不超过
+        max(向量检索耗时, hybrid_lexical_timeout_ms)
+        """
+        if not settings.hybrid_search_enabled:
+            return await self._vector_search(query_vector, top_k, department_id)
+
+        vector_results, lexical_results = await asyncio.gather(
+            self._vector_search(
+                query_vector, max(top_k, settings.hybrid_vector_k), department_id
+            ),
+            self._lexical_search(question, department_id, max(top_k, settings.hybrid_lexical_k)),
+        )
+        logger.debug("混合检索 | 向量: {} | 词法: {}", len(vector_results), len(lexical_results))
+        return self._fuse(vector_results, lexical_results, top_k)
+
+    async def _vector_search(
+        self,
+        query_vector: List[float],
+        limit: int,
+        department_id: int,
+    ) -> List[Dict[str, Any]]:
+        """向量检索，启用两阶段检索时先经文档级索引筛选候选文档"""
+        if settings.hierarchical_search_enabled:
+            return await vector_store.search_hierarchical(
+                query_vector,
+                limit=limit,
+                department_id=department_id,
+                top_documents=settings.hierarchical_top_documents,
+            )
+        return await vector_store.search(
+            vector=query_vector,
+            limit=limit,
+            department_id=department_id,
+        )
+
+    async def _vector_search_many(
+        self,
+        vectors: List[List[float]],
+        limit: int,
+        department_id: int,
+    ) -> List[List[Dict[str, Any]]]:
+        """批量向量检索，启用两阶段检索时先经文档级索引筛选候选文档"""
+        if settings.hierarchical_search_enabled:
+            return await vector_store.search_hierarchical_many(
+                vectors,
+                limit=limit,
+                department_id=department_id,
+                top_documents=settings.hierarchical_top_documents,
+            )
+        return await vector_store.search_many(
+            vectors=vectors,
+            limit=limit,
+            department_id=department_id,
+        )
+
+    def _fuse(
+        self,
+        vector_results: List[Dict[str, Any]],
+        lexical_results: List[Dict[str, Any]],
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        """按配置的权重对两路检索结果做 RRF 融合"""
+        return reciprocal_rank_fusion(
+            {"vector": vector_results, "lexical": lexical_results},
+            weights={
+                "vector": settings.hybrid_vector_weight,
+                "lexical": settings.hybrid_lexical_weight,
+            },
+            rrf_k=settings.hybrid_rrf_k,
+            limit=top_k,
+        )
+
+    async def _lexical_search(
+        self,
+        question: str,
+        department_id: int,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """带超时预算的词法检索，失败时返回空列表"""
+        try:
+            return await asyncio.wait_for(
+                lexical_searcher.search(question, department_id, limit),
+                timeout=settings.hybrid_lexical_timeout_ms / 1000,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️  词法检索超过 {settings.hybrid_lexical_timeout_ms}ms，仅使用向量检索结果")
+        except Exception as e:
+            logger.warning(f"⚠️  词法检索失败，仅使用向量检索结果: {str(e)}")
+        return []
+
+    async def _retrieve_many(
+        self,
+        questions: List[str],
+        vectors: List[List[float]],
+        department_id: int,
+        top_k: int,
+    ) -> List[List[Dict[str, Any]]]:
+        """批量检索：一次多向量查询，启用混合检索时并发执行一次批量词法检索后逐个融合"""
+        if not questions:
+            return []
+        if not settings.hybrid_search_enabled:
+            return await self._vector_search_many(vectors, top_k, department_id)
+
+        vector_results, lexical_results = await asyncio.gather(
+            self._vector_search_many(
+                vectors, max(top_k, settings.hybrid_vector_k), department_id
+            ),
+            self._lexical_search_many(
+                questions, department_id, max(top_k, settings.hybrid_lexical_k)
+            ),
+        )
+        return [
+            self._fuse(vector_hits, lexical_hits, top_k)
+            for vector_hits, lexical_hits in zip(vector_results, lexical_results)
+        ]
+
+    async def _lexical_search_many(
+        self,
+        questions: List[str],
+        department_id: int,
+        limit: int,
+    ) -> List[List[Dict[str, Any]]]:
+        """批量词法检索，延迟预算按问题数放大，失败时全部退化为纯向量检索"""
+        timeout_ms = settings.hybrid_lexical_timeout_ms * len(questions)
+        try:
+            return await asyncio.wait_for(
+                lexical_searcher.search_many(questions, department_id, limit),
+                timeout=timeout_ms / 1000,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️  批量词法检索超过 {timeout_ms}ms，仅使用向量检索结果")
+        except Exception as e:
+            logger.warning(f"⚠️  批量词法检索失败，仅使用向量检索结果: {str(e)}")
+        return [[] for _ in questions]
+
+    async def _embed_query(self, question: str) -> List[float]:
+        """问题向量化，优先读取查询向量缓存"""
+        if not settings.embedding_cache_enabled:
+            return await self.embedding_service.embed_query(question)
+
+        vector = await embedding_cache.get(question)
+        if vector is not None:
+            logger.debug("命中查询向量缓存")
+            return vector
+        vector = await self.embedding_service.embed_query(question)
+        await embedding_cache.set(question, vector)
+        return vector
+
+    async def _embed_many(self, questions: List[str]) -> List[List[float]]:
+        """批量向量化，缓存未命中的问题合并为一次 embed_texts 调用"""
+        if not settings.embedding_cache_enabled:
+            return await self.embedding_service.embed_texts(questions)
+
+        vectors = await embedding_cache.get_many(questions)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = await self.embedding_service.embed_texts([questions[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+            await embedding_cache.set_many([questions[i] for i in missing], embedded)
+        logger.debug("⚡ 批量向量化 | 缓存命中: {} | 调用: {}", len(questions) - len(missing), len(missing))
+        return vectors
+
+    async def _remember(self, prepared: PreparedQuery, answer: str):
+        """将生成的答案写入答案缓存"""
+        if prepared.cache_scope is None or not answer:
+            return
+        department_id, top_k = prepared.cache_scope
+        await answer_cache.store(
+            department_id=department_id,
+            top_k=top_k,
+            question=prepared.question,
+            vector=prepared.query_vector,
+            answer=answer,
+            sources=prepared.sources,
+        )
+
+    def _build_prompt(self, question: str, context: str, history_context: str) -> str:
+        """构建 RAG 提示词"""
+        return f"""你是一个专业的企业知识库助手。请基于以下上下文信息回答用户问题。
 
 {history_context}
 
@@ -112,50 +873,18 @@ class RAGService:
 4. 可以引用具体的文档内容
 
 请用中文回答："""
-        logger.info(f"✅ 提示词构建完成，长度: {len(prompt)} 字符")
-        logger.debug(f"📖 完整提示词:\n{prompt}")
 
-        # 6. 生成回答
-        logger.info("🤖 步骤 6/6: 调用 LLM 生成回答...")
-        response = await self.llm.ainvoke(prompt)
-        logger.info("✅ LLM 回答生成完成")
-        logger.info(f"💡 回答内容: {response.content}")
-        logger.info("=" * 60)
-
-        return {
-            "answer": response.content,
-            "sources": [
-                {
-                    "document_id": r["payload"]["document_id"],
-                    "chunk_id": r["payload"]["chunk_id"],
-                    "filename": r["payload"]["filename"],
-                    "score": r["score"],
-                }
-                for r in search_results
-            ],
-        }
-
-    def _build_context(self, search_results: List[Dict[str, Any]]) -> str:
-        """构建上下文字符串"""
-        if not search_results:
-            return "知识库中没有找到相关信息"
-        contexts = []
-        for r in search_results:
-            content = r["payload"].get("content", "")
-            filename = r["payload"].get("filename", "")
-            contexts.append(f"【{filename}】\n{content}")
-        return "\n\n".join(contexts)
-
-    def _build_history_context(self, history: List[Dict[str, str]]) -> str:
-        """构建对话历史上下文"""
-        if not history:
-            return ""
-        lines = ["对话历史："]
-        for msg in history:
-            role = "用户" if msg.get("role") == "user" else "助手"
-            content = msg.get("content", "")
-            lines.append(f"{role}：{content}")
-        return "\n".join(lines)
+    def _build_sources(self, search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """构建返回给客户端的来源文档列表"""
+        return [
+            {
+                "document_id": r["payload"]["document_id"],
+                "chunk_id": r["payload"]["chunk_id"],
+                "filename": r["payload"]["filename"],
+                "score": r["score"],
+            }
+            for r in search_results
+        ]
 
 
 # 全局实例
@@ -0,0 +1,240 @@
+"""
+检索结果延续 - 会话中的追问复用上一轮的检索结果
+
+"第二点呢？"这类追问每次都从头检索，而相关分块上一轮刚检索过。按会话缓存每一轮的
+检索结果和问题向量（进程内 LRU + Redis 共享层），下一轮比较新旧问题向量的余弦相似度：
+- 不低于 reuse_similarity：直接复用上一轮的结果，不做检索
+- 不低于 augment_similarity：复用上一轮的结果，并补充一次小规模的纯向量检索
+- 否则：完整检索
+
+缓存条目只在同一部门、同一 top_k 下复用。复用时保留产生这批结果的问题向量，避免连续复用时逐轮漂移。
+
+失效策略：文档重新写入或删除、部门向量删除时记录变更时间（进程内 + Redis），
+条目中任一结果所属文档或所在部门在条目写入之后有变更时不再复用。
+"""
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis import RedisCircuitBreaker, get_redis
+
+KEY_PREFIX = "askit:retrieval_memory"
+
+carry_over_lookups = metrics.counter(
+    "rag_retrieval_carryover_total", "会话检索结果延续的判定次数（reuse / augment / miss）"
+)
+carry_over_hit_ratio = metrics.gauge(
+    "rag_retrieval_carryover_hit_ratio", "会话追问复用上一轮检索结果（reuse + augment）的比例"
+)
+
+
+@dataclass
+class CarryOver:
+    """上一轮的检索结果及判定"""
+
+    outcome: str                          # reuse / augment
+    results: List[Dict[str, Any]]
+    similarity: float
+    anchor_vector: List[float]            # 产生这批结果的问题向量
+
+
+class RetrievalMemory:
+    """按会话缓存检索结果"""
+
+    def __init__(
+        self,
+        reuse_similarity: float = 0.9,
+        augment_similarity: float = 0.75,
+        max_entries: int = 1024,
+        ttl_seconds: int = 3600,
+        redis_client=None,
+    ):
+        """
+        Args:
+            reuse_similarity: 直接复用上一轮结果的问题向量相似度阈值
+            augment_similarity: 复用并补充检索的问题向量相似度阈值
+            max_entries: 进程内缓存的会话条数
+            ttl_seconds: 缓存有效期（秒）
+            redis_client: 异步 Redis 客户端，为 None 时仅使用进程内缓存
+        """
+        self.reuse_similarity = reuse_similarity
+        self.augment_similarity = augment_similarity
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self._breaker = RedisCircuitBreaker("检索结果延续")
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._changed: Dict[str, float] = {}  # 变更标记键 → 变更时间
+
+    async def lookup(
+        self,
+        conversation_key: str,
+        query_vector: List[float],
+        department_id: int,
+        top_k: int,
+    ) -> Optional[CarryOver]:
+        """判断能否复用上一轮的检索结果，不能复用时返回 None"""
+        entry = await self._get(conversation_key)
+        if entry and await self._is_stale(entry):
+            # 进程内副本也丢弃，其他 worker 之后写入的新结果从 Redis 读取
+            self._local.pop(conversation_key, None)
+            entry = None
+        carry_over = None
+        if entry and entry["department_id"] == department_id and entry["top_k"] == top_k:
+            similarity = _cosine(entry["vector"], query_vector)
+            if similarity >= self.reuse_similarity:
+                carry_over = CarryOver("reuse", entry["results"], similarity, entry["vector"])
+            elif similarity >= self.augment_similarity:
+                carry_over = CarryOver("augment", entry["results"], similarity, entry["vector"])
+
+        carry_over_lookups.inc(outcome=carry_over.outcome if carry_over else "miss")
+        carry_over_hit_ratio.set(self.stats()["hit_ratio"])
+        return carry_over
+
+    async def remember(
+        self,
+        conversation_key: str,
+        query_vector: List[float],
+        department_id: int,
+        top_k: int,
+        results: List[Dict[str, Any]],
+    ):
+        """记录本轮的检索结果"""
+        await self._set(conversation_key, {
+            "vector": [float(v) for v in query_vector],
+            "department_id": department_id,
+            "top_k": top_k,
+            "results": results,
+            "stored_at": time.time(),
+        })
+
+    async def invalidate_documents(self, document_ids: Iterable[Any]):
+        """文档重新写入或删除后调用，引用这些文档的会话结果不再复用"""
+        await self._mark([_document_marker(d) for d in set(document_ids) if d is not None])
+
+    async def invalidate_department(self, department_id: int):
+        """部门向量删除后调用，该部门的会话结果不再复用"""
+        await self._mark([_department_marker(department_id)])
+
+    def stats(self) -> Dict[str, float]:
+        """复用统计"""
+        reused = carry_over_lookups.value(outcome="reuse")
+        augmented = carry_over_lookups.value(outcome="augment")
+        misses = carry_over_lookups.value(outcome="miss")
+        total = reused + augmented + misses
+        return {
+            "reuse": reused,
+            "augment": augmented,
+            "miss": misses,
+            "hit_ratio": round((reused + augmented) / total, 4) if total else 0.0,
+        }
+
+    async def _mark(self, markers: List[str]):
+        """记录变更时间，标记保留 ttl_seconds（更早写入的条目已过期）"""
+        if not markers:
+            return
+        now = time.time()
+        for marker in [m for m, at in self._changed.items() if now - at > self.ttl_seconds]:
+            del self._changed[marker]
+        for marker in markers:
+            self._changed[marker] = now
+
+        if self.redis is None or not self._breaker.available:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for marker in markers:
+                    pipe.set(f"{KEY_PREFIX}:{marker}", str(now), ex=self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            self._breaker.record_failure(e)
+
+    async def _is_stale(self, entry: Dict[str, Any]) -> bool:
+        """条目写入之后，其结果所属的文档或部门是否有变更"""
+        stored_at = entry.get("stored_at", 0.0)
+        markers = [_department_marker(entry["department_id"])] + sorted({
+            _document_marker(document_id)
+            for document_id in ((r.get("payload") or {}).get("document_id") for r in entry["results"])
+            if document_id is not None
+        })
+        if any(self._changed.get(marker, 0.0) >= stored_at for marker in markers):
+            return True
+
+        if self.redis is None or not self._breaker.available:
+            return False
+        try:
+            changed = await self.redis.mget([f"{KEY_PREFIX}:{marker}" for marker in markers])
+        except Exception as e:
+            self._breaker.record_failure(e)
+            return False
+        return any(value is not None and float(value) >= stored_at for value in changed)
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._local.get(key)
+        if item is not None and time.time() - item[0] <= self.ttl_seconds:
+            self._local.move_to_end(key)
+            return item[1]
+
+        if self.redis is None or not self._breaker.available:
+            return None
+        try:
+            raw = await self.redis.get(f"{KEY_PREFIX}:{key}")
+        except Exception as e:
+            self._breaker.record_failure(e)
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._put_local(key, value)
+        return value
+
+    async def _set(self, key: str, value: Dict[str, Any]):
+        self._put_local(key, value)
+        if self.redis is None or not self._breaker.available:
+            return
+        try:
+            await self.redis.set(
+                f"{KEY_PREFIX}:{key}",
+                json.dumps(value, ensure_ascii=False, default=str),
+                ex=self.ttl_seconds,
+            )
+        except Exception as e:
+            self._breaker.record_failure(e)
+
+    def _put_local(self, key: str, value: Dict[str, Any]):
+        self._local[key] = (time.time(), value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+def _document_marker(document_id: Any) -> str:
+    return f"changed:document:{document_id}"
+
+
+def _department_marker(department_id: Any) -> str:
+    return f"changed:department:{department_id}"
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    va = np.asarray(a, dtype=np.float32)
+    vb = np.asarray(b, dtype=np.float32)
+    if va.shape != vb.shape:
+        return 0.0
+    denominator = float(np.linalg.norm(va) * np.linalg.norm(vb))
+    return float(va @ vb / denominator) if denominator else 0.0
+
+
+# 全局实例
+retrieval_memory = RetrievalMemory(
+    reuse_similarity=settings.retrieval_carryover_reuse_similarity,
+    augment_similarity=settings.retrieval_carryover_augment_similarity,
+    ttl_seconds=settings.retrieval_carryover_ttl_seconds,
+    redis_client=get_redis(),
+)
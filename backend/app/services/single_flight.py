@@ -0,0 +1,127 @@
+"""
+请求合并（single-flight）- 相同的并发请求只计算一次
+
+公告发出后同一部门会在几秒内集中出现大量相同的问题。以请求键合并并发请求：
+首个请求在后台任务中执行计算，同键的并发请求等待同一个任务
+- do(): 普通请求，所有等待者共享返回值或异常
+- stream(): 流式请求，事件写入缓冲区，后加入的订阅者先回放已产生的事件再跟随新事件
+
+计算结束后立即移除键，之后的同键请求重新计算（跨时间的结果复用由答案缓存负责）。
+所有等待者都离开时取消后台计算。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.core.metrics import metrics
+
+fan_in = metrics.histogram(
+    "single_flight_fan_in",
+    "单次计算合并的请求数（按类型）",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+coalesced_requests = metrics.counter(
+    "single_flight_coalesced_total", "合并到进行中计算的请求数（按类型）"
+)
+
+
+class _Flight:
+    """一次进行中的计算"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.joined = 1                   # 合并的请求总数（含首个请求）
+        self.waiters = 0                  # 当前仍在等待的请求数
+        self.events: List[Any] = []       # 流式计算已产生的事件
+        self.changed = asyncio.Event()    # 有新事件或计算结束时触发
+
+
+class SingleFlight:
+    """按键合并并发请求"""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: 指标中的类型标签
+        """
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn()，同键的并发调用共享同一次执行的结果"""
+        flight = self._join(key, lambda _: fn())
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Any]],
+    ) -> AsyncIterator[Any]:
+        """迭代 factory() 产生的事件，同键的并发订阅共享同一个事件流"""
+        flight = self._join(key, lambda new_flight: self._pump(factory, new_flight))
+        flight.waiters += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.events):
+                    yield flight.events[index]
+                    index += 1
+                if flight.task.done():
+                    break
+                await flight.changed.wait()
+
+            if not flight.task.cancelled() and flight.task.exception() is not None:
+                raise flight.task.exception()
+        finally:
+            self._leave(key, flight)
+
+    def _join(self, key: str, start: Callable[[_Flight], Awaitable[Any]]) -> _Flight:
+        """加入同键的进行中计算，不存在时以 start(flight) 启动新的计算"""
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.joined += 1
+            coalesced_requests.inc(kind=self.name)
+            return flight
+
+        flight = _Flight()
+        self._flights[key] = flight
+        flight.task = asyncio.ensure_future(start(flight))
+        flight.task.add_done_callback(lambda _: self._finish(key, flight))
+        return flight
+
+    def _leave(self, key: str, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # 没有人等待结果了，取消计算；立即移除键，避免新请求加入已取消的计算
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    def _finish(self, key: str, flight: _Flight):
+        self._forget(key, flight)
+        fan_in.observe(flight.joined, kind=self.name)
+        # 读取异常，避免等待者都已离开时出现 "exception was never retrieved" 警告
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _pump(self, factory: Callable[[], AsyncIterator[Any]], flight: _Flight):
+        """在后台任务中消费事件流，写入缓冲区并通知订阅者"""
+        try:
+            async for event in factory():
+                flight.events.append(event)
+                self._notify(flight)
+        finally:
+            self._notify(flight)
+
+    def _notify(self, flight: _Flight):
+        changed, flight.changed = flight.changed, asyncio.Event()
+        changed.set()
@@ -0,0 +1,270 @@
+"""
+分片向量检索 - 按 document_id 哈希分区到多个 Chroma 实例，检索时并发分发再合并
+
+单个 Chroma 节点同时限制了索引规模和查询 QPS。分片模式（CHROMA_MODE=sharded）下：
+- 写入按 document_id 的稳定哈希（crc32）路由到某一个分片，同一文档的分块和文档级向量落在同一分片
+- 检索并发发往所有分片，每个分片有独立的超时；各分片的 top-k 结果按距离用堆合并
+- 每个分片有自己的有界线程池。超时的调用无法取消，会继续占用该分片的线程；线程全部占满的分片
+  在后续检索中直接跳过，慢分片只会拖住自己的线程，不会让健康分片的检索排队
+- 超时、出错或线程已占满的分片被跳过，返回其余分片的部分结果并计数；所有分片都失败时抛出异常
+- 按 id 读取、删除和计数分发到所有分片
+
+ShardedClient / ShardedCollection 实现 VectorStore 用到的 Chroma 客户端/集合接口，分片可以是
+远程 Chroma（http://host:port）或本地 PersistentClient 目录
+"""
+import heapq
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from app.core.metrics import metrics
+
+shard_latency = metrics.histogram("vector_shard_query_ms", "分片检索耗时（毫秒，按分片）")
+shard_failures = metrics.counter("vector_shard_failures_total", "分片检索失败次数（按分片和原因）")
+partial_results = metrics.counter("vector_shard_partial_results_total", "因分片失败返回部分结果的检索次数")
+
+
+def shard_for(document_id: Any, shard_count: int) -> int:
+    """文档所在的分片序号（进程间稳定）"""
+    return zlib.crc32(str(document_id).encode("utf-8")) % shard_count
+
+
+def create_shard_client(location: str):
+    """根据分片地址创建 Chroma 客户端：http(s)://host:port 为远程实例，其余视为本地持久化目录"""
+    import chromadb
+
+    if location.startswith(("http://", "https://")):
+        url = urlparse(location)
+        return chromadb.HttpClient(
+            host=url.hostname,
+            port=url.port or (443 if url.scheme == "https" else 8000),
+            ssl=url.scheme == "https",
+        )
+    return chromadb.PersistentClient(path=location)
+
+
+class ShardWorkers:
+    """一个分片专用的有界线程池，记录占用中的线程数"""
+
+    def __init__(self, index: int, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"vector-shard-{index}"
+        )
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """提交调用，线程全部被占用时排队等待"""
+        with self._lock:
+            self._busy += 1
+        return self._start(fn, *args, **kwargs)
+
+    def try_submit(self, fn, *args, **kwargs) -> Optional[Future]:
+        """线程全部被占用（通常是之前超时、仍在执行的检索）时不排队，返回 None"""
+        with self._lock:
+            if self._busy >= self.max_workers:
+                return None
+            self._busy += 1
+        return self._start(fn, *args, **kwargs)
+
+    def _start(self, fn, *args, **kwargs) -> Future:
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._busy -= 1
+
+
+class ShardedCollection:
+    """跨分片的同名集合"""
+
+    def __init__(self, name: str, shards: Sequence[Any], workers: Sequence[ShardWorkers], timeout_ms: int):
+        self.name = name
+        self.shards = list(shards)
+        self.timeout_ms = timeout_ms
+        self._workers = list(workers)
+
+    def add(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]], **kwargs):
+        self._write("add", ids, embeddings, metadatas, **kwargs)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]], **kwargs):
+        self._write("upsert", ids, embeddings, metadatas, **kwargs)
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, **kwargs) -> Dict[str, Any]:
+        """并发检索所有分片，按距离合并各分片的 top-k，跳过超时、出错或线程已占满的分片"""
+        futures = {}
+        for index, shard in enumerate(self.shards):
+            future = self._workers[index].try_submit(
+                self._timed_query, index, shard, query_embeddings, n_results, kwargs
+            )
+            if future is None:
+                shard_failures.inc(shard=str(index), reason="saturated")
+                continue
+            futures[future] = index
+        done, pending = wait(futures, timeout=self.timeout_ms / 1000) if futures else (set(), set())
+        for future in pending:
+            future.cancel()
+            shard_failures.inc(shard=str(futures[future]), reason="timeout")
+
+        responses = []
+        for future in done:
+            try:
+                responses.append(future.result())
+            except Exception as e:
+                shard_failures.inc(shard=str(futures[future]), reason="error")
+                logger.warning(f"⚠️ 向量分片 {futures[future]} 检索失败: {e}")
+        if not responses:
+            raise RuntimeError(f"所有向量分片检索失败（{len(self.shards)} 个分片）")
+        if len(responses) < len(self.shards):
+            partial_results.inc()
+            logger.warning(f"⚠️ 向量分片部分不可用，返回 {len(responses)}/{len(self.shards)} 个分片的结果")
+
+        merged: Dict[str, Any] = {"ids": [], "distances": [], "metadatas": []}
+        for i in range(len(query_embeddings)):
+            hits = heapq.merge(
+                *(
+                    zip(r["distances"][i], r["ids"][i], r["metadatas"][i])
+                    for r in responses if r.get("ids") and len(r["ids"]) > i
+                ),
+                key=lambda hit: hit[0],
+            )
+            top = list(islice(hits, n_results))
+            merged["ids"].append([row_id for _, row_id, _ in top])
+            merged["distances"].append([distance for distance, _, _ in top])
+            merged["metadatas"].append([metadata for _, _, metadata in top])
+        return merged
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """按 id 读取时查询所有分片；分页读取时按分片顺序拼接"""
+        if ids is not None:
+            return _concat([shard.get(ids=ids, **kwargs) for shard in self.shards])
+
+        parts = []
+        for shard in self.shards:
+            if limit is not None and limit <= 0:
+                break
+            size = shard.count()
+            if offset >= size:
+                offset -= size
+                continue
+            part = shard.get(limit=limit, offset=offset, **kwargs)
+            parts.append(part)
+            offset = 0
+            if limit is not None:
+                limit -= len(part.get("ids") or [])
+        return _concat(parts)
+
+    def delete(self, **kwargs):
+        self._each("delete", **kwargs)
+
+    def count(self) -> int:
+        return sum(self._each("count"))
+
+    def _timed_query(self, index: int, shard, query_embeddings, n_results, kwargs) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            return shard.query(query_embeddings=query_embeddings, n_results=n_results, **kwargs)
+        finally:
+            shard_latency.observe(round((time.perf_counter() - start) * 1000, 2), shard=str(index))
+
+    def _write(self, operation: str, ids, embeddings, metadatas, **kwargs):
+        """按 document_id 分组后并发写入各分片（没有 document_id 时按分块 id 哈希）"""
+        groups: Dict[int, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            key = (metadata or {}).get("document_id", ids[i])
+            groups.setdefault(shard_for(key, len(self.shards)), []).append(i)
+        futures = [
+            self._workers[index].submit(
+                getattr(self.shards[index], operation),
+                ids=[ids[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions],
+                metadatas=[metadatas[i] for i in positions],
+                **kwargs,
+            )
+            for index, positions in groups.items()
+        ]
+        _wait_all(futures)
+
+    def _each(self, operation: str, **kwargs) -> List[Any]:
+        futures = [
+            workers.submit(getattr(shard, operation), **kwargs)
+            for workers, shard in zip(self._workers, self.shards)
+        ]
+        return _wait_all(futures)
+
+
+class ShardedClient:
+    """分片客户端：每个集合在所有分片上各有一个同名集合"""
+
+    def __init__(self, clients: Sequence[Any], timeout_ms: int = 500, workers_per_shard: int = 4):
+        """
+        Args:
+            clients: 各分片的 Chroma 客户端
+            timeout_ms: 单个分片的检索超时（毫秒）
+            workers_per_shard: 每个分片专用的线程数
+        """
+        if not clients:
+            raise ValueError("分片模式至少需要一个分片")
+        self.clients = list(clients)
+        self.timeout_ms = timeout_ms
+        self._workers = [ShardWorkers(index, workers_per_shard) for index in range(len(self.clients))]
+
+    def get_collection(self, name: str, **kwargs) -> ShardedCollection:
+        return self._collection(name, [c.get_collection(name=name, **kwargs) for c in self.clients])
+
+    def create_collection(self, name: str, **kwargs) -> ShardedCollection:
+        """创建集合；部分分片上已存在时直接使用"""
+        shards = []
+        for client in self.clients:
+            try:
+                shards.append(client.get_collection(name=name))
+            except Exception:
+                shards.append(client.create_collection(name=name, **kwargs))
+        return self._collection(name, shards)
+
+    def list_collections(self, **kwargs) -> List[str]:
+        names = set()
+        for client in self.clients:
+            for collection in client.list_collections(**kwargs):
+                names.add(getattr(collection, "name", collection))
+        return sorted(names)
+
+    def delete_collection(self, name: str, **kwargs):
+        for client in self.clients:
+            try:
+                client.delete_collection(name=name, **kwargs)
+            except Exception:
+                pass
+
+    def _collection(self, name: str, shards: List[Any]) -> ShardedCollection:
+        return ShardedCollection(name, shards, self._workers, self.timeout_ms)
+
+
+def _wait_all(futures) -> List[Any]:
+    """等待全部完成，任一失败时抛出其异常"""
+    return [future.result() for future in futures]
+
+
+def _concat(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"ids": []}
+    for part in parts:
+        for key in ("ids", "embeddings", "metadatas", "documents"):
+            # Chroma 返回的 embeddings 可能是 numpy 数组
+            if part.get(key) is not None:
+                result.setdefault(key, []).extend(list(part[key]))
+    return result
@@ -1,19 +1,62 @@
 """
-向量存储服务 - 基于 Chroma (Cloud/Local)
+向量存储服务 - 基于 Chroma (Cloud/Local)，或进程内的 NumPy 平铺索引（flat，见 flat_index），
+或按 document_id 分片到多个 Chroma 实例（sharded，见 vector_shards）
+
+除分块集合外还维护一个文档级索引（document_vectors 集合）：每个文档一个向量，
+取该文档所有分块向量（归一化后）的均值。两阶段检索先在文档级索引中选出最相关的文档，
+再只在这些文档的分块中检索，避免在数十万分块上做带部门过滤的 HNSW 搜索
+
+开启按部门分区（vector_partition_by_department）后，每个部门的分块存放在独立的集合
+（documents_dept_<部门ID>）中，写入、检索和删除按部门路由：部门内检索不再是全局 HNSW 图上的过滤检索，
+小部门也能取满 top_k；没有 department_id 的分块仍写入 documents 集合。migrate_to_department_collections
+把已有的 documents 集合拆分到各部门集合中。文档级索引数据量小，仍为一个集合
+
+Chroma 客户端（Cloud 与本地 PersistentClient）只提供同步接口。所有 Chroma 调用都在专用的
+有界线程池中执行，慢查询不会阻塞事件循环上的其他请求；排队深度、排队耗时和调用耗时记入指标
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
 import chromadb
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
+from loguru import logger
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.answer_cache import answer_cache
+from app.services.retrieval_memory import retrieval_memory
+
+pool_queue_depth = metrics.gauge("vector_store_queue_depth", "等待 Chroma 线程池执行的调用数")
+pool_in_flight = metrics.gauge("vector_store_in_flight", "Chroma 线程池中执行中的调用数")
+pool_wait = metrics.histogram("vector_store_queue_wait_ms", "Chroma 调用在线程池中的排队耗时（毫秒）")
+operation_latency = metrics.histogram(
+    "vector_store_operation_ms", "Chroma 调用耗时（毫秒，按操作）"
+)
+upserted_rows = metrics.counter("vector_upsert_rows_total", "批量写入的分块数")
+upsert_batch_latency = metrics.histogram("vector_upsert_batch_ms", "单批写入耗时（毫秒）")
+upsert_throughput = metrics.gauge("vector_upsert_rows_per_second", "最近一次批量写入的吞吐（分块/秒）")
+delete_latency = metrics.histogram("vector_delete_ms", "按文档/部门删除向量的耗时（毫秒）")
+deleted_vectors = metrics.counter("vector_deleted_total", "按文档/部门删除的分块向量数")
 
 
 class VectorStore:
-    """向量存储服务 - 支持 Chroma Cloud 和本地模式"""
+    """向量存储服务 - 支持 Chroma Cloud、本地模式、平铺索引和多实例分片"""
 
     def __init__(self):
         self.collection_name = "documents"
         self.collection = None
+        self.document_collection_name = "document_vectors"
+        self.document_collection = None
+        self.partition_prefix = f"{self.collection_name}_dept_"
+        self._partitions: Dict[int, Any] = {}
+        self._max_batch_size: Optional[int] = None
+        self._document_index_lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.vector_store_max_workers,
+            thread_name_prefix="chroma",
+        )
 
         # 根据配置选择客户端类型
         if settings.chroma_mode == "cloud":
@@ -26,6 +69,25 @@ class VectorStore:
             )
             self.tenant = settings.chroma_tenant
             self.database = settings.chroma_database
+        elif settings.chroma_mode == "flat":
+            # 平铺索引模式 - 进程内精确检索，接口与 Chroma 客户端一致
+            from app.services.flat_index import FlatIndexClient
+            self.client = FlatIndexClient(
+                settings.flat_index_directory,
+                compaction_ratio=settings.flat_index_compaction_ratio,
+            )
+            self.tenant = None
+            self.database = None
+        elif settings.chroma_mode == "sharded":
+            # 分片模式 - 写入按文档哈希路由，检索并发分发到所有分片
+            from app.services.vector_shards import ShardedClient, create_shard_client
+            self.client = ShardedClient(
+                [create_shard_client(location) for location in settings.vector_shards],
+                timeout_ms=settings.vector_shard_timeout_ms,
+                workers_per_shard=settings.vector_shard_workers,
+            )
+            self.tenant = None
+            self.database = None
         else:
             # 本地模式 - 使用 PersistentClient 进行持久化存储
             import os
@@ -38,55 +100,379 @@ class VectorStore:
 
     async def init_collection(self, vector_size: int = 1536):
         """初始化集合"""
+        self.collection = await self._get_or_create_collection(self.collection_name)
+
+    async def init_document_collection(self):
+        """初始化文档级索引集合"""
+        self.document_collection = await self._get_or_create_collection(
+            self.document_collection_name
+        )
+
+    async def _get_or_create_collection(self, name: str):
         try:
-            if settings.chroma_mode == "cloud":
-                # Cloud 模式需要指定 tenant 和 database
-                self.collection = self.client.get_collection(
-                    name=self.collection_name,
-                    tenant=self.tenant,
-                    database=self.database,
-                )
-            else:
-                self.collection = self.client.get_collection(name=self.collection_name)
+            return await self._open_collection(name)
         except Exception:
             # 集合不存在，创建新集合
-            if settings.chroma_mode == "cloud":
-                self.collection = self.client.create_collection(
-                    name=self.collection_name,
-                    tenant=self.tenant,
-                    database=self.database,
-                    metadata={"hnsw:space": "cosine"}
+            return await self._run(
+                "create_collection",
+                self.client.create_collection,
+                name=name,
+                configuration=_index_configuration(),
+                **self._scope(),
+            )
+
+    async def _open_collection(self, name: str):
+        """打开已有集合，并按配置同步 HNSW 检索参数
+
+        ef_construction 和 max_neighbors（M）只在创建集合时生效，修改后需要重建集合；
+        ef_search 通过 modify(configuration=...) 在已有集合上修改（修改 metadata 不会影响索引）。
+        Chroma Cloud 的集合使用 SPANN 索引，配置中没有 hnsw，不做同步
+        """
+        collection = await self._run(
+            "get_collection", self.client.get_collection, name=name, **self._scope()
+        )
+        configuration = getattr(collection, "configuration_json", None)
+        hnsw = configuration.get("hnsw") if isinstance(configuration, dict) else None
+        if not isinstance(hnsw, dict):
+            return collection
+        search_ef = settings.chroma_hnsw_search_ef
+        if hnsw.get("ef_search") != search_ef:
+            try:
+                await self._run(
+                    "modify",
+                    collection.modify,
+                    configuration={"hnsw": {"ef_search": search_ef}},
                 )
-            else:
-                self.collection = self.client.create_collection(
-                    name=self.collection_name,
-                    metadata={"hnsw:space": "cosine"}
+            except Exception as e:
+                logger.warning(f"⚠️ 集合 {name} 更新 HNSW ef_search 失败: {e}")
+        return collection
+
+    async def _partition(self, department_id: int, create: bool = True):
+        """部门分区集合，create=False 且集合不存在时返回 None"""
+        collection = self._partitions.get(department_id)
+        if collection is not None:
+            return collection
+        name = f"{self.partition_prefix}{department_id}"
+        if create:
+            collection = await self._get_or_create_collection(name)
+        else:
+            try:
+                collection = await self._open_collection(name)
+            except Exception:
+                return None
+        self._partitions[department_id] = collection
+        return collection
+
+    async def _chunk_collection(self, department_id: Optional[int], create: bool = True):
+        """分块所在的集合：开启分区且指定部门时为部门集合，否则为 documents 集合"""
+        if settings.vector_partition_by_department and department_id is not None:
+            return await self._partition(department_id, create)
+        if self.collection is None:
+            await self.init_collection()
+        return self.collection
+
+    async def _partition_department_ids(self) -> List[int]:
+        """已存在的部门分区"""
+        collections = await self._run("list_collections", self.client.list_collections, **self._scope())
+        department_ids = []
+        for collection in collections:
+            # 新版 Chroma 返回集合名，旧版返回集合对象
+            name = getattr(collection, "name", collection)
+            suffix = name[len(self.partition_prefix):]
+            if name.startswith(self.partition_prefix) and suffix.isdigit():
+                department_ids.append(int(suffix))
+        return sorted(department_ids)
+
+    async def _chunk_collections(self) -> List[Any]:
+        """所有存放分块的集合（documents 集合及各部门分区）"""
+        if self.collection is None:
+            await self.init_collection()
+        collections = [self.collection]
+        if settings.vector_partition_by_department:
+            for department_id in await self._partition_department_ids():
+                collections.append(await self._partition(department_id))
+        return collections
+
+    def _scope(self) -> Dict[str, Any]:
+        """Cloud 模式下每次调用需要携带的 tenant 和 database 参数"""
+        if settings.chroma_mode == "cloud":
+            return {"tenant": self.tenant, "database": self.database}
+        return {}
+
+    async def _run(self, operation: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在专用线程池中执行同步的 Chroma 调用，不阻塞事件循环"""
+        submitted_at = time.perf_counter()
+
+        def call():
+            started_at = time.perf_counter()
+            pool_queue_depth.dec()
+            pool_in_flight.inc()
+            pool_wait.observe(round((started_at - submitted_at) * 1000, 2))
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                pool_in_flight.dec()
+                operation_latency.observe(
+                    round((time.perf_counter() - started_at) * 1000, 2), operation=operation
                 )
 
+        pool_queue_depth.inc()
+        future = self._executor.submit(call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 尚未开始执行的调用随等待方一起取消，已开始的调用在线程中执行完毕后丢弃结果
+            if future.cancelled():
+                pool_queue_depth.dec()
+            raise
+
+    def shutdown(self):
+        """关闭线程池（等待执行中的调用结束）"""
+        self._executor.shutdown(wait=True)
+
     async def insert_points(
         self,
         ids: List[str],
         vectors: List[List[float]],
         metadatas: List[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """批量写入向量点（按分块 id upsert，重试安全）
+
+        开启分区时按 department_id 分别写入各部门集合。写入按后端的最大批大小切分，
+        最多 vector_upsert_concurrency 个批次并发执行。开启文档级索引时，每批写入前先查询已存在的 id，
+        只有新分块计入文档向量均值，重复执行同一批写入不会重复计数
+
+        Returns:
+            写入统计：分块数、新分块数、批次数、耗时和吞吐
+        """
+        start = time.perf_counter()
+        groups: Dict[Optional[int], List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            department_id = metadata.get("department_id") if settings.vector_partition_by_department else None
+            groups.setdefault(department_id, []).append(i)
+
+        batch_size = await self._batch_size()
+        batches = []
+        for department_id, positions in groups.items():
+            collection = await self._chunk_collection(department_id)
+            for offset in range(0, len(positions), batch_size):
+                batches.append((collection, positions[offset:offset + batch_size]))
+
+        semaphore = asyncio.Semaphore(settings.vector_upsert_concurrency)
+
+        async def write(collection, positions: List[int]) -> int:
+            async with semaphore:
+                batch_ids = [ids[i] for i in positions]
+                existing = set()
+                if settings.document_index_enabled:
+                    found = await self._run(
+                        "get", collection.get, ids=batch_ids, include=[], **self._scope()
+                    )
+                    existing = set(found.get("ids") or [])
+                batch_start = time.perf_counter()
+                await self._run(
+                    "upsert",
+                    collection.upsert,
+                    ids=batch_ids,
+                    embeddings=[vectors[i] for i in positions],
+                    metadatas=[metadatas[i] for i in positions],
+                    **self._scope(),
+                )
+                upsert_batch_latency.observe(round((time.perf_counter() - batch_start) * 1000, 2))
+                upserted_rows.inc(len(positions))
+
+            new = [i for i in positions if ids[i] not in existing]
+            if settings.document_index_enabled and new:
+                # 文档向量是读-改-写的增量均值，各批次串行更新
+                async with self._document_index_lock:
+                    await self.update_document_vectors(
+                        [vectors[i] for i in new], [metadatas[i] for i in new]
+                    )
+            return len(new)
+
+        new_rows = sum(await asyncio.gather(*(write(c, p) for c, p in batches)))
+        # 部门知识库已变化，基于旧内容缓存的答案可能过期
+        for department_id in {m.get("department_id") for m in metadatas} - {None}:
+            await answer_cache.invalidate_department(department_id)
+        # 重新写入的文档分块可能已变化，会话中记住的旧检索结果不再复用
+        await retrieval_memory.invalidate_documents(m.get("document_id") for m in metadatas)
+        elapsed = time.perf_counter() - start
+        rows_per_second = round(len(ids) / elapsed, 1) if elapsed > 0 else 0.0
+        upsert_throughput.set(rows_per_second)
+        logger.info(
+            f"向量写入完成 | 分块数: {len(ids)} | 新分块: {new_rows} | 批次: {len(batches)} | "
+            f"耗时: {elapsed:.2f}s | {rows_per_second} 分块/秒"
+        )
+        return {
+            "rows": len(ids),
+            "new_rows": new_rows,
+            "batches": len(batches),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": rows_per_second,
+        }
+
+    async def _batch_size(self) -> int:
+        """单次写入的分块数：配置值与后端最大批大小（Chroma get_max_batch_size）中的较小者"""
+        if self._max_batch_size is None:
+            batch_size = settings.vector_upsert_batch_size
+            get_max_batch_size = getattr(self.client, "get_max_batch_size", None)
+            if callable(get_max_batch_size):
+                try:
+                    backend_max = await self._run("get_max_batch_size", get_max_batch_size)
+                except Exception:
+                    backend_max = None
+                if isinstance(backend_max, int) and backend_max > 0:
+                    batch_size = min(batch_size, backend_max)
+            self._max_batch_size = batch_size
+        return self._max_batch_size
+
+    async def update_document_vectors(
+        self,
+        vectors: List[List[float]],
+        metadatas: List[Dict[str, Any]],
     ):
-        """插入向量点"""
-        if self.collection is None:
-            await self.init_collection()
+        """将新分块并入所属文档的文档级向量（增量更新分块向量均值）"""
+        groups = _group_by_document(vectors, metadatas)
+        if not groups:
+            return
+        if self.document_collection is None:
+            await self.init_document_collection()
 
-        if settings.chroma_mode == "cloud":
-            self.collection.add(
-                ids=ids,
-                embeddings=vectors,
-                metadatas=metadatas,
-                tenant=self.tenant,
-                database=self.database,
+        ids = [_document_vector_id(document_id) for document_id in groups]
+        existing = await self._run(
+            "get",
+            self.document_collection.get,
+            ids=ids,
+            include=["embeddings", "metadatas"],
+            **self._scope(),
+        )
+        for vector_id, embedding, metadata in zip(
+            existing.get("ids") or [],
+            existing.get("embeddings") if existing.get("embeddings") is not None else [],
+            existing.get("metadatas") or [],
+        ):
+            group = groups.get(metadata.get("document_id"))
+            if group is not None:
+                count = int(metadata.get("chunk_count", 0))
+                group[0] += np.asarray(embedding, dtype=np.float32) * count
+                group[1] += count
+
+        await self._upsert_document_vectors(groups)
+
+    async def rebuild_document_index(self, batch_size: int = 1000) -> int:
+        """扫描分块集合重建文档级索引
+
+        Returns:
+            建立索引的文档数
+        """
+        groups: Dict[Any, list] = {}
+        chunks = 0
+        for collection in await self._chunk_collections():
+            async for batch in self._scan(collection, batch_size):
+                for document_id, group in _group_by_document(
+                    batch["embeddings"], batch["metadatas"]
+                ).items():
+                    if document_id in groups:
+                        groups[document_id][0] += group[0]
+                        groups[document_id][1] += group[1]
+                    else:
+                        groups[document_id] = group
+                chunks += len(batch["ids"])
+
+        try:
+            await self._run(
+                "delete_collection",
+                self.client.delete_collection,
+                name=self.document_collection_name,
+                **self._scope(),
             )
-        else:
-            self.collection.add(
-                ids=ids,
-                embeddings=vectors,
-                metadatas=metadatas,
+        except Exception:
+            pass
+        self.document_collection = None
+        await self.init_document_collection()
+        await self._upsert_document_vectors(groups)
+        logger.info(f"✅ 文档级索引重建完成 | 文档数: {len(groups)} | 分块数: {chunks}")
+        return len(groups)
+
+    async def _scan(self, collection, batch_size: int):
+        """分页读取集合中的全部分块（含向量和元数据）"""
+        offset = 0
+        while True:
+            batch = await self._run(
+                "get",
+                collection.get,
+                include=["embeddings", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+                **self._scope(),
             )
+            if not batch.get("ids"):
+                return
+            yield batch
+            offset += len(batch["ids"])
+
+    async def migrate_to_department_collections(self, batch_size: int = 1000) -> Dict[int, int]:
+        """把 documents 集合中的分块按 department_id 拆分到各部门集合
+
+        先全部复制（upsert，可重复执行）再从 documents 集合删除，中途失败时数据仍可从原集合检索；
+        没有 department_id 的分块留在原集合中
+
+        Returns:
+            部门ID → 迁移的分块数
+        """
+        if self.collection is None:
+            await self.init_collection()
+
+        migrated: Dict[int, List[str]] = {}
+        async for batch in self._scan(self.collection, batch_size):
+            groups: Dict[int, List[int]] = {}
+            for i, metadata in enumerate(batch["metadatas"]):
+                if metadata and metadata.get("department_id") is not None:
+                    groups.setdefault(int(metadata["department_id"]), []).append(i)
+            for department_id, positions in groups.items():
+                partition = await self._partition(department_id)
+                await self._run(
+                    "upsert",
+                    partition.upsert,
+                    ids=[batch["ids"][i] for i in positions],
+                    embeddings=[list(batch["embeddings"][i]) for i in positions],
+                    metadatas=[batch["metadatas"][i] for i in positions],
+                    **self._scope(),
+                )
+                migrated.setdefault(department_id, []).extend(batch["ids"][i] for i in positions)
+
+        for ids in migrated.values():
+            for start in range(0, len(ids), batch_size):
+                await self._run(
+                    "delete", self.collection.delete, ids=ids[start:start + batch_size], **self._scope()
+                )
+
+        counts = {department_id: len(ids) for department_id, ids in migrated.items()}
+        logger.info(
+            f"✅ 部门分区迁移完成 | 部门数: {len(counts)} | 分块数: {sum(counts.values())}"
+        )
+        return counts
+
+    async def _upsert_document_vectors(self, groups: Dict[Any, list]):
+        """写入文档级向量，groups: 文档ID → [归一化分块向量之和, 分块数, 元数据]"""
+        if not groups:
+            return
+        if self.document_collection is None:
+            await self.init_document_collection()
+
+        ids, embeddings, metadatas = [], [], []
+        for document_id, (total, count, metadata) in groups.items():
+            ids.append(_document_vector_id(document_id))
+            embeddings.append((total / max(count, 1)).tolist())
+            metadatas.append({**metadata, "chunk_count": count})
+        await self._run(
+            "upsert",
+            self.document_collection.upsert,
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            **self._scope(),
+        )
 
     async def search(
         self,
@@ -94,62 +480,239 @@ class VectorStore:
         limit: int = 5,
         score_threshold: float = 0.0,
         department_id: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
     ) -> List[Dict[str, Any]]:
         """向量搜索"""
-        if self.collection is None:
-            await self.init_collection()
+        results = await self.search_many(
+            vectors=[vector],
+            limit=limit,
+            score_threshold=score_threshold,
+            department_id=department_id,
+            document_ids=document_ids,
+        )
+        return results[0]
+
+    async def search_many(
+        self,
+        vectors: List[List[float]],
+        limit: int = 5,
+        score_threshold: float = 0.0,
+        department_id: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """多向量搜索 - 一次 collection.query 检索多个查询向量
+
+        Args:
+            document_ids: 只在这些文档的分块中检索（所有查询向量共用）
+
+        Returns:
+            与 vectors 一一对应的结果列表
+        """
+        if not vectors:
+            return []
+
+        # 开启分区时只在部门集合中检索，不再需要部门过滤；部门集合不存在说明该部门没有分块
+        partitioned = settings.vector_partition_by_department and department_id is not None
+        collection = await self._chunk_collection(department_id, create=False)
+        if collection is None:
+            return [[] for _ in vectors]
 
         # 构建过滤条件
-        where = None
-        if department_id is not None:
-            where = {"department_id": department_id}
+        where = _build_where(None if partitioned else department_id, document_ids)
 
         # 执行查询
-        if settings.chroma_mode == "cloud":
-            results = self.collection.query(
-                query_embeddings=[vector],
-                n_results=limit,
-                where=where,
-                tenant=self.tenant,
-                database=self.database,
-            )
-        else:
-            results = self.collection.query(
-                query_embeddings=[vector],
-                n_results=limit,
-                where=where,
-            )
+        results = await self._run(
+            "query",
+            collection.query,
+            query_embeddings=vectors,
+            n_results=limit,
+            where=where,
+            **self._scope(),
+        )
 
         # 格式化结果
+        return [
+            self._format_results(results, i, score_threshold)
+            for i in range(len(vectors))
+        ]
+
+    async def search_documents(
+        self,
+        vectors: List[List[float]],
+        limit: int,
+        department_id: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """在文档级索引中检索最相关的文档，payload 含 document_id 等文档元数据"""
+        if not vectors:
+            return []
+        if self.document_collection is None:
+            await self.init_document_collection()
+
+        results = await self._run(
+            "query",
+            self.document_collection.query,
+            query_embeddings=vectors,
+            n_results=limit,
+            where=_build_where(department_id, None),
+            **self._scope(),
+        )
+        return [self._format_results(results, i, 0.0) for i in range(len(vectors))]
+
+    async def search_hierarchical(
+        self,
+        vector: List[float],
+        limit: int = 5,
+        department_id: Optional[int] = None,
+        top_documents: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """两阶段检索：先选出最相关的 top_documents 个文档，再在其分块中检索"""
+        results = await self.search_hierarchical_many([vector], limit, department_id, top_documents)
+        return results[0]
+
+    async def search_hierarchical_many(
+        self,
+        vectors: List[List[float]],
+        limit: int = 5,
+        department_id: Optional[int] = None,
+        top_documents: int = 20,
+    ) -> List[List[Dict[str, Any]]]:
+        """批量两阶段检索：文档级检索一次完成，分块检索按各自的候选文档并发执行
+
+        文档级索引中没有候选文档时（如索引尚未建立）退化为普通分块检索
+        """
+        documents = await self.search_documents(vectors, top_documents, department_id)
+        searches = []
+        for vector, hits in zip(vectors, documents):
+            document_ids = [hit["payload"]["document_id"] for hit in hits]
+            if not document_ids:
+                logger.debug("文档级索引没有候选文档，退化为全量分块检索")
+            searches.append(self.search(
+                vector,
+                limit=limit,
+                department_id=department_id,
+                document_ids=document_ids or None,
+            ))
+        return list(await asyncio.gather(*searches))
+
+    def _format_results(
+        self,
+        results: Dict[str, Any],
+        index: int,
+        score_threshold: float,
+    ) -> List[Dict[str, Any]]:
+        """格式化第 index 个查询向量的结果"""
         formatted_results = []
-        if results and results["ids"] and results["ids"][0]:
-            for i, doc_id in enumerate(results["ids"][0]):
-                distance = results["distances"][0][i] if results.get("distances") else 0
-                # Chroma 返回的是距离，需要转换为相似度分数
-                score = 1 - distance
-
-                if score >= score_threshold:
-                    formatted_results.append({
-                        "id": doc_id,
-                        "score": score,
-                        "payload": results["metadatas"][0][i] if results.get("metadatas") else {},
-                    })
+        if not results or not results["ids"] or len(results["ids"]) <= index:
+            return formatted_results
+
+        for i, doc_id in enumerate(results["ids"][index]):
+            distance = results["distances"][index][i] if results.get("distances") else 0
+            # Chroma 返回的是距离，需要转换为相似度分数
+            score = 1 - distance
+
+            if score >= score_threshold:
+                formatted_results.append({
+                    "id": doc_id,
+                    "score": score,
+                    "payload": results["metadatas"][index][i] if results.get("metadatas") else {},
+                })
 
         return formatted_results
 
-    async def delete_points(self, ids: List[str]):
-        """删除向量点"""
+    async def delete_points(self, ids: List[str], department_id: Optional[int] = None):
+        """删除向量点
+
+        开启分区时指定 department_id 只在该部门集合中删除，否则在所有分块集合中删除
+        """
+        if settings.vector_partition_by_department and department_id is not None:
+            collection = await self._partition(department_id, create=False)
+            collections = [collection] if collection is not None else []
+        else:
+            collections = await self._chunk_collections()
+
+        for collection in collections:
+            await self._run("delete", collection.delete, ids=ids, **self._scope())
+
+    async def delete_by_document(self, document_id: int, department_id: Optional[int] = None) -> int:
+        """删除文档的全部分块向量及其文档级向量
+
+        每个集合一次按元数据过滤的服务端删除，不需要先取出分块 id。开启分区且指定
+        department_id 时只在该部门集合中删除
+
+        Returns:
+            删除的分块数（按删除前后的集合计数估算，并发写入时可能不精确）
+        """
+        start = time.perf_counter()
+        if settings.vector_partition_by_department and department_id is not None:
+            collection = await self._partition(department_id, create=False)
+            collections = [collection] if collection is not None else []
+        else:
+            collections = await self._chunk_collections()
+
+        removed = 0
+        for collection in collections:
+            removed += await self._delete_where(collection, {"document_id": document_id})
+        if self.document_collection is None:
+            await self.init_document_collection()
+        await self._run(
+            "delete",
+            self.document_collection.delete,
+            ids=[_document_vector_id(document_id)],
+            **self._scope(),
+        )
+        self._record_delete("document", removed, start)
+        await retrieval_memory.invalidate_documents([document_id])
+        logger.info(f"🗑️ 文档向量已删除 | 文档ID: {document_id} | 分块数: {removed}")
+        return removed
+
+    async def delete_by_department(self, department_id: int) -> int:
+        """删除部门的全部分块向量及文档级向量（开启分区时直接删除部门集合）
+
+        Returns:
+            删除的分块数
+        """
+        start = time.perf_counter()
         if self.collection is None:
             await self.init_collection()
+        removed = await self._delete_where(self.collection, {"department_id": department_id})
 
-        if settings.chroma_mode == "cloud":
-            self.collection.delete(
-                ids=ids,
-                tenant=self.tenant,
-                database=self.database,
-            )
-        else:
-            self.collection.delete(ids=ids)
+        if settings.vector_partition_by_department:
+            partition = await self._partition(department_id, create=False)
+            if partition is not None:
+                removed += await self._run("count", partition.count)
+                await self._run(
+                    "delete_collection",
+                    self.client.delete_collection,
+                    name=f"{self.partition_prefix}{department_id}",
+                    **self._scope(),
+                )
+                self._partitions.pop(department_id, None)
+
+        if self.document_collection is None:
+            await self.init_document_collection()
+        await self._run(
+            "delete",
+            self.document_collection.delete,
+            where={"department_id": department_id},
+            **self._scope(),
+        )
+        self._record_delete("department", removed, start)
+        await answer_cache.invalidate_department(department_id)
+        await retrieval_memory.invalidate_department(department_id)
+        logger.info(f"🗑️ 部门向量已删除 | 部门ID: {department_id} | 分块数: {removed}")
+        return removed
+
+    async def _delete_where(self, collection, where: Dict[str, Any]) -> int:
+        """按元数据过滤删除，返回删除前后集合计数之差"""
+        before = await self._run("count", collection.count)
+        if not before:
+            return 0
+        await self._run("delete", collection.delete, where=where, **self._scope())
+        return max(before - await self._run("count", collection.count), 0)
+
+    def _record_delete(self, scope: str, removed: int, start: float):
+        delete_latency.observe(round((time.perf_counter() - start) * 1000, 2), scope=scope)
+        deleted_vectors.inc(removed, scope=scope)
 
     async def get_collection_stats(self) -> Dict[str, Any]:
         """获取集合统计信息"""
@@ -158,25 +721,109 @@ class VectorStore:
 
         return {
             "name": self.collection.name,
-            "count": self.collection.count(),
+            "count": await self._run("count", self.collection.count),
         }
 
+    async def compact(self) -> int:
+        """压缩平铺索引中的墓碑行，返回回收的行数（Chroma 后端无需压缩，返回 0）"""
+        reclaimed = 0
+        if self.document_collection is None:
+            await self.init_document_collection()
+        for collection in [*await self._chunk_collections(), self.document_collection]:
+            if hasattr(collection, "compact"):
+                reclaimed += await self._run("compact", collection.compact)
+        return reclaimed
+
     async def reset_collection(self):
         """重置集合（删除所有数据）"""
         try:
-            if settings.chroma_mode == "cloud":
-                self.client.delete_collection(
-                    name=self.collection_name,
-                    tenant=self.tenant,
-                    database=self.database,
-                )
-            else:
-                self.client.delete_collection(name=self.collection_name)
+            if settings.vector_partition_by_department:
+                for department_id in await self._partition_department_ids():
+                    await self._run(
+                        "delete_collection",
+                        self.client.delete_collection,
+                        name=f"{self.partition_prefix}{department_id}",
+                        **self._scope(),
+                    )
+                self._partitions.clear()
+            await self._run(
+                "delete_collection",
+                self.client.delete_collection,
+                name=self.collection_name,
+                **self._scope(),
+            )
             self.collection = None
             await self.init_collection()
         except Exception:
             pass
 
 
+def _index_configuration() -> Dict[str, Any]:
+    """新建集合的索引配置（距离固定为余弦，_format_results 按余弦距离换算相似度）
+
+    Chroma Cloud 使用 SPANN 索引，HNSW 参数只用于本地和自建（含分片）实例
+    """
+    if settings.chroma_mode == "cloud":
+        return {"spann": {"space": "cosine"}}
+    return {
+        "hnsw": {
+            "space": "cosine",
+            "ef_construction": settings.chroma_hnsw_construction_ef,
+            "ef_search": settings.chroma_hnsw_search_ef,
+            "max_neighbors": settings.chroma_hnsw_m,
+        }
+    }
+
+
+def _build_where(
+    department_id: Optional[int],
+    document_ids: Optional[List[int]],
+) -> Optional[Dict[str, Any]]:
+    """构建 Chroma 元数据过滤条件"""
+    conditions = []
+    if department_id is not None:
+        conditions.append({"department_id": department_id})
+    if document_ids:
+        conditions.append({"document_id": {"$in": list(document_ids)}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _document_vector_id(document_id: Any) -> str:
+    return f"doc-{document_id}"
+
+
+def _group_by_document(
+    vectors: List[List[float]],
+    metadatas: List[Dict[str, Any]],
+) -> Dict[Any, list]:
+    """按文档汇总分块向量，返回 文档ID → [归一化分块向量之和, 分块数, 文档元数据]"""
+    groups: Dict[Any, list] = {}
+    for vector, metadata in zip(vectors, metadatas):
+        document_id = (metadata or {}).get("document_id")
+        if document_id is None:
+            continue
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(arr))
+        if norm > 0:
+            arr = arr / norm
+        group = groups.get(document_id)
+        if group is None:
+            groups[document_id] = [arr.copy(), 1, _document_metadata(metadata)]
+        else:
+            group[0] += arr
+            group[1] += 1
+    return groups
+
+
+def _document_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: metadata[key]
+        for key in ("document_id", "department_id", "filename")
+        if metadata.get(key) is not None
+    }
+
+
 # 全局实例
 vector_store = VectorStore()
@@ -27,6 +27,15 @@ celery_app.conf.update(
     worker_max_tasks_per_child=1000,
 )
 
+# 定时任务（需要运行 celery beat，或 worker 带 --beat 启动）
+if settings.chroma_mode == "flat" and settings.flat_index_compaction_interval_seconds > 0:
+    celery_app.conf.beat_schedule = {
+        "compact-vector-index": {
+            "task": "compact_vector_index",
+            "schedule": float(settings.flat_index_compaction_interval_seconds),
+        },
+    }
+
 
 @celery_app.task(name="health_check")
 def health_check():
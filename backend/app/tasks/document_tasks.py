@@ -1,6 +1,7 @@
 """
 文档处理任务
 """
+import asyncio
 import os
 from typing import List
 from celery import shared_task
@@ -60,6 +61,20 @@ def cleanup_old_documents(days: int = 30):
 
 @shared_task(name="rebuild_vector_index")
 def rebuild_vector_index():
-    """重建向量索引"""
-    # TODO: 实现重建逻辑
-    return {"status": "completed"}
+    """重建向量索引（按分块集合重建文档级索引）"""
+    documents = asyncio.run(vector_store.rebuild_document_index())
+    return {"status": "completed", "documents": documents}
+
+
+@shared_task(name="compact_vector_index")
+def compact_vector_index():
+    """压缩平铺索引中的已删除行（仅 flat 模式有效，由 Celery beat 按 FLAT_INDEX_COMPACTION_INTERVAL_SECONDS 定期调度）"""
+    reclaimed = asyncio.run(vector_store.compact())
+    return {"status": "completed", "reclaimed": reclaimed}
+
+
+@shared_task(name="partition_vector_index")
+def partition_vector_index(batch_size: int = 1000):
+    """把 documents 集合中的分块按部门拆分到各部门集合（开启 VECTOR_PARTITION_BY_DEPARTMENT 前执行）"""
+    counts = asyncio.run(vector_store.migrate_to_department_collections(batch_size=batch_size))
+    return {"status": "completed", "departments": len(counts), "chunks": sum(counts.values())}
@@ -0,0 +1,64 @@
+"""
+词法检索分词工具
+
+数据库以 C locale 初始化，PostgreSQL 自带的全文检索解析器和 pg_trgm 都会把中文字符当作分隔符丢弃。
+这里在 Python 侧把文本切成 n-gram 词元，入库时以空格拼接保存，查询时直接构造 tsquery，
+全程绕过数据库的分词器：
+
+- 中文连续片段切成重叠的字符二元组（单字片段保留单字）
+- 英文/数字按词切分并转小写；带连接符的标识符（如 ERR-1042、SKU_88/A）额外保留去掉连接符的整体词元，
+  保证错误码、合同号、SKU 等可以精确命中
+"""
+import re
+import unicodedata
+from typing import List
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[A-Za-z0-9]+(?:[-_./#:][A-Za-z0-9]+)*")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_SEPARATOR_RE = re.compile(r"[-_./#:]")
+# 含数字、带连接符或全大写缩写的英文数字串，如 ERR-1042、SKU88、VPN
+_IDENTIFIER_RE = re.compile(
+    r"[A-Za-z]*\d[A-Za-z0-9]*|[A-Za-z0-9]+(?:[-_./#:][A-Za-z0-9]+)+|[A-Z]{2,}"
+)
+
+
+def tokenize_for_search(text: str) -> List[str]:
+    """切分为检索词元（保持出现顺序，不去重）"""
+    if not text:
+        return []
+
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text)):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            continue
+
+        parts = _SEPARATOR_RE.split(run.lower())
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(parts)
+    return tokens
+
+
+def build_search_tokens(text: str) -> str:
+    """生成入库用的词元字符串（去重，空格分隔）"""
+    return " ".join(dict.fromkeys(tokenize_for_search(text)))
+
+
+def build_tsquery(text: str, max_terms: int = 64) -> str:
+    """生成 OR 连接的 tsquery 字面量
+
+    词元只包含字母、数字和中文字符，可以安全地放入引号内
+    """
+    terms = list(dict.fromkeys(tokenize_for_search(text)))[:max_terms]
+    return " | ".join(f"'{t}'" for t in terms)
+
+
+def has_identifier(text: str) -> bool:
+    """文本中是否包含错误码、SKU、缩写等标识符"""
+    return bool(_IDENTIFIER_RE.search(unicodedata.normalize("NFKC", text or "")))
@@ -0,0 +1,36 @@
+"""
+Token 估算工具
+
+不依赖具体模型的分词器，按经验规则快速估算：中日韩字符约 1 token/字，
+其他字符约 4 字符/token。用于提示词预算控制，误差在 ±20% 以内即可满足需要
+"""
+import math
+import re
+
+_CJK_RE = re.compile("[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_RE.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断文本使估算 token 数不超过 max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # 二分查找最长的满足预算的前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
@@ -0,0 +1,124 @@
+"""
+部门分区基准测试 - 对比全局集合上的部门过滤检索与按部门分区的集合检索
+
+在临时目录的本地 Chroma 中生成合成语料，部门规模按 Zipf 分布倾斜（少数大部门、大量小部门）。
+先写入全局 documents 集合测量过滤检索，再执行 migrate_to_department_collections 拆分为部门集合后测量分区检索。
+以 numpy 暴力检索（部门内）的 top_k 作为真值，报告延迟分位数、recall@k 以及返回结果不足 top_k 的查询比例。
+
+用法（在 backend 目录下）：
+    python scripts/benchmark_department_partitioning.py --chunks 200000 --departments 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="部门分区基准测试")
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--departments", type=int, default=50)
+    parser.add_argument("--zipf", type=float, default=1.2, help="部门规模的 Zipf 指数，越大越倾斜")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def generate_corpus(args, rng):
+    """生成归一化的分块向量和所属部门"""
+    weights = 1.0 / np.arange(1, args.departments + 1) ** args.zipf
+    departments = rng.choice(
+        np.arange(1, args.departments + 1), size=args.chunks, p=weights / weights.sum()
+    )
+    vectors = rng.standard_normal((args.chunks, args.dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, departments
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2)
+
+
+async def run(args):
+    from app.services.vector_store import VectorStore
+
+    rng = np.random.default_rng(args.seed)
+    vectors, departments = generate_corpus(args, rng)
+    sizes = np.bincount(departments)[1:]
+    print(
+        f"语料: {len(vectors)} 个分块 / {args.departments} 个部门（最大 {sizes.max()}，最小 {sizes.min()}），"
+        f"维度 {args.dimension}"
+    )
+
+    settings.chroma_mode = "local"
+    settings.chroma_persist_directory = tempfile.mkdtemp(prefix="askit-bench-")
+    settings.document_index_enabled = False
+    settings.vector_partition_by_department = False
+    store = VectorStore()
+
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), args.batch_size):
+        end = min(offset + args.batch_size, len(vectors))
+        await store.insert_points(
+            ids=[f"chunk-{i}" for i in range(offset, end)],
+            vectors=vectors[offset:end].tolist(),
+            metadatas=[
+                {"department_id": int(d), "chunk_index": i}
+                for i, d in enumerate(departments[offset:end], offset)
+            ],
+        )
+    print(f"写入全局集合: {time.perf_counter() - start:.1f}s")
+
+    # 查询均匀地分布在各部门上，小部门的过滤检索最容易取不满 top_k
+    query_departments = rng.integers(1, args.departments + 1, args.queries)
+    queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = []
+    for query, department in zip(queries, query_departments):
+        candidates = np.flatnonzero(departments == department)
+        scores = vectors[candidates] @ query
+        truth.append({f"chunk-{i}" for i in candidates[np.argsort(-scores)[:args.top_k]]})
+
+    async def measure():
+        latencies, recalls, short = [], [], 0
+        for query, department, expected in zip(queries, query_departments, truth):
+            start = time.perf_counter()
+            hits = await store.search(query.tolist(), limit=args.top_k, department_id=int(department))
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & {hit["id"] for hit in hits}) / max(len(expected), 1))
+            short += len(hits) < len(expected)
+        return latencies, recalls, short / len(queries)
+
+    rows = [("全局集合 + 部门过滤", *await measure())]
+
+    start = time.perf_counter()
+    counts = await store.migrate_to_department_collections(batch_size=args.batch_size)
+    print(f"迁移到部门集合: {time.perf_counter() - start:.1f}s（{len(counts)} 个部门）")
+    settings.vector_partition_by_department = True
+    rows.append(("按部门分区", *await measure()))
+
+    print(
+        f"\n{'方案':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{f'recall@{args.top_k}':>12}{'不足 top_k':>12}"
+    )
+    for name, latencies, recalls, short_ratio in rows:
+        print(
+            f"{name:<24}{percentile(latencies, 50):>10}{percentile(latencies, 95):>10}"
+            f"{percentile(latencies, 99):>10}{np.mean(recalls):>12.3f}{short_ratio:>12.1%}"
+        )
+    store.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
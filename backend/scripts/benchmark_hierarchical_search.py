@@ -0,0 +1,128 @@
+"""
+两阶段检索基准测试 - 对比全量分块检索与文档级索引 + 分块检索的延迟和召回率
+
+在临时目录的本地 Chroma 中生成合成语料：每个文档有一个随机主题向量，其分块为主题向量加噪声；
+查询取随机分块再加噪声。以 numpy 暴力检索（带部门过滤）的 top_k 作为真值计算 recall@k。
+
+用法（在 backend 目录下）：
+    python scripts/benchmark_hierarchical_search.py --documents 2000 --chunks-per-document 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="两阶段检索基准测试")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--chunks-per-document", type=int, default=100)
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--top-documents", type=int, nargs="+", default=[5, 10, 20, 50])
+    parser.add_argument("--noise", type=float, default=0.6, help="分块相对文档主题向量的噪声强度")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def generate_corpus(args, rng):
+    """生成归一化的分块向量、所属文档和部门"""
+    topics = rng.standard_normal((args.documents, args.dimension)).astype(np.float32)
+    document_ids = np.repeat(np.arange(1, args.documents + 1), args.chunks_per_document)
+    vectors = topics[document_ids - 1] + args.noise * rng.standard_normal(
+        (len(document_ids), args.dimension)
+    ).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    departments = (document_ids % args.departments) + 1
+    return vectors, document_ids, departments
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2)
+
+
+async def run(args):
+    from app.services.vector_store import VectorStore
+
+    rng = np.random.default_rng(args.seed)
+    vectors, document_ids, departments = generate_corpus(args, rng)
+    print(f"语料: {len(vectors)} 个分块 / {args.documents} 个文档 / {args.departments} 个部门, 维度 {args.dimension}")
+
+    settings.chroma_mode = "local"
+    settings.chroma_persist_directory = tempfile.mkdtemp(prefix="askit-bench-")
+    settings.document_index_enabled = False
+    store = VectorStore()
+    await store.init_collection()
+
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), args.batch_size):
+        end = offset + args.batch_size
+        await store.insert_points(
+            ids=[f"chunk-{i}" for i in range(offset, min(end, len(vectors)))],
+            vectors=vectors[offset:end].tolist(),
+            metadatas=[
+                {"document_id": int(d), "department_id": int(p), "chunk_index": i}
+                for i, (d, p) in enumerate(zip(document_ids[offset:end], departments[offset:end]), offset)
+            ],
+        )
+    print(f"写入分块: {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    await store.rebuild_document_index(batch_size=args.batch_size)
+    print(f"构建文档级索引: {time.perf_counter() - start:.1f}s")
+
+    # 查询：随机分块加噪声，在该分块所属部门内检索
+    picks = rng.integers(0, len(vectors), args.queries)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    query_departments = departments[picks]
+
+    truth = []
+    for query, department in zip(queries, query_departments):
+        candidates = np.flatnonzero(departments == department)
+        scores = vectors[candidates] @ query
+        truth.append({f"chunk-{i}" for i in candidates[np.argsort(-scores)[:args.top_k]]})
+
+    async def measure(search):
+        latencies, recalls = [], []
+        for query, department, expected in zip(queries, query_departments, truth):
+            start = time.perf_counter()
+            hits = await search(query.tolist(), int(department))
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & {hit["id"] for hit in hits}) / args.top_k)
+        return latencies, recalls
+
+    rows = []
+    latencies, recalls = await measure(
+        lambda q, d: store.search(q, limit=args.top_k, department_id=d)
+    )
+    rows.append(("全量分块检索", latencies, recalls))
+    for top_documents in args.top_documents:
+        latencies, recalls = await measure(
+            lambda q, d, n=top_documents: store.search_hierarchical(
+                q, limit=args.top_k, department_id=d, top_documents=n
+            )
+        )
+        rows.append((f"两阶段 top_documents={top_documents}", latencies, recalls))
+
+    print(f"\n{'方案':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{f'recall@{args.top_k}':>12}")
+    for name, latencies, recalls in rows:
+        print(
+            f"{name:<28}{percentile(latencies, 50):>10}{percentile(latencies, 95):>10}"
+            f"{percentile(latencies, 99):>10}{np.mean(recalls):>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
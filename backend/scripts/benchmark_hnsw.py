@@ -0,0 +1,132 @@
+"""
+HNSW 参数基准测试 - 对比不同 M / construction_ef / search_ef 下的召回率和检索延迟
+
+向量来自 --vectors-file 指定的 .npy 文件（如从线上集合导出的真实分块向量，随机抽取 --sample 条），
+未指定时生成合成语料（随机主题向量加噪声）。查询取随机样本向量加噪声，以 numpy 暴力检索的 top_k 为真值。
+每组 (M, construction_ef) 在临时目录的本地 Chroma 中建一次索引，search_ef 在同一集合上逐个切换
+（与服务打开已有集合时通过 modify(configuration={"hnsw": {"ef_search": ...}}) 同步的方式一致），
+每组参数测量前校验集合配置中的 ef_search 确已生效。
+
+用法（在 backend 目录下）：
+    python scripts/benchmark_hnsw.py --sample 100000 --m 16 32 --construction-ef 100 200 --search-ef 10 50 100
+    python scripts/benchmark_hnsw.py --vectors-file vectors.npy --sample 50000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HNSW 参数基准测试")
+    parser.add_argument("--vectors-file", help="真实向量样本（.npy，形状为 [条数, 维度]）")
+    parser.add_argument("--sample", type=int, default=50000, help="参与建索引的向量条数")
+    parser.add_argument("--dimension", type=int, default=256, help="合成语料的维度")
+    parser.add_argument("--topics", type=int, default=500, help="合成语料的主题数")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def load_vectors(args, rng):
+    """读取或生成归一化的样本向量"""
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file, mmap_mode="r")
+        picks = rng.choice(len(vectors), size=min(args.sample, len(vectors)), replace=False)
+        vectors = np.asarray(vectors[np.sort(picks)], dtype=np.float32)
+    else:
+        topics = rng.standard_normal((args.topics, args.dimension)).astype(np.float32)
+        vectors = topics[rng.integers(0, args.topics, args.sample)]
+        vectors = vectors + 0.8 * rng.standard_normal(vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2)
+
+
+async def run(args):
+    from app.services.vector_store import VectorStore
+
+    rng = np.random.default_rng(args.seed)
+    vectors = load_vectors(args, rng)
+    source = args.vectors_file or "合成语料"
+    print(f"样本: {len(vectors)} 条向量（{source}），维度 {vectors.shape[1]}")
+
+    picks = rng.integers(0, len(vectors), args.queries)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ vectors.T
+    truth = [
+        {f"v-{i}" for i in np.argpartition(-row, args.top_k)[:args.top_k]}
+        for row in scores
+    ]
+
+    settings.chroma_mode = "local"
+    settings.document_index_enabled = False
+    settings.vector_partition_by_department = False
+    rows = []
+    for m in args.m:
+        for construction_ef in args.construction_ef:
+            settings.chroma_persist_directory = tempfile.mkdtemp(prefix="askit-hnsw-")
+            settings.chroma_hnsw_m = m
+            settings.chroma_hnsw_construction_ef = construction_ef
+            settings.chroma_hnsw_search_ef = args.search_ef[0]
+            store = VectorStore()
+
+            start = time.perf_counter()
+            await store.insert_points(
+                ids=[f"v-{i}" for i in range(len(vectors))],
+                vectors=vectors.tolist(),
+                metadatas=[{"chunk_index": i} for i in range(len(vectors))],
+            )
+            build_seconds = time.perf_counter() - start
+
+            for search_ef in args.search_ef:
+                settings.chroma_hnsw_search_ef = search_ef
+                store.collection = None
+                await store.init_collection()
+                reopened = store.client.get_collection(name=store.collection_name)
+                applied = reopened.configuration_json["hnsw"]["ef_search"]
+                if applied != search_ef:
+                    raise RuntimeError(f"ef_search 未生效：期望 {search_ef}，集合配置为 {applied}")
+
+                latencies, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    hits = await store.search(query.tolist(), limit=args.top_k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    recalls.append(len(expected & {hit["id"] for hit in hits}) / args.top_k)
+                rows.append((m, construction_ef, search_ef, build_seconds, latencies, recalls))
+                print(
+                    f"M={m} construction_ef={construction_ef} search_ef={search_ef}: "
+                    f"recall@{args.top_k}={np.mean(recalls):.3f} p50={percentile(latencies, 50)}ms"
+                )
+            store.shutdown()
+
+    print(
+        f"\n{'M':>4}{'construction_ef':>17}{'search_ef':>11}{'建索引 s':>10}"
+        f"{f'recall@{args.top_k}':>12}{'p50 ms':>10}{'p99 ms':>10}"
+    )
+    for m, construction_ef, search_ef, build_seconds, latencies, recalls in rows:
+        print(
+            f"{m:>4}{construction_ef:>17}{search_ef:>11}{build_seconds:>10.1f}"
+            f"{np.mean(recalls):>12.3f}{percentile(latencies, 50):>10}{percentile(latencies, 99):>10}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -134,6 +134,7 @@ CREATE TABLE document_chunks (
     vector_id VARCHAR(100),
     page_number INTEGER,
     chunk_metadata TEXT,
+    search_tokens TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(document_id, chunk_index)
 );
@@ -141,9 +142,11 @@ CREATE TABLE document_chunks (
 CREATE INDEX idx_document_chunks_document_id ON document_chunks(document_id);
 CREATE INDEX idx_document_chunks_vector_id ON document_chunks(vector_id);
 CREATE INDEX idx_document_chunks_content_trgm ON document_chunks USING gin(content gin_trgm_ops);
+CREATE INDEX ix_document_chunks_search_tokens ON document_chunks USING gin(array_to_tsvector(string_to_array(search_tokens, ' ')));
 COMMENT ON TABLE document_chunks IS '文档分块表';
 COMMENT ON COLUMN document_chunks.vector_id IS '向量数据库中的向量 ID';
 COMMENT ON COLUMN document_chunks.chunk_metadata IS '元数据 (JSON 格式)';
+COMMENT ON COLUMN document_chunks.search_tokens IS '词法检索词元 (中文二元组 + 英文/数字词，空格分隔)';
 
 -- ----------------------------------------------------------------------------
 -- 3.5 对话会话表 (conversations)
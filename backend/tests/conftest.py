@@ -23,3 +23,124 @@ sys.modules['chromadb.config'] = chromadb_mock.config
 def mock_chromadb():
     """Mock chromadb for all tests to avoid initialization issues"""
     return chromadb_mock
+
+
+class FakeRedis:
+    """进程内的异步 Redis 替身，仅实现缓存层用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+
+    def _key(self, key):
+        return key.encode() if isinstance(key, str) else key
+
+    async def get(self, key):
+        return self.data.get(self._key(key))
+
+    async def set(self, key, value, ex=None):
+        self.data[self._key(key)] = value.encode() if isinstance(value, str) else value
+        return True
+
+    async def mget(self, keys):
+        return [self.data.get(self._key(k)) for k in keys]
+
+    async def incr(self, key):
+        value = int(self.data.get(self._key(key), 0)) + 1
+        self.data[self._key(key)] = str(value).encode()
+        return value
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(self._key(k), None) is not None for k in keys)
+
+    async def hset(self, key, field, value):
+        value = value.encode() if isinstance(value, str) else value
+        self.data.setdefault(self._key(key), {})[self._key(field)] = value
+        return 1
+
+    async def hget(self, key, field):
+        return self.data.get(self._key(key), {}).get(self._key(field))
+
+    async def hmget(self, key, fields):
+        bucket = self.data.get(self._key(key), {})
+        return [bucket.get(self._key(f)) for f in fields]
+
+    async def hgetall(self, key):
+        return dict(self.data.get(self._key(key), {}))
+
+    async def hdel(self, key, *fields):
+        bucket = self.data.get(self._key(key), {})
+        return sum(bucket.pop(self._key(f), None) is not None for f in fields)
+
+    async def zadd(self, key, mapping):
+        bucket = self.data.setdefault(self._key(key), {})
+        for member, score in mapping.items():
+            bucket[self._key(member)] = score
+        return len(mapping)
+
+    async def zrevrange(self, key, start, end):
+        bucket = self.data.get(self._key(key), {})
+        members = [m for m, _ in sorted(bucket.items(), key=lambda item: item[1], reverse=True)]
+        return members[start:None if end == -1 else end + 1]
+
+    async def zcard(self, key):
+        return len(self.data.get(self._key(key), {}))
+
+    async def zpopmin(self, key, count=1):
+        bucket = self.data.get(self._key(key), {})
+        popped = sorted(bucket.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del bucket[member]
+        return popped
+
+    async def expire(self, key, seconds):
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """收集命令并在 execute 时依次执行"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = [await command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+@pytest.fixture()
+def fake_redis():
+    """进程内 Redis 替身"""
+    return FakeRedis()
+
+
+@pytest.fixture()
+def rag_settings(monkeypatch):
+    """关闭 RAG 查询中依赖外部服务的可选阶段，测试按需单独开启"""
+    from app.core.config import settings
+
+    for name in (
+        "answer_cache_enabled",
+        "embedding_cache_enabled",
+        "hybrid_search_enabled",
+        "history_summary_enabled",
+        "retrieval_carryover_enabled",
+    ):
+        monkeypatch.setattr(settings, name, False)
+    return settings
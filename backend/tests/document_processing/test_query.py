@@ -25,7 +25,7 @@ async def test_rag_service():
         # 测试简单的嵌入生成
         logger.info("\n1. 测试嵌入生成...")
         test_text = "这是一个测试文本"
-        embedding = await rag_service.embeddings.aembed_query(test_text)
+        embedding = await rag_service.embedding_service.embed_query(test_text)
         logger.info(f"✅ 嵌入生成成功，维度: {len(embedding)}")
 
         # 测试向量搜索
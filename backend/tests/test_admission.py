@@ -0,0 +1,172 @@
+"""
+查询准入控制测试
+"""
+import asyncio
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import query as query_api
+from app.core.auth import get_current_user
+from app.core.metrics import Gauge
+from app.services import admission as admission_module
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def test_gauge_goes_up_and_down():
+    gauge = Gauge("depth")
+    gauge.inc(department=1)
+    gauge.inc(2, department=1)
+    gauge.dec(department=1)
+    assert gauge.value(department=1) == 2
+    gauge.set(0, department=1)
+    assert gauge.snapshot() == {"department=1": 0}
+
+
+def test_department_limit_is_weighted():
+    controller = AdmissionController(department_concurrency=4, department_weights={"7": 0.5, "8": 3})
+    assert controller.department_limit(7) == 2
+    assert controller.department_limit(8) == 12
+    assert controller.department_limit(9) == 4
+
+
+async def test_full_department_queues_then_rejects():
+    controller = AdmissionController(department_concurrency=2, queue_size=1)
+    first = await controller.acquire(101, "a")
+    await controller.acquire(101, "b")
+    waiting = asyncio.create_task(controller.acquire(101, "c"))
+    await asyncio.sleep(0)
+    assert admission_module.queue_depth.value(department=101) == 1
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire(101, "d")
+    assert rejected.value.reason == "queue_full"
+    assert rejected.value.retry_after >= 1
+    assert admission_module.rejected_requests.value(department=101, reason="queue_full") == 1
+
+    # 其他部门不受影响
+    await controller.acquire(102, "e")
+
+    first.release()
+    first.release()
+    ticket = await asyncio.wait_for(waiting, timeout=1)
+    assert ticket.user_id == "c"
+    assert admission_module.queue_depth.value(department=101) == 0
+    assert admission_module.in_flight.value(department=101) == 2
+    assert admission_module.queue_wait.count(department=101) == 3
+
+
+async def test_user_limit_lets_other_users_go_first():
+    controller = AdmissionController(department_concurrency=2, user_concurrency=1)
+    busy = await controller.acquire(201, "script")
+    same_user = asyncio.create_task(controller.acquire(201, "script"))
+    await asyncio.sleep(0)
+    other_user = await asyncio.wait_for(controller.acquire(201, "alice"), timeout=1)
+
+    assert not same_user.done()
+    other_user.release()
+    assert not same_user.done()
+    busy.release()
+    assert (await asyncio.wait_for(same_user, timeout=1)).user_id == "script"
+
+
+async def test_requests_that_cannot_make_the_deadline_are_shed():
+    controller = AdmissionController(department_concurrency=1, queue_timeout_ms=20)
+    async with controller.slot(301, "a"):
+        await asyncio.sleep(0.05)
+
+    async with controller.slot(301, "a"):
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(301, "b")
+
+    assert rejected.value.reason == "deadline"
+    assert admission_module.queue_depth.value(department=301) == 0
+
+
+async def test_queue_timeout_and_cancellation_leave_the_queue():
+    controller = AdmissionController(department_concurrency=1, queue_timeout_ms=20)
+    ticket = await controller.acquire(401, "a")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire(401, "b")
+    assert rejected.value.reason == "timeout"
+
+    waiting = asyncio.create_task(controller.acquire(401, "c"))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert admission_module.queue_depth.value(department=401) == 0
+    ticket.release()
+    assert (await controller.acquire(401, "d")).user_id == "d"
+
+
+async def test_dispatch_skips_waiters_that_already_gave_up():
+    controller = AdmissionController(department_concurrency=1)
+    ticket = await controller.acquire(402, "a")
+    waiting = asyncio.create_task(controller.acquire(402, "b"))
+    await asyncio.sleep(0)
+
+    # 排队超时与额度释放落在同一轮事件循环：future 已取消，调用方还没来得及出队
+    controller._queues[402][0].future.cancel()
+    ticket.release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert controller._running[402] == 0
+    assert admission_module.queue_depth.value(department=402) == 0
+    assert (await controller.acquire(402, "c")).user_id == "c"
+
+
+def test_batch_query_holds_one_ticket_per_concurrent_call(monkeypatch, rag_settings):
+    controller = AdmissionController(department_concurrency=3, user_concurrency=4, queue_size=0)
+    controller._admit(503, 77)
+    observed = {}
+
+    async def batch_query(questions, department_id, top_k, concurrency):
+        observed["concurrency"] = concurrency
+        observed["in_flight"] = controller._running[503]
+        return {"results": [], "timings": {}}
+
+    monkeypatch.setattr(rag_settings, "query_batch_concurrency", 8)
+    monkeypatch.setattr(query_api, "admission_controller", controller)
+    monkeypatch.setattr(query_api, "rag_service", types.SimpleNamespace(batch_query=batch_query))
+    app = FastAPI()
+    app.include_router(query_api.router)
+    app.dependency_overrides[get_current_user] = lambda: types.SimpleNamespace(id=1, department_id=503)
+
+    with TestClient(app) as client:
+        response = client.post("/query/batch", json={"questions": ["a", "b", "c", "d"]})
+        controller._admit(503, 78)
+        controller._admit(503, 79)
+        rejected = client.post("/query/batch", json={"questions": ["a"]})
+
+    assert response.status_code == 200
+    assert observed == {"concurrency": 2, "in_flight": 3}
+    assert rejected.status_code == 429
+    assert controller._running[503] == 3
+
+
+def test_rejected_queries_get_429_with_retry_after(monkeypatch, rag_settings):
+    controller = AdmissionController(department_concurrency=1, queue_size=0)
+    controller._admit(501, 99)
+    monkeypatch.setattr(query_api, "admission_controller", controller)
+    monkeypatch.setattr(query_api, "rag_service", types.SimpleNamespace(
+        query=AsyncMock(return_value={"answer": "年假十五天", "sources": []})
+    ))
+    app = FastAPI()
+    app.include_router(query_api.router)
+    app.dependency_overrides[get_current_user] = lambda: types.SimpleNamespace(id=1, department_id=501)
+
+    with TestClient(app) as client:
+        response = client.post("/query/", json={"question": "年假几天？"})
+        stream = client.post("/query/stream", json={"question": "年假几天？"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert stream.status_code == 429
+    query_api.rag_service.query.assert_not_awaited()
@@ -0,0 +1,152 @@
+"""
+语义答案缓存测试
+"""
+import asyncio
+import types
+from unittest.mock import AsyncMock
+
+from app.core.redis import LoopLocalRedis
+from app.services import rag as rag_module
+from app.services.answer_cache import AnswerCache
+
+
+SOURCES = [{"document_id": 1, "chunk_id": 10, "filename": "handbook.pdf", "score": 0.9}]
+
+
+async def test_similar_question_hits_within_department():
+    cache = AnswerCache(similarity_threshold=0.95)
+    await cache.store(1, 5, "年假几天？", [1.0, 0.0, 0.0], "十五天", SOURCES)
+
+    hit = await cache.lookup(1, 5, [0.99, 0.05, 0.0])
+    assert hit is not None
+    assert hit.answer == "十五天"
+    assert hit.similarity > 0.95
+
+    assert await cache.lookup(1, 5, [0.0, 1.0, 0.0]) is None
+    assert await cache.lookup(2, 5, [1.0, 0.0, 0.0]) is None
+    assert await cache.lookup(1, 3, [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+async def test_entries_expire_after_ttl(monkeypatch):
+    cache = AnswerCache(ttl_seconds=10)
+    now = 1000.0
+    monkeypatch.setattr("app.services.answer_cache.time.time", lambda: now)
+    await cache.store(1, 5, "年假几天？", [1.0, 0.0], "十五天", SOURCES)
+
+    now = 1011.0
+    assert await cache.lookup(1, 5, [1.0, 0.0]) is None
+
+
+async def test_local_tier_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2)
+    await cache.store(1, 5, "q1", [1.0, 0.0, 0.0], "a1", SOURCES)
+    await cache.store(1, 5, "q2", [0.0, 1.0, 0.0], "a2", SOURCES)
+    assert await cache.lookup(1, 5, [1.0, 0.0, 0.0]) is not None  # q1 变为最近使用
+    await cache.store(1, 5, "q3", [0.0, 0.0, 1.0], "a3", SOURCES)
+
+    assert await cache.lookup(1, 5, [0.0, 1.0, 0.0]) is None
+    assert (await cache.lookup(1, 5, [1.0, 0.0, 0.0])).answer == "a1"
+
+
+async def test_redis_tier_is_shared_between_workers(fake_redis):
+    worker_a = AnswerCache(redis_client=fake_redis)
+    worker_b = AnswerCache(redis_client=fake_redis)
+    await worker_a.store(1, 5, "年假几天？", [1.0, 0.0], "十五天", SOURCES)
+
+    hit = await worker_b.lookup(1, 5, [1.0, 0.01])
+    assert hit is not None
+    assert hit.sources == SOURCES
+
+
+async def test_redis_tier_is_size_bounded(fake_redis):
+    cache = AnswerCache(max_entries=2, redis_client=fake_redis)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        await cache.store(1, 5, f"q{i}", vector, f"a{i}", SOURCES)
+
+    assert len(await fake_redis.hgetall("askit:answer_cache:1:v0:k5:vec")) == 2
+    fresh = AnswerCache(redis_client=fake_redis)
+    assert await fresh.lookup(1, 5, [1.0, 0.0, 0.0]) is None
+
+
+async def test_redis_lookup_only_scans_recently_used_entries(monkeypatch, fake_redis):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr("app.services.answer_cache.time.time", lambda: next(clock))
+    writer = AnswerCache(redis_client=fake_redis)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        await writer.store(1, 5, f"q{i}", vector, f"a{i}", SOURCES)
+    fake_redis.hgetall = AsyncMock(side_effect=AssertionError("不应取回整个向量哈希"))
+
+    reader = AnswerCache(redis_scan_entries=2, redis_client=fake_redis)
+    assert await reader.lookup(1, 5, [1.0, 0.0, 0.0]) is None     # q0 最久未使用，不在比对范围内
+    assert (await reader.lookup(1, 5, [0.0, 0.0, 1.0])).answer == "a2"
+    assert (await AnswerCache(redis_client=fake_redis).lookup(1, 5, [1.0, 0.0, 0.0])).answer == "a0"
+
+
+async def test_invalidation_reaches_other_workers(fake_redis):
+    worker_a = AnswerCache(redis_client=fake_redis)
+    worker_b = AnswerCache(redis_client=fake_redis)
+    await worker_a.store(1, 5, "年假几天？", [1.0, 0.0], "十五天", SOURCES)
+    await worker_a.store(2, 5, "年假几天？", [1.0, 0.0], "二十天", SOURCES)
+    assert await worker_b.lookup(1, 5, [1.0, 0.0]) is not None
+
+    await worker_a.invalidate_department(1)
+
+    assert await worker_b.lookup(1, 5, [1.0, 0.0]) is None
+    assert (await worker_b.lookup(2, 5, [1.0, 0.0])).answer == "二十天"
+
+
+def test_shared_redis_client_is_created_per_event_loop():
+    """Celery 任务每次 asyncio.run 新建事件循环，不能复用上一个循环上的 Redis 连接"""
+    redis = LoopLocalRedis(lambda: types.SimpleNamespace(get=AsyncMock(return_value=b"1")))
+
+    async def task():
+        await redis.get("key")
+        return redis.current()
+
+    first, second = asyncio.run(task()), asyncio.run(task())
+    assert first is not second
+    first.get.assert_awaited_once_with("key")
+
+
+async def test_redis_failure_falls_back_to_local_tier():
+    broken = types.SimpleNamespace(get=AsyncMock(side_effect=ConnectionError("down")))
+    cache = AnswerCache(redis_client=broken)
+    await cache.store(1, 5, "年假几天？", [1.0, 0.0], "十五天", SOURCES)
+
+    assert (await cache.lookup(1, 5, [1.0, 0.0])).answer == "十五天"
+    assert broken.get.await_count == 1  # 熔断后不再访问 Redis
+
+
+async def test_rag_query_skips_retrieval_and_llm_on_cache_hit(monkeypatch, rag_settings):
+    cache = AnswerCache()
+    monkeypatch.setattr(rag_module, "answer_cache", cache)
+    monkeypatch.setattr(rag_settings, "answer_cache_enabled", True)
+    search = AsyncMock(return_value=[
+        {"id": "v1", "score": 0.9, "payload": {
+            "document_id": 1, "chunk_id": 10, "filename": "handbook.pdf", "content": "年假十五天",
+        }},
+    ])
+    monkeypatch.setattr(rag_module.vector_store, "search", search)
+
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[1.0, 0.0])
+    )
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="十五天"))
+    )
+
+    first = await service.query("年假几天？", department_id=1)
+    second = await service.query("年假几天?", department_id=1)
+
+    assert first["cached"] is False
+    assert second["cached"] is True
+    assert second["answer"] == "十五天"
+    assert second["sources"] == first["sources"]
+    assert search.await_count == 1
+    assert service.llm.ainvoke.await_count == 1
+
+    await service.query("年假几天？", department_id=1, history=[{"role": "user", "content": "你好"}])
+    assert service.llm.ainvoke.await_count == 2
@@ -0,0 +1,110 @@
+"""
+批量向量写入测试 - 按最大批大小切分、并发执行、按分块 id 幂等
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.flat_index import FlatIndexClient
+from app.services.vector_store import VectorStore, upsert_throughput
+
+
+class MaxBatchClient(FlatIndexClient):
+    """带最大批大小限制的客户端，超过限制的写入直接报错（与 Chroma 一致）"""
+
+    max_batch_size = 1000
+
+    def get_max_batch_size(self):
+        return self.max_batch_size
+
+
+@pytest.fixture()
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "chroma_mode", "flat")
+    monkeypatch.setattr(settings, "flat_index_directory", str(tmp_path))
+    monkeypatch.setattr(settings, "document_index_enabled", True)
+    monkeypatch.setattr(settings, "vector_upsert_concurrency", 3)
+    store = VectorStore()
+    store.client = MaxBatchClient(str(tmp_path))
+    yield store
+    store.shutdown()
+
+
+@pytest.fixture()
+def upserts(store):
+    """记录每次 upsert 的批大小和最大并发数"""
+    calls = {"sizes": [], "in_flight": 0, "max_in_flight": 0}
+    lock = threading.Lock()
+
+    async def instrument():
+        await store.init_collection()
+        collection = store.collection
+        original = collection.upsert
+
+        def upsert(ids, embeddings, metadatas=None):
+            assert len(ids) <= MaxBatchClient.max_batch_size
+            with lock:
+                calls["sizes"].append(len(ids))
+                calls["in_flight"] += 1
+                calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+            time.sleep(0.05)
+            try:
+                original(ids, embeddings, metadatas)
+            finally:
+                with lock:
+                    calls["in_flight"] -= 1
+
+        collection.upsert = upsert
+        collection.add = None               # 写入路径只使用 upsert
+        return calls
+
+    return instrument
+
+
+def _document(chunks=10000, dimension=8, document_id=1):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((chunks, dimension)).astype(np.float32).tolist()
+    metadatas = [{"document_id": document_id, "department_id": 1, "filename": "big.pdf"}] * chunks
+    return [f"{document_id}-{i}" for i in range(chunks)], vectors, metadatas
+
+
+async def test_large_document_is_split_into_concurrent_batches(store, upserts):
+    calls = await upserts()
+
+    report = await store.insert_points(*_document())
+
+    assert sorted(calls["sizes"]) == [1000] * 10
+    assert 1 < calls["max_in_flight"] <= 3
+    assert report["batches"] == 10 and report["rows"] == report["new_rows"] == 10000
+    assert report["rows_per_second"] > 0
+    assert upsert_throughput.value() == report["rows_per_second"]
+    assert store.collection.count() == 10000
+
+
+async def test_retried_insert_is_idempotent(store, upserts):
+    await upserts()
+    ids, vectors, metadatas = _document(chunks=2500)
+    await store.insert_points(ids[:1200], vectors[:1200], metadatas[:1200])
+
+    # 任务重试：整批重新写入
+    report = await store.insert_points(ids, vectors, metadatas)
+
+    assert report["new_rows"] == 1300
+    assert store.collection.count() == 2500
+    stored = store.document_collection.get(ids=["doc-1"], include=["embeddings", "metadatas"])
+    assert stored["metadatas"][0]["chunk_count"] == 2500
+    matrix = np.asarray(vectors)
+    expected = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).mean(axis=0)
+    assert np.allclose(stored["embeddings"][0], expected, atol=1e-5)
+
+
+async def test_configured_batch_size_caps_backend_limit(monkeypatch, store, upserts):
+    monkeypatch.setattr(settings, "vector_upsert_batch_size", 400)
+    calls = await upserts()
+
+    await store.insert_points(*_document(chunks=1000))
+
+    assert sorted(calls["sizes"]) == [200, 400, 400]
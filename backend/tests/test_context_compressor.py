@@ -0,0 +1,110 @@
+"""
+上下文抽取式压缩测试
+"""
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services import context_compressor as compressor_module
+from app.services import rag as rag_module
+from app.services.context_compressor import ContextCompressor, split_sentences
+from app.services.embedding_cache import EmbeddingCache
+
+# 按关键词给句子分配向量：与年假相关的句子和问题向量同向
+QUERY_VECTOR = [1.0, 0.0]
+
+
+async def fake_embed(sentences):
+    return [[1.0, 0.0] if "年假" in s else [0.0, 1.0] for s in sentences]
+
+
+def _chunk(chunk_id, content, score=0.9):
+    return {"id": chunk_id, "score": score, "payload": {
+        "document_id": 1, "chunk_id": chunk_id, "filename": "handbook.pdf", "content": content,
+        "start_pos": 0, "end_pos": len(content),
+    }}
+
+
+def test_split_sentences():
+    assert split_sentences("第一句。第二句！Third one. Fourth?\n第五句") == [
+        "第一句。", "第二句！", "Third one.", "Fourth?", "第五句",
+    ]
+
+
+async def test_keeps_best_sentences_and_their_neighbours():
+    content = "公司位于上海。办公时间为九点到六点。员工年假为每年十五天。食堂提供午餐。停车场在地下二层。"
+    before = compressor_module.compression_ratio.count()
+
+    compressed = await ContextCompressor().compress(
+        [_chunk("a", content), _chunk("b", "报销需提供发票。报销在每月五号前提交。")],
+        QUERY_VECTOR, fake_embed, max_tokens=30, neighbors=1,
+    )
+
+    assert [r["id"] for r in compressed.results] == ["a"]
+    assert compressed.results[0]["payload"]["content"] == "办公时间为九点到六点。员工年假为每年十五天。食堂提供午餐。"
+    assert compressed.output_tokens <= 30
+    assert compressed.ratio < 0.6
+    assert compressed.stats["compression_sentences_kept"] == 3
+    assert compressor_module.compression_ratio.count() == before + 1
+
+
+async def test_gaps_are_marked_and_duplicates_dropped():
+    first = "年假需提前申请。病假需要证明。事假不带薪。婚假十天。年假可以顺延。"
+    compressed = await ContextCompressor().compress(
+        [_chunk("a", first), _chunk("b", "年假可以顺延。产假九十八天。")],
+        QUERY_VECTOR, fake_embed, max_tokens=16, neighbors=0,
+    )
+
+    assert [r["payload"]["content"] for r in compressed.results] == ["年假需提前申请。……年假可以顺延。"]
+
+
+async def test_context_within_budget_is_not_embedded():
+    embed = AsyncMock()
+    results = [_chunk("a", "员工年假为每年十五天。")]
+
+    compressed = await ContextCompressor().compress(results, QUERY_VECTOR, embed, max_tokens=100)
+
+    embed.assert_not_awaited()
+    assert compressed.skipped and compressed.results is results
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "context_compression_enabled", True)
+    monkeypatch.setattr(rag_settings, "context_compression_max_tokens", 30)
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=QUERY_VECTOR),
+        embed_texts=AsyncMock(side_effect=fake_embed),
+    )
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="十五天"))
+    )
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[
+        _chunk("a", "公司位于上海。办公时间为九点到六点。员工年假为每年十五天。食堂提供午餐。停车场在地下二层。"),
+    ]))
+    return service
+
+
+async def test_query_prompt_only_contains_compressed_context(service):
+    result = await service.query("年假几天？", department_id=1)
+
+    prompt = service.llm.ainvoke.await_args.args[0]
+    assert "员工年假为每年十五天。" in prompt
+    assert "停车场" not in prompt
+    assert service.embedding_service.embed_texts.await_count == 1
+    assert "compress_ms" in result["timings"]
+    assert 0 < result["timings"]["compression_ratio"] < 1
+
+
+async def test_sentence_vectors_do_not_enter_the_question_cache(service, monkeypatch, rag_settings):
+    cache = EmbeddingCache(model="m", dimension=len(QUERY_VECTOR))
+    monkeypatch.setattr(rag_module, "embedding_cache", cache)
+    monkeypatch.setattr(rag_settings, "embedding_cache_enabled", True)
+
+    await service.query("年假几天？", department_id=1)
+
+    assert await cache.get("年假几天？") == QUERY_VECTOR
+    assert await cache.get("员工年假为每年十五天。") is None
+    assert cache.stats()["local_entries"] == 1
@@ -0,0 +1,82 @@
+"""
+上下文打包测试
+"""
+from app.services.context_packer import EMPTY_CONTEXT, ContextPacker
+from app.utils.tokens import estimate_tokens, truncate_to_tokens
+
+TEXT = "".join(f"第{i:03d}句。" for i in range(200))
+
+
+def _chunk(start, end, document_id=1, filename="a.md", **extra):
+    return {
+        "id": f"{document_id}-{start}",
+        "score": 0.5,
+        "payload": {
+            "document_id": document_id,
+            "filename": filename,
+            "content": TEXT[start:end],
+            "start_pos": start,
+            "end_pos": end,
+            **extra,
+        },
+    }
+
+
+def test_estimate_and_truncate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("年假十五天") == 5
+    assert estimate_tokens("annual leave") == 3
+    assert estimate_tokens(truncate_to_tokens("年假为每年十五天", 3)) == 3
+
+
+def test_empty_results():
+    packed = ContextPacker().pack([], max_tokens=100)
+    assert packed.text == EMPTY_CONTEXT
+    assert packed.tokens == 0
+
+
+def test_overlapping_chunks_are_merged_once():
+    # chunk_size=50, chunk_overlap=10
+    results = [_chunk(40, 90), _chunk(0, 50), _chunk(80, 130)]
+    packed = ContextPacker().pack(results, max_tokens=10_000)
+
+    assert packed.text == f"【a.md】\n{TEXT[0:130]}"
+    assert packed.chunks_merged == 2
+    assert packed.blocks == 1
+
+
+def test_adjacent_chunks_merge_but_gaps_do_not():
+    results = [_chunk(0, 50), _chunk(50, 100), _chunk(120, 150)]
+    packed = ContextPacker().pack(results, max_tokens=10_000)
+
+    assert packed.text == f"【a.md】\n{TEXT[0:100]}\n\n【a.md】\n{TEXT[120:150]}"
+
+
+def test_chunks_from_other_documents_or_pages_stay_separate():
+    results = [_chunk(0, 50), _chunk(40, 90, document_id=2, filename="b.md"),
+               _chunk(45, 95, page_number=2)]
+    packed = ContextPacker().pack(results, max_tokens=10_000)
+
+    assert packed.blocks == 3
+    assert packed.chunks_merged == 0
+
+
+def test_exact_duplicates_are_dropped():
+    duplicate = _chunk(0, 50, document_id=2)
+    duplicate["payload"].pop("start_pos")
+    packed = ContextPacker().pack([_chunk(0, 50), duplicate], max_tokens=10_000)
+
+    assert packed.duplicates_dropped == 1
+    assert packed.text.count(TEXT[0:50]) == 1
+
+
+def test_budget_is_filled_in_rank_order():
+    results = [_chunk(300, 350), _chunk(0, 50), _chunk(600, 650)]
+    budget = estimate_tokens(f"【a.md】\n{TEXT[300:350]}") + 20
+    packed = ContextPacker().pack(results, max_tokens=budget)
+
+    assert packed.text.startswith(f"【a.md】\n{TEXT[300:350]}\n\n【a.md】\n{TEXT[0:10]}")
+    assert TEXT[600:650] not in packed.text
+    assert packed.tokens <= budget
+    assert packed.truncated
+    assert packed.dropped_blocks == 1
@@ -0,0 +1,78 @@
+"""
+按部门分区的向量集合测试（使用平铺索引后端作为真实的集合存储）
+"""
+import pytest
+
+from app.core.config import settings
+from app.services.vector_store import VectorStore
+
+IDS = ["a1", "a2", "b1", "shared"]
+VECTORS = [[1.0, 0.0], [0.8, 0.2], [0.9, 0.1], [1.0, 0.0]]
+METADATAS = [
+    {"document_id": 1, "department_id": 1},
+    {"document_id": 1, "department_id": 1},
+    {"document_id": 2, "department_id": 2},
+    {"document_id": 3},
+]
+
+
+@pytest.fixture()
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "chroma_mode", "flat")
+    monkeypatch.setattr(settings, "flat_index_directory", str(tmp_path))
+    monkeypatch.setattr(settings, "document_index_enabled", False)
+    monkeypatch.setattr(settings, "vector_partition_by_department", True)
+    store = VectorStore()
+    yield store
+    store.shutdown()
+
+
+async def _ids(store, department_id, **kwargs):
+    return [hit["id"] for hit in await store.search([1.0, 0.0], limit=5, department_id=department_id, **kwargs)]
+
+
+async def test_writes_and_searches_are_routed_by_department(store):
+    await store.insert_points(IDS, VECTORS, METADATAS)
+
+    assert await store._partition_department_ids() == [1, 2]
+    assert (await store._partition(1)).count() == 2
+    assert store.collection.count() == 1
+
+    assert await _ids(store, 1) == ["a1", "a2"]
+    assert await _ids(store, 2) == ["b1"]
+    assert await _ids(store, 1, document_ids=[2]) == []
+    # 没有分区的部门不创建空集合
+    assert await _ids(store, 3) == []
+    assert await store._partition_department_ids() == [1, 2]
+
+
+async def test_delete_points_routes_to_department_or_all_collections(store):
+    await store.insert_points(IDS, VECTORS, METADATAS)
+
+    await store.delete_points(["a1", "b1"], department_id=1)
+    assert await _ids(store, 1) == ["a2"]
+    assert await _ids(store, 2) == ["b1"]
+
+    await store.delete_points(["b1", "shared"])
+    assert await _ids(store, 2) == []
+    assert store.collection.count() == 0
+
+
+async def test_migration_splits_existing_collection(monkeypatch, store):
+    monkeypatch.setattr(settings, "vector_partition_by_department", False)
+    await store.insert_points(IDS, VECTORS, METADATAS)
+    before = {department_id: await _ids(store, department_id) for department_id in (1, 2)}
+
+    assert await store.migrate_to_department_collections(batch_size=2) == {1: 2, 2: 1}
+
+    monkeypatch.setattr(settings, "vector_partition_by_department", True)
+    assert {department_id: await _ids(store, department_id) for department_id in (1, 2)} == before
+    assert store.collection.get()["ids"] == ["shared"]
+    # 重复执行不会重复迁移
+    assert await store.migrate_to_department_collections() == {}
+
+
+async def test_document_index_rebuild_scans_all_partitions(store):
+    await store.insert_points(IDS, VECTORS, METADATAS)
+
+    assert await store.rebuild_document_index(batch_size=1) == 3
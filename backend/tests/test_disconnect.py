@@ -0,0 +1,141 @@
+"""
+客户端断开后取消查询测试
+"""
+import asyncio
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.api import query as query_api
+from app.services import rag as rag_module
+
+
+class HangingLLM:
+    """生成永不结束，记录是否被取消"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def ainvoke(self, prompt):
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        return types.SimpleNamespace(content="年假十五天")
+
+    async def astream(self, prompt):
+        yield types.SimpleNamespace(content="年假")
+        self.started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        yield types.SimpleNamespace(content="十五天")
+
+
+class FakeRequest:
+    """is_disconnected() 在 disconnect 置位后返回 True"""
+
+    def __init__(self):
+        self.disconnect = asyncio.Event()
+
+    async def is_disconnected(self):
+        return self.disconnect.is_set()
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "query_disconnect_poll_ms", 5)
+    service = rag_module.RAGService()
+    service.llm = HangingLLM()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[
+        {"id": "vec-1", "score": 0.9, "payload": {
+            "document_id": 1, "chunk_id": 10, "filename": "handbook.pdf", "content": "年假为每年十五天",
+        }}
+    ]))
+    monkeypatch.setattr(query_api, "rag_service", service)
+    return service
+
+
+USER = types.SimpleNamespace(id=1, department_id=1)
+
+
+async def test_disconnect_cancels_generation(service):
+    request = FakeRequest()
+    cancelled_before = rag_module.cancelled_stages.value(stage="llm")
+    disconnects_before = query_api.client_disconnects.value(endpoint="query")
+
+    call = asyncio.create_task(
+        query_api.query(query_api.QueryRequest(question="年假几天？"), request, USER)
+    )
+    await asyncio.wait_for(service.llm.started.wait(), timeout=1)
+    request.disconnect.set()
+    response = await asyncio.wait_for(call, timeout=1)
+
+    assert response.status_code == query_api.CLIENT_CLOSED_REQUEST
+    assert service.llm.cancelled.is_set()
+    assert rag_module.cancelled_stages.value(stage="llm") == cancelled_before + 1
+    assert query_api.client_disconnects.value(endpoint="query") == disconnects_before + 1
+    assert not service.query_flights._flights
+
+
+async def test_connected_clients_get_the_answer(service):
+    request = FakeRequest()
+    service.llm.release.set()
+
+    result = await query_api.query(query_api.QueryRequest(question="年假几天？"), request, USER)
+
+    assert result["answer"] == "年假十五天"
+
+
+async def test_coalesced_generation_survives_one_disconnect(service):
+    leaving, staying = FakeRequest(), FakeRequest()
+
+    async def ask(request):
+        return await query_api.until_disconnected(
+            request, service.query("年假几天？", department_id=1), endpoint="query"
+        )
+
+    first = asyncio.create_task(ask(leaving))
+    second = asyncio.create_task(ask(staying))
+    await asyncio.wait_for(service.llm.started.wait(), timeout=1)
+    leaving.disconnect.set()
+    with pytest.raises(query_api.ClientDisconnected):
+        await asyncio.wait_for(first, timeout=1)
+
+    assert not service.llm.cancelled.is_set()
+    service.llm.release.set()
+    assert (await asyncio.wait_for(second, timeout=1))["answer"] == "年假十五天"
+
+
+async def test_stream_disconnect_cancels_generation(service):
+    cancelled_before = rag_module.cancelled_stages.value(stage="llm")
+    disconnects_before = query_api.client_disconnects.value(endpoint="stream")
+    response = await query_api.query_stream(query_api.QueryRequest(question="年假几天？"), USER)
+    received = []
+
+    async def consume():
+        async for message in response.body_iterator:
+            received.append(message)
+
+    # 模拟 StreamingResponse 检测到断开后取消发送任务
+    sender = asyncio.create_task(consume())
+    await asyncio.wait_for(service.llm.started.wait(), timeout=1)
+    sender.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await sender
+
+    await asyncio.wait_for(service.llm.cancelled.wait(), timeout=1)
+    assert [m.split("\n")[0] for m in received] == ["event: sources", "event: token"]
+    assert query_api.client_disconnects.value(endpoint="stream") == disconnects_before + 1
+    assert rag_module.cancelled_stages.value(stage="llm") == cancelled_before + 1
+    assert not service.stream_flights._flights
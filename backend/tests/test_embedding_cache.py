@@ -0,0 +1,73 @@
+"""
+查询向量缓存测试
+"""
+import types
+from unittest.mock import AsyncMock
+
+from app.services import rag as rag_module
+from app.services import embedding_cache as embedding_cache_module
+from app.services.embedding_cache import EmbeddingCache, normalize_text
+
+
+def test_cache_key_depends_on_normalized_text_model_and_dimension():
+    cache = EmbeddingCache(model="text-embedding-3-small", dimension=1536)
+
+    assert normalize_text("  年假  几天？ ") == "年假 几天?"
+    assert cache.cache_key("年假 几天？") == cache.cache_key(" 年假\n几天? ")
+    assert cache.cache_key("年假几天？") != EmbeddingCache(
+        model="embedding-3", dimension=1536
+    ).cache_key("年假几天？")
+    assert cache.cache_key("年假几天？") != EmbeddingCache(
+        model="text-embedding-3-small", dimension=512
+    ).cache_key("年假几天？")
+
+
+async def test_local_tier_is_lru_bounded():
+    cache = EmbeddingCache(model="m", dimension=2, max_entries=2)
+    await cache.set("a", [1.0, 0.0])
+    await cache.set("b", [0.0, 1.0])
+    assert await cache.get("a") == [1.0, 0.0]
+    await cache.set("c", [0.5, 0.5])
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == [1.0, 0.0]
+
+
+async def test_redis_tier_shared_and_counted(fake_redis):
+    local_hits = embedding_cache_module.cache_hits.value(tier="local")
+    redis_hits = embedding_cache_module.cache_hits.value(tier="redis")
+    misses = embedding_cache_module.cache_misses.value()
+
+    worker_a = EmbeddingCache(model="m", dimension=2, redis_client=fake_redis)
+    worker_b = EmbeddingCache(model="m", dimension=2, redis_client=fake_redis)
+    await worker_a.set("年假几天？", [0.25, 0.5])
+
+    assert await worker_b.get_many(["年假几天？", "未知问题"]) == [[0.25, 0.5], None]
+    assert await worker_b.get("年假几天？") == [0.25, 0.5]
+
+    assert embedding_cache_module.cache_hits.value(tier="redis") == redis_hits + 1
+    assert embedding_cache_module.cache_hits.value(tier="local") == local_hits + 1
+    assert embedding_cache_module.cache_misses.value() == misses + 1
+
+
+async def test_rag_query_skips_embedding_call_on_warm_hit(monkeypatch, rag_settings):
+    cache = EmbeddingCache(model="m", dimension=2)
+    monkeypatch.setattr(rag_module, "embedding_cache", cache)
+    monkeypatch.setattr(rag_settings, "embedding_cache_enabled", True)
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[]))
+
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="没有找到"))
+    )
+
+    await service.query("年假几天？", department_id=1)
+    await service.query("年假几天？ ", department_id=1)
+
+    assert service.embedding_service.embed_query.await_count == 1
+    rag_module.vector_store.search.assert_awaited_with(
+        vector=[0.1, 0.2], limit=5, department_id=1
+    )
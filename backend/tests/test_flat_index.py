@@ -0,0 +1,211 @@
+"""
+NumPy 平铺索引后端测试
+"""
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import flat_index
+from app.services.flat_index import FlatIndexClient
+from app.services.vector_store import VectorStore
+
+
+def _corpus(rng, rows=300, dimension=16, departments=3, documents=30):
+    vectors = rng.standard_normal((rows, dimension)).astype(np.float32)
+    metadatas = [
+        {"department_id": i % departments + 1, "document_id": i % documents + 1, "chunk_id": i}
+        for i in range(rows)
+    ]
+    return [f"chunk-{i}" for i in range(rows)], vectors, metadatas
+
+
+def _brute_force(vectors, metadatas, query, k, predicate):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    candidates = [i for i, metadata in enumerate(metadatas) if predicate(metadata)]
+    top = sorted(candidates, key=lambda i: -scores[i])[:k]
+    return [f"chunk-{metadatas[i]['chunk_id']}" for i in top]
+
+
+@pytest.fixture()
+def collection(tmp_path):
+    return FlatIndexClient(str(tmp_path)).create_collection("documents")
+
+
+def test_query_is_exact_with_department_and_document_filters(collection):
+    rng = np.random.default_rng(0)
+    ids, vectors, metadatas = _corpus(rng)
+    collection.add(ids, vectors.tolist(), metadatas)
+    queries = rng.standard_normal((4, vectors.shape[1])).astype(np.float32)
+
+    result = collection.query(queries.tolist(), n_results=5, where={"department_id": 2})
+    for query, hits in zip(queries, result["ids"]):
+        assert hits == _brute_force(vectors, metadatas, query, 5, lambda m: m["department_id"] == 2)
+
+    where = {"$and": [{"department_id": 1}, {"document_id": {"$in": [1, 4, 7]}}]}
+    result = collection.query(queries[:1].tolist(), n_results=5, where=where)
+    assert result["ids"][0] == _brute_force(
+        vectors, metadatas, queries[0], 5,
+        lambda m: m["department_id"] == 1 and m["document_id"] in (1, 4, 7),
+    )
+    assert all(0 <= d <= 2 for d in result["distances"][0])
+
+    result = collection.query(queries[:1].tolist(), n_results=3)
+    assert result["ids"][0] == _brute_force(vectors, metadatas, queries[0], 3, lambda m: True)
+
+
+def test_deletes_and_upserts_survive_reload(tmp_path, collection):
+    collection.add(
+        ["a", "b", "c"],
+        [[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]],
+        [{"department_id": 1, "document_id": 1}] * 3,
+    )
+    collection.delete(ids=["b"])
+    collection.upsert(["a"], [[0.0, -1.0]], [{"department_id": 1, "document_id": 2}])
+
+    reopened = FlatIndexClient(str(tmp_path)).get_collection("documents")
+
+    assert reopened.count() == 2
+    stored = reopened.get(ids=["a", "b"], include=["embeddings", "metadatas"])
+    assert stored["ids"] == ["a"]
+    assert stored["embeddings"] == [[0.0, -1.0]]
+    assert stored["metadatas"] == [{"department_id": 1, "document_id": 2}]
+    assert reopened.query([[1.0, 0.0]], n_results=1)["ids"] == [["c"]]
+
+
+def test_tombstones_are_compacted(tmp_path):
+    collection = FlatIndexClient(str(tmp_path), compaction_ratio=0.5).create_collection("documents")
+    rng = np.random.default_rng(1)
+    ids, vectors, metadatas = _corpus(rng, rows=40, departments=1, documents=40)
+    collection.add(ids, vectors.tolist(), metadatas)
+    query = vectors[:1].tolist()
+    expected = _brute_force(vectors[20:], metadatas[20:], vectors[0], 5, lambda m: True)
+
+    collection.delete(where={"document_id": {"$in": list(range(1, 21))}})
+
+    shard = collection._shards["1"]
+    assert shard.size == 20 and shard.dead == 0
+    assert collection.count() == 20
+    assert collection.query(query, n_results=5)["ids"][0] == expected
+    log_lines = open(os.path.join(shard.path, "rows.jsonl"), encoding="utf-8").read().splitlines()
+    assert len(log_lines) == 20
+
+    reopened = FlatIndexClient(str(tmp_path)).get_collection("documents")
+    assert reopened.query(query, n_results=5)["ids"][0] == expected
+
+
+def test_query_skips_tombstones_without_compaction(collection):
+    rng = np.random.default_rng(2)
+    ids, vectors, metadatas = _corpus(rng, rows=60, departments=1, documents=6)
+    collection.add(ids, vectors.tolist(), metadatas)
+    collection.delete(where={"document_id": 1})
+    live = lambda m: m["document_id"] != 1
+
+    shard = collection._shards["1"]
+    assert shard.dead == 10 and shard.size == 60
+    for query in vectors[:3]:
+        result = collection.query([query.tolist()], n_results=8)
+        assert result["ids"][0] == _brute_force(vectors, metadatas, query, 8, live)
+
+    result = collection.query(vectors[:1].tolist(), n_results=100)
+    assert len(result["ids"][0]) == 50
+    assert all(np.isfinite(d) for d in result["distances"][0])
+
+    # 过滤后只剩少量行时走按行取向量的路径，结果应一致
+    where = {"document_id": {"$in": [2]}}
+    result = collection.query(vectors[:1].tolist(), n_results=4, where=where)
+    assert result["ids"][0] == _brute_force(
+        vectors, metadatas, vectors[0], 4, lambda m: m["document_id"] == 2
+    )
+
+
+def test_writes_from_another_process_become_visible(tmp_path):
+    api = FlatIndexClient(str(tmp_path)).create_collection("documents")
+    worker = FlatIndexClient(str(tmp_path)).get_collection("documents")
+    api.add(["a"], [[1.0, 0.0]], [{"department_id": 1, "document_id": 1}])
+    assert worker.count() == 1
+
+    worker.add(["b", "c"], [[0.0, 1.0], [0.6, 0.8]], [{"department_id": 1, "document_id": 2}] * 2)
+    worker.add(["d"], [[0.0, 1.0]], [{"department_id": 2, "document_id": 3}])
+    assert api.query([[0.0, 1.0]], n_results=2, where={"department_id": 1})["ids"] == [["b", "c"]]
+    assert api.count() == 4
+
+    worker.delete(ids=["b"])
+    worker.compact()
+    assert api.get(ids=["a", "b", "c"])["ids"] == ["a", "c"]
+    assert api.query([[0.0, 1.0]], n_results=1, where={"department_id": 1})["ids"] == [["c"]]
+
+
+def _append_batches(path, prefix, batches):
+    collection = FlatIndexClient(path).get_collection("documents")
+    for batch in range(batches):
+        ids = [f"{prefix}-{batch}-{i}" for i in range(20)]
+        vectors = [[float(batch), float(i), 1.0] for i in range(20)]
+        collection.add(ids, vectors, [{"department_id": 1, "document_id": batch} for _ in ids])
+
+
+@pytest.mark.skipif(flat_index.fcntl is None, reason="需要 flock")
+def test_concurrent_writers_in_separate_processes_do_not_corrupt_shards(tmp_path):
+    FlatIndexClient(str(tmp_path)).create_collection("documents")
+    context = multiprocessing.get_context("fork")
+    writers = [
+        context.Process(target=_append_batches, args=(str(tmp_path), prefix, 15))
+        for prefix in ("api", "worker")
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(timeout=60)
+        assert writer.exitcode == 0
+
+    reopened = FlatIndexClient(str(tmp_path)).get_collection("documents")
+    assert reopened.count() == 600
+    stored = reopened.get(ids=["api-14-3", "worker-7-19"], include=["embeddings"])
+    assert stored["embeddings"] == [[14.0, 3.0, 1.0], [7.0, 19.0, 1.0]]
+
+
+def test_shard_grows_beyond_initial_capacity(collection):
+    rng = np.random.default_rng(2)
+    for offset in range(0, 600, 200):
+        vectors = rng.standard_normal((200, 8)).astype(np.float32)
+        collection.add(
+            [f"chunk-{i}" for i in range(offset, offset + 200)],
+            vectors.tolist(),
+            [{"department_id": 1, "document_id": 1}] * 200,
+        )
+
+    assert collection.count() == 600
+    assert collection._shards["1"].capacity >= 600
+    page = collection.get(limit=100, offset=550)
+    assert page["ids"] == [f"chunk-{i}" for i in range(550, 600)]
+
+
+async def test_vector_store_runs_on_flat_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "chroma_mode", "flat")
+    monkeypatch.setattr(settings, "flat_index_directory", str(tmp_path))
+    monkeypatch.setattr(settings, "flat_index_compaction_ratio", 0.9)
+    monkeypatch.setattr(settings, "document_index_enabled", True)
+    store = VectorStore()
+    try:
+        await store.insert_points(
+            ["a1", "a2", "b1"],
+            [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]],
+            [
+                {"document_id": 1, "department_id": 1, "filename": "a.pdf"},
+                {"document_id": 1, "department_id": 1, "filename": "a.pdf"},
+                {"document_id": 2, "department_id": 1, "filename": "b.pdf"},
+            ],
+        )
+
+        hits = await store.search_hierarchical([1.0, 0.0], limit=5, department_id=1, top_documents=1)
+        assert [hit["id"] for hit in hits] == ["a1", "a2"]
+        assert hits[0]["score"] == pytest.approx(1.0)
+
+        await store.delete_points(["a1"])
+        assert [hit["id"] for hit in await store.search([1.0, 0.0], department_id=1)] == ["a2", "b1"]
+        assert await store.compact() == 1
+    finally:
+        store.shutdown()
@@ -0,0 +1,156 @@
+"""
+对冲生成测试（本地桩端点 + 注入延迟）
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.services import hedging as hedging_module
+from app.services import rag as rag_module
+from app.services.hedging import HedgedLLM
+
+
+class StubEndpoint:
+    """OpenAI 兼容的流式桩端点，首个 token 前等待 delay 秒"""
+
+    def __init__(self, delay, tokens, fail=False):
+        self.delay = delay
+        self.tokens = tokens
+        self.fail = fail
+        self.calls = 0
+        self.finished = 0
+        self.cancelled = 0
+
+    async def handler(self, request):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            return httpx.Response(500, json={"error": {"message": "upstream down"}})
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, content=self._body()
+        )
+
+    async def _body(self):
+        for token in self.tokens:
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        self.finished += 1
+        yield b"data: [DONE]\n\n"
+
+    def chat_model(self):
+        return ChatOpenAI(
+            model="stub", api_key="key", base_url="http://stub/v1", max_retries=0,
+            http_async_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handler)),
+        )
+
+
+def _hedged(primary, secondary, **kwargs):
+    kwargs.setdefault("max_deadline_ms", 50)
+    return HedgedLLM(primary.chat_model(), secondary.chat_model(), **kwargs)
+
+
+async def test_fast_primary_is_never_hedged():
+    primary = StubEndpoint(0, ["年假", "十五天"])
+    secondary = StubEndpoint(0, ["备用"])
+    before = hedging_module.hedge_requests.value(winner="primary", hedged="false")
+
+    result = await _hedged(primary, secondary).ainvoke("年假几天？")
+
+    assert result.content == "年假十五天"
+    assert secondary.calls == 0
+    assert hedging_module.hedge_requests.value(winner="primary", hedged="false") == before + 1
+
+
+async def test_slow_primary_loses_to_secondary_and_is_cancelled():
+    primary = StubEndpoint(1, ["主模型回答"])
+    secondary = StubEndpoint(0.01, ["备用", "回答"])
+    wasted_before = hedging_module.hedge_wasted_tokens.value()
+    wins_before = hedging_module.hedge_requests.value(winner="secondary", hedged="true")
+
+    llm = _hedged(primary, secondary)
+    tokens = [chunk.content async for chunk in llm.astream("年假几天？")]
+
+    assert "".join(tokens) == "备用回答"
+    assert primary.cancelled == 1
+    assert primary.finished == 0
+    assert hedging_module.hedge_requests.value(winner="secondary", hedged="true") == wins_before + 1
+    assert hedging_module.hedge_wasted_tokens.value() > wasted_before
+    # 被截断的主模型延迟也计入样本
+    assert len(llm._samples) == 1
+
+
+async def test_primary_still_wins_when_it_answers_first_after_hedging():
+    primary = StubEndpoint(0.08, ["主模型回答"])
+    secondary = StubEndpoint(1, ["备用回答"])
+
+    result = await _hedged(primary, secondary).ainvoke("年假几天？")
+
+    assert result.content == "主模型回答"
+    assert secondary.calls == 1
+    assert secondary.cancelled == 1
+
+
+async def test_primary_error_falls_back_to_secondary():
+    primary = StubEndpoint(0, [], fail=True)
+    secondary = StubEndpoint(0, ["备用回答"])
+
+    result = await _hedged(primary, secondary, max_deadline_ms=5000).ainvoke("年假几天？")
+
+    assert result.content == "备用回答"
+
+
+async def test_both_failing_raises():
+    primary = StubEndpoint(0, [], fail=True)
+    secondary = StubEndpoint(0, [], fail=True)
+
+    with pytest.raises(Exception):
+        await _hedged(primary, secondary).ainvoke("年假几天？")
+
+
+async def test_caller_cancellation_cancels_every_attempt():
+    primary = StubEndpoint(1, ["主模型回答"])
+    secondary = StubEndpoint(1, ["备用回答"])
+
+    task = asyncio.create_task(_hedged(primary, secondary).ainvoke("年假几天？"))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert primary.cancelled == 1
+    assert secondary.cancelled == 1
+
+
+def test_deadline_follows_primary_latency_percentile():
+    llm = HedgedLLM(None, None, percentile=0.9, min_deadline_ms=100, max_deadline_ms=3000,
+                    min_samples=10)
+    assert llm.deadline_ms() == 3000
+
+    llm._samples.extend(range(200, 1200, 100))
+    assert llm.deadline_ms() == 1100
+
+    llm._samples.clear()
+    llm._samples.extend([10] * 10)
+    assert llm.deadline_ms() == 100
+
+
+def test_rag_service_wraps_llm_when_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_enabled", True)
+    monkeypatch.setattr(settings, "llm_hedge_model", "backup-model")
+
+    service = rag_module.RAGService()
+
+    assert isinstance(service.llm, HedgedLLM)
+    assert service.llm.secondary.model_name == "backup-model"
+    assert service.llm.primary.model_name == settings.llm_model
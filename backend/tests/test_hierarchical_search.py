@@ -0,0 +1,161 @@
+"""
+文档级索引与两阶段检索测试
+"""
+import types
+from unittest.mock import AsyncMock
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import rag as rag_module
+from app.services.vector_store import VectorStore
+
+
+def _matches(metadata, where):
+    if not where:
+        return True
+    if "$and" in where:
+        return all(_matches(metadata, condition) for condition in where["$and"])
+    (key, expected), = where.items()
+    if isinstance(expected, dict):
+        return metadata.get(key) in expected["$in"]
+    return metadata.get(key) == expected
+
+
+class FakeCollection:
+    """内存中的 Chroma 集合（余弦距离）"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = {}
+        self.queries = []
+
+    def add(self, ids, embeddings, metadatas):
+        self.upsert(ids, embeddings, metadatas)
+
+    def upsert(self, ids, embeddings, metadatas):
+        for row_id, embedding, metadata in zip(ids, embeddings, metadatas):
+            self.rows[row_id] = (list(embedding), dict(metadata))
+
+    def get(self, ids=None, include=None, limit=None, offset=0):
+        keys = [k for k in (ids or self.rows) if k in self.rows]
+        if ids is None:
+            keys = keys[offset:offset + limit]
+        return {
+            "ids": keys,
+            "embeddings": [self.rows[k][0] for k in keys],
+            "metadatas": [self.rows[k][1] for k in keys],
+        }
+
+    def query(self, query_embeddings, n_results, where=None):
+        self.queries.append(where)
+        result = {"ids": [], "distances": [], "metadatas": []}
+        for vector in query_embeddings:
+            query = np.asarray(vector) / np.linalg.norm(vector)
+            scored = []
+            for row_id, (embedding, metadata) in self.rows.items():
+                if _matches(metadata, where):
+                    embedding = np.asarray(embedding)
+                    scored.append((1 - float(query @ embedding / np.linalg.norm(embedding)), row_id))
+            scored.sort()
+            top = scored[:n_results]
+            result["ids"].append([row_id for _, row_id in top])
+            result["distances"].append([distance for distance, _ in top])
+            result["metadatas"].append([self.rows[row_id][1] for _, row_id in top])
+        return result
+
+    def count(self):
+        return len(self.rows)
+
+
+class FakeClient:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def create_collection(self, name, configuration=None):
+        self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+    def delete_collection(self, name):
+        self.collections.pop(name, None)
+
+
+@pytest.fixture()
+def store(monkeypatch):
+    monkeypatch.setattr(settings, "chroma_mode", "local")
+    store = VectorStore()
+    store.client = FakeClient()
+    return store
+
+
+def _chunk(document_id, index, department_id=1):
+    return {"document_id": document_id, "department_id": department_id,
+            "filename": f"doc{document_id}.pdf", "chunk_id": index}
+
+
+async def test_document_vectors_are_running_means(store):
+    await store.insert_points(
+        ["a", "b"], [[1.0, 0.0], [0.0, 2.0]], [_chunk(1, 0), _chunk(1, 1)]
+    )
+    await store.insert_points(["c"], [[3.0, 0.0]], [_chunk(1, 2)])
+
+    embedding, metadata = store.document_collection.rows["doc-1"]
+    assert embedding == pytest.approx([2 / 3, 1 / 3])
+    assert metadata == {"document_id": 1, "department_id": 1, "filename": "doc1.pdf", "chunk_count": 3}
+
+
+async def test_rebuild_matches_incremental_index(store):
+    vectors = [[1.0, 0.0], [0.0, 2.0], [3.0, 0.0], [0.5, 0.5]]
+    metadatas = [_chunk(1, 0), _chunk(1, 1), _chunk(1, 2), _chunk(2, 0, department_id=2)]
+    await store.insert_points(["a", "b", "c", "d"], vectors, metadatas)
+    incremental = dict(store.document_collection.rows)
+
+    assert await store.rebuild_document_index(batch_size=3) == 2
+    for key, (embedding, metadata) in store.document_collection.rows.items():
+        assert embedding == pytest.approx(incremental[key][0])
+        assert metadata == incremental[key][1]
+
+
+async def test_chunk_search_is_restricted_to_top_documents(store):
+    await store.insert_points(
+        ["a1", "a2", "b1", "c1"],
+        [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.95, 0.05]],
+        [_chunk(1, 0), _chunk(1, 1), _chunk(2, 0), _chunk(3, 0, department_id=2)],
+    )
+
+    hits = await store.search_hierarchical([1.0, 0.0], limit=5, department_id=1, top_documents=1)
+
+    assert [hit["id"] for hit in hits] == ["a1", "a2"]
+    assert store.collection.queries[-1] == {
+        "$and": [{"department_id": 1}, {"document_id": {"$in": [1]}}]
+    }
+
+
+async def test_empty_document_index_falls_back_to_flat_search(store):
+    await store.init_collection()
+    store.collection.add(["a"], [[1.0, 0.0]], [_chunk(1, 0)])
+
+    hits = await store.search_hierarchical([1.0, 0.0], limit=5, department_id=1)
+
+    assert [hit["id"] for hit in hits] == ["a"]
+    assert store.collection.queries[-1] == {"department_id": 1}
+
+
+async def test_rag_uses_two_stage_search_when_enabled(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "hierarchical_search_enabled", True)
+    monkeypatch.setattr(rag_settings, "hierarchical_top_documents", 7)
+    hierarchical = AsyncMock(return_value=[])
+    flat = AsyncMock(return_value=[])
+    monkeypatch.setattr(rag_module.vector_store, "search_hierarchical", hierarchical)
+    monkeypatch.setattr(rag_module.vector_store, "search", flat)
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(embed_query=AsyncMock(return_value=[0.1]))
+
+    await service.query("年假几天？", department_id=3, top_k=4)
+
+    hierarchical.assert_awaited_once_with([0.1], limit=4, department_id=3, top_documents=7)
+    flat.assert_not_awaited()
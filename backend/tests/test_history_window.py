@@ -0,0 +1,127 @@
+"""
+对话历史窗口测试
+"""
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services import rag as rag_module
+from app.services.history import ConversationHistory
+
+
+def _history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题{i}"})
+        messages.append({"role": "assistant", "content": f"回答{i}"})
+    return messages
+
+
+class FakeSummaryLLM:
+    """记录摘要调用的 LLM"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        return types.SimpleNamespace(content=f"摘要v{len(self.prompts)}")
+
+
+@pytest.fixture()
+def history_settings(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "history_summary_enabled", True)
+    monkeypatch.setattr(rag_settings, "history_recent_turns", 2)
+    monkeypatch.setattr(rag_settings, "history_max_tokens", 1000)
+    return rag_settings
+
+
+async def test_short_history_is_kept_verbatim(history_settings):
+    window = await ConversationHistory().build(_history(2), llm=FakeSummaryLLM())
+
+    assert window.text == "对话历史：\n用户：问题0\n助手：回答0\n用户：问题1\n助手：回答1"
+    assert window.summarized_messages == 0
+    assert window.stats["history_tokens_saved"] == 0
+
+
+async def test_older_turns_are_folded_into_summary(history_settings):
+    llm = FakeSummaryLLM()
+    window = await ConversationHistory().build(_history(5), conversation_key="u1:c1", llm=llm)
+
+    assert window.text == "对话历史：\n（早先对话摘要）摘要v1\n用户：问题3\n助手：回答3\n用户：问题4\n助手：回答4"
+    assert window.recent_messages == 4
+    assert window.summarized_messages == 6
+    assert "问题0" in llm.prompts[0] and "问题3" not in llm.prompts[0]
+
+
+async def test_summary_is_extended_incrementally(history_settings):
+    llm = FakeSummaryLLM()
+    history = ConversationHistory()
+    await history.build(_history(4), conversation_key="u1:c1", llm=llm)
+    await history.build(_history(4), conversation_key="u1:c1", llm=llm)
+    assert len(llm.prompts) == 1  # 窗口未滑动，直接复用摘要
+
+    window = await history.build(_history(5), conversation_key="u1:c1", llm=llm)
+
+    assert len(llm.prompts) == 2
+    assert "已有摘要：\n摘要v1" in llm.prompts[1]
+    assert "问题2" in llm.prompts[1] and "问题1" not in llm.prompts[1]
+    assert "（早先对话摘要）摘要v2" in window.text
+
+
+async def test_rewritten_history_is_summarized_from_scratch(history_settings):
+    llm = FakeSummaryLLM()
+    history = ConversationHistory()
+    await history.build(_history(4), conversation_key="u1:c1", llm=llm)
+
+    edited = _history(5)
+    edited[0]["content"] = "改写后的问题"
+    await history.build(edited, conversation_key="u1:c1", llm=llm)
+
+    assert "已有摘要" not in llm.prompts[1]
+    assert "改写后的问题" in llm.prompts[1]
+
+
+async def test_summary_cache_is_shared_through_redis(history_settings, fake_redis):
+    llm = FakeSummaryLLM()
+    await ConversationHistory(redis_client=fake_redis).build(_history(4), "u1:c1", llm)
+    await ConversationHistory(redis_client=fake_redis).build(_history(4), "u1:c1", llm)
+
+    assert len(llm.prompts) == 1
+
+
+async def test_recent_turns_respect_token_budget(history_settings, monkeypatch):
+    monkeypatch.setattr(history_settings, "history_max_tokens", 14)
+    window = await ConversationHistory().build(_history(2), llm=None)
+
+    assert window.text == "对话历史：\n用户：问题1\n助手：回答1"
+    assert window.stats["history_tokens_saved"] > 0
+
+
+async def test_summary_failure_drops_older_turns(history_settings):
+    llm = types.SimpleNamespace(ainvoke=AsyncMock(side_effect=RuntimeError("llm down")))
+    window = await ConversationHistory().build(_history(3), llm=llm)
+
+    assert window.text == "对话历史：\n用户：问题1\n助手：回答1\n用户：问题2\n助手：回答2"
+
+
+async def test_rag_query_reports_history_savings(monkeypatch, history_settings):
+    monkeypatch.setattr(rag_module, "conversation_history", ConversationHistory())
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[]))
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="答案"))
+    )
+
+    result = await service.query("新问题", department_id=1, history=_history(6),
+                                 conversation_key="u1:c1")
+
+    prompt = service.llm.ainvoke.await_args_list[-1].args[0]
+    assert "问题0" not in prompt
+    assert "用户：问题5" in prompt
+    assert result["timings"]["history_tokens_saved"] > 0
+    assert result["timings"]["history_summarized_messages"] == 8
@@ -0,0 +1,100 @@
+"""
+HNSW 索引参数测试
+"""
+import copy
+
+import pytest
+
+from app.core.config import settings
+from app.services.vector_store import VectorStore
+
+
+class FakeCollection:
+    """按 chromadb 1.x 的语义：HNSW 参数在 configuration_json 中，只能通过 modify(configuration=...) 修改 ef_search
+
+    modify(metadata=...) 只替换元数据，不影响索引配置
+    """
+
+    def __init__(self, name, configuration):
+        self.name = name
+        self.metadata = None
+        self.configuration_json = copy.deepcopy(configuration or {})
+        self.modified = []
+
+    def modify(self, metadata=None, configuration=None):
+        self.modified.append({"metadata": metadata, "configuration": configuration})
+        if metadata is not None:
+            self.metadata = dict(metadata)
+        if configuration is not None:
+            if "hnsw" not in self.configuration_json:
+                raise ValueError("collection does not use an HNSW index")
+            for key in configuration["hnsw"]:
+                assert key in ("ef_search", "num_threads", "batch_size", "sync_threshold", "resize_factor")
+            self.configuration_json.setdefault("hnsw", {}).update(configuration["hnsw"])
+
+
+class FakeClient:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def create_collection(self, name, configuration=None):
+        self.collections[name] = FakeCollection(name, configuration)
+        return self.collections[name]
+
+
+@pytest.fixture()
+def store(monkeypatch):
+    monkeypatch.setattr(settings, "chroma_mode", "local")
+    monkeypatch.setattr(settings, "chroma_hnsw_construction_ef", 200)
+    monkeypatch.setattr(settings, "chroma_hnsw_search_ef", 64)
+    monkeypatch.setattr(settings, "chroma_hnsw_m", 32)
+    store = VectorStore()
+    store.client = FakeClient()
+    yield store
+    store.shutdown()
+
+
+async def test_new_collections_use_configured_hnsw_parameters(store):
+    await store.init_collection()
+    await store.init_document_collection()
+    partition = await store._partition(7)
+
+    expected = {"hnsw": {"space": "cosine", "ef_construction": 200, "ef_search": 64, "max_neighbors": 32}}
+    for collection in (store.collection, store.document_collection, partition):
+        assert collection.configuration_json == expected
+        assert collection.modified == []
+
+
+async def test_search_ef_is_updated_through_configuration_on_existing_collections(store):
+    existing = store.client.create_collection(
+        "documents",
+        configuration={"hnsw": {"space": "cosine", "ef_construction": 100, "ef_search": 10, "max_neighbors": 16}},
+    )
+
+    await store.init_collection()
+
+    assert store.collection is existing
+    assert existing.modified == [{"metadata": None, "configuration": {"hnsw": {"ef_search": 64}}}]
+    assert existing.configuration_json["hnsw"] == {
+        "space": "cosine", "ef_construction": 100, "ef_search": 64, "max_neighbors": 16,
+    }
+
+    # 已同步的集合再次打开时不重复修改
+    store.collection = None
+    await store.init_collection()
+    assert len(existing.modified) == 1
+
+
+async def test_cloud_collections_use_spann_and_are_not_modified(store, monkeypatch):
+    monkeypatch.setattr(settings, "chroma_mode", "cloud")
+    monkeypatch.setattr(store, "_scope", lambda: {})
+    existing = store.client.create_collection("documents", configuration={"spann": {"space": "cosine"}})
+
+    await store.init_collection()
+    await store.init_document_collection()
+
+    assert existing.modified == []
+    assert store.document_collection.configuration_json == {"spann": {"space": "cosine"}}
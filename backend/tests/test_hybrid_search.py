@@ -0,0 +1,143 @@
+"""
+混合检索测试
+"""
+import asyncio
+import json
+import types
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.models.models import get_chunk_search_tokens
+from app.services import rag as rag_module
+from app.services.hybrid_search import LexicalSearcher, reciprocal_rank_fusion
+from app.utils.lexical import build_search_tokens, build_tsquery, tokenize_for_search
+
+
+def _hit(hit_id, score=0.5, **payload):
+    return {"id": hit_id, "score": score, "payload": {"document_id": 1, "chunk_id": hit_id,
+                                                        "filename": "a.pdf", "content": hit_id, **payload}}
+
+
+class TestLexicalTokens:
+    """词元切分"""
+
+    def test_chinese_is_split_into_bigrams(self):
+        assert tokenize_for_search("年假规定") == ["年假", "假规", "规定"]
+        assert tokenize_for_search("天") == ["天"]
+
+    def test_identifiers_keep_joined_form(self):
+        tokens = tokenize_for_search("错误码ERR-1042")
+        assert "err1042" in tokens
+        assert {"err", "1042"} <= set(tokens)
+
+    def test_tsquery_is_or_of_quoted_terms(self):
+        assert build_tsquery("年假 ERR-1042") == "'年假' | 'err1042' | 'err' | '1042'"
+        assert build_tsquery("？？") == ""
+
+    def test_search_tokens_are_deduplicated(self):
+        assert build_search_tokens("年假年假") == "年假 假年"
+
+    def test_model_default_fills_search_tokens(self):
+        context = MagicMock()
+        context.get_current_parameters.return_value = {"content": "SKU-88 库存"}
+        assert get_chunk_search_tokens(context) == "sku88 sku 88 库存"
+
+
+class TestReciprocalRankFusion:
+    """RRF 融合"""
+
+    def test_documents_found_by_both_sources_rank_first(self):
+        fused = reciprocal_rank_fusion(
+            {"vector": [_hit("a"), _hit("b")], "lexical": [_hit("c"), _hit("b")]},
+            rrf_k=60,
+        )
+
+        assert [r["id"] for r in fused] == ["b", "a", "c"]
+        assert fused[0]["retrievers"] == ["vector", "lexical"]
+        assert fused[0]["fusion_score"] == pytest.approx(1 / 62 + 1 / 62)
+
+    def test_weights_and_limit(self):
+        fused = reciprocal_rank_fusion(
+            {"vector": [_hit("a")], "lexical": [_hit("c")]},
+            weights={"vector": 1.0, "lexical": 2.0},
+            limit=1,
+        )
+        assert [r["id"] for r in fused] == ["c"]
+
+    def test_zero_weight_disables_source(self):
+        fused = reciprocal_rank_fusion(
+            {"vector": [_hit("a")], "lexical": [_hit("c")]},
+            weights={"lexical": 0},
+        )
+        assert [r["id"] for r in fused] == ["a"]
+
+
+async def test_lexical_searcher_formats_rows_like_vector_hits():
+    row = {
+        "id": 7, "document_id": 3, "chunk_index": 2, "content": "ERR-1042 表示磁盘已满",
+        "vector_id": None, "page_number": 4,
+        "chunk_metadata": json.dumps({"start_pos": 900, "end_pos": 1400}),
+        "original_filename": "errors.md", "department_id": 5, "score": 0.3,
+    }
+    session = AsyncMock()
+    session.execute.return_value.mappings = lambda: types.SimpleNamespace(all=lambda: [row])
+    session_context = MagicMock()
+    session_context.__aenter__ = AsyncMock(return_value=session)
+    session_context.__aexit__ = AsyncMock(return_value=False)
+
+    searcher = LexicalSearcher(session_factory=lambda: session_context)
+    results = await searcher.search("ERR-1042 是什么", department_id=5, limit=3)
+
+    params = session.execute.await_args.args[1]
+    assert params["department_id"] == 5
+    assert params["limit"] == 3
+    assert "'err1042'" in params["tsquery"]
+    assert results == [{
+        "id": "chunk-7",
+        "score": 0.3,
+        "payload": {
+            "start_pos": 900, "end_pos": 1400, "document_id": 3, "chunk_id": 7,
+            "chunk_index": 2, "filename": "errors.md", "content": "ERR-1042 表示磁盘已满",
+            "department_id": 5, "page_number": 4,
+        },
+    }]
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "hybrid_search_enabled", True)
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    return service
+
+
+async def test_retrieve_fuses_vector_and_lexical_results(service, monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "hybrid_vector_k", 8)
+    search = AsyncMock(return_value=[_hit("a"), _hit("b")])
+    monkeypatch.setattr(rag_module.vector_store, "search", search)
+    monkeypatch.setattr(
+        rag_module.lexical_searcher, "search", AsyncMock(return_value=[_hit("sku"), _hit("b")])
+    )
+
+    results = await service._retrieve("SKU-88 的库存", [0.1, 0.2], department_id=2, top_k=2)
+
+    assert [r["id"] for r in results] == ["b", "a"]
+    search.assert_awaited_once_with(vector=[0.1, 0.2], limit=8, department_id=2)
+
+
+async def test_slow_lexical_search_falls_back_to_vector_results(service, monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "hybrid_lexical_timeout_ms", 10)
+
+    async def slow_search(*args, **kwargs):
+        await asyncio.sleep(1)
+        return [_hit("late")]
+
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[_hit("a")]))
+    monkeypatch.setattr(rag_module.lexical_searcher, "search", slow_search)
+
+    results = await service._retrieve("问题", [0.1, 0.2], department_id=2, top_k=5)
+
+    assert [r["id"] for r in results] == ["a"]
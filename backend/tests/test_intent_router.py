@@ -0,0 +1,131 @@
+"""
+闲聊意图路由测试
+"""
+import sys
+import time
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+from loguru import logger
+
+from app.services import rag as rag_module
+from app.services.intent_router import IntentRouter
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("你好", "greeting"),
+    ("您好！", "greeting"),
+    ("Hello ~", "greeting"),
+    ("早上好呀，在吗？", "greeting"),
+    ("谢谢", "thanks"),
+    ("好的，谢谢您！👍", "thanks"),
+    ("Thank you!", "thanks"),
+    ("拜拜", "goodbye"),
+    ("你能做什么？", "capability"),
+    ("你是谁", "capability"),
+    ("What can you do?", "capability"),
+])
+def test_chit_chat_is_recognised(message, intent):
+    assert IntentRouter().route(message).name == intent
+
+
+@pytest.mark.parametrize("message", [
+    "你好，年假几天？",
+    "谢谢，那病假怎么请？",
+    "年假几天？",
+    "ERR-1042 是什么意思",
+    "你能帮我查一下报销流程吗",
+    "",
+])
+def test_real_questions_go_to_retrieval(message):
+    assert IntentRouter().route(message) is None
+
+
+HISTORY = [
+    {"role": "user", "content": "报销系统怎么登录？"},
+    {"role": "assistant", "content": "使用工号登录。"},
+]
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("怎么用", None),
+    ("help", None),
+    ("你好", None),
+    ("谢谢", "thanks"),
+    ("拜拜", "goodbye"),
+])
+def test_mid_conversation_only_routes_closings(message, intent):
+    routed = IntentRouter().route(message, history=HISTORY)
+    assert (routed and routed.name) == intent
+    assert IntentRouter().route(message) is not None
+
+
+def test_routing_is_cheap():
+    router = IntentRouter()
+    start = time.perf_counter()
+    for _ in range(1000):
+        router.route("你好，请问年假一共有几天？病假需要提供什么材料？")
+        router.route("谢谢")
+    assert (time.perf_counter() - start) / 2000 < 0.001
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(embed_query=AsyncMock(return_value=[0.1]))
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="LLM 回答"))
+    )
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[]))
+    return service
+
+
+@pytest.fixture()
+def info_logs():
+    records = []
+    logger.remove()
+    logger.add(records.append, level="INFO", format="{message}")
+    yield records
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+async def test_chit_chat_skips_retrieval_and_generation(service, info_logs):
+    before = rag_module.stage_latency.count(stage="total", path="intent")
+
+    result = await service.query("谢谢！", department_id=1)
+
+    assert result["answer"] == rag_module.intent_router.RULES[1][2]
+    assert result["sources"] == []
+    assert "route_ms" in result["timings"]
+    service.embedding_service.embed_query.assert_not_awaited()
+    rag_module.vector_store.search.assert_not_awaited()
+    service.llm.ainvoke.assert_not_awaited()
+    assert rag_module.stage_latency.count(stage="total", path="intent") == before + 1
+    assert len(info_logs) == 1 and "意图: thanks" in info_logs[0]
+
+
+async def test_stream_returns_canned_answer(service):
+    events = [event async for event in service.stream_query("你好", department_id=1)]
+
+    assert [name for name, _ in events] == ["sources", "token", "done"]
+    assert events[1][1]["content"].startswith("您好")
+
+
+async def test_follow_up_help_goes_to_retrieval(service):
+    result = await service.query("怎么用？", department_id=1, history=HISTORY)
+
+    assert result["answer"] != rag_module.intent_router.RULES[3][2]
+    service.embedding_service.embed_query.assert_awaited_once()
+    rag_module.vector_store.search.assert_awaited()
+
+
+async def test_router_can_be_disabled(service, monkeypatch, rag_settings, info_logs):
+    monkeypatch.setattr(rag_settings, "intent_router_enabled", False)
+    monkeypatch.setattr(rag_settings, "no_context_fast_path_enabled", False)
+
+    result = await service.query("你好", department_id=1)
+
+    assert result["answer"] == "LLM 回答"
+    assert "意图: rag" in info_logs[-1]
@@ -0,0 +1,107 @@
+"""
+模型客户端注册表测试
+"""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.config import Settings, settings
+from app.core.model_clients import LLM_POOL, ModelClientRegistry, model_clients
+from app.services import rag as rag_module
+from app.services.document_processing.embedding import EmbeddingService
+
+
+def test_timeouts_are_parsed_per_provider():
+    config = Settings(model_http_timeouts_raw="openai=20, GLM=45,broken")
+
+    assert config.model_http_timeouts == {"openai": 20.0, "glm": 45.0}
+
+
+async def test_http_pool_is_shared_per_provider():
+    registry = ModelClientRegistry(
+        max_connections=7, keepalive_expiry=12, connect_timeout=2,
+        default_timeout=60, timeouts={"glm": 15},
+    )
+
+    pool = registry.http_client("glm")
+    assert registry.http_client("glm") is pool
+    assert registry.http_client("openai") is not pool
+    assert pool.timeout.read == 15
+    assert pool.timeout.connect == 2
+    assert registry.http_client("openai").timeout.read == 60
+
+    await registry.aclose()
+    assert pool.is_closed
+    assert registry.http_client("glm") is not pool
+    await registry.aclose()
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """保持连接的 HTTP/1.1 响应，使客户端复用连接"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def keepalive_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_pool_works_across_event_loops(keepalive_server):
+    """Celery 任务每次 asyncio.run 新建事件循环，共享客户端不能复用上一个循环的连接"""
+    registry = ModelClientRegistry()
+    client = registry.http_client("glm")
+
+    async def task():
+        first = await client.get(keepalive_server)
+        second = await client.get(keepalive_server)
+        return first.text + second.text
+
+    assert asyncio.run(task()) == "okok"
+    assert asyncio.run(task()) == "okok"
+    asyncio.run(registry.aclose())
+
+
+async def test_openai_clients_reuse_the_provider_pool():
+    registry = ModelClientRegistry()
+
+    client = registry.openai_client("qwen", "key", "https://example.com/v1")
+
+    assert registry.openai_client("qwen", "key", "https://example.com/v1") is client
+    assert registry.openai_client("qwen", "other", "https://example.com/v1") is not client
+    assert client._client is registry.http_client("qwen")
+    assert client.max_retries == 0
+    await registry.aclose()
+
+
+def test_embedding_services_share_the_registry_client():
+    first = EmbeddingService(provider="glm", api_key="k", base_url="https://glm.example/v4")
+    second = EmbeddingService(provider="glm", api_key="k", base_url="https://glm.example/v4")
+
+    assert first.client is second.client
+    assert first.client._client is model_clients.http_client("glm")
+
+
+def test_rag_service_uses_ingestion_embedding_config_and_llm_pool():
+    service = rag_module.RAGService()
+    config = settings.get_embedding_config()
+
+    assert service.embedding_service.provider == config["provider"]
+    assert service.embedding_service.model == config["model"]
+    assert service.embedding_service.base_url == config["base_url"]
+    assert service.llm.http_async_client is model_clients.http_client(LLM_POOL)
@@ -0,0 +1,142 @@
+"""
+无相关内容快速返回测试
+"""
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.core.config import Settings
+from app.services import rag as rag_module
+from app.utils.lexical import has_identifier
+
+
+def _hit(hit_id, score, document_id=1, filename="handbook.pdf", retrievers=None):
+    hit = {"id": hit_id, "score": score, "payload": {
+        "document_id": document_id, "chunk_id": hit_id, "filename": filename, "content": f"内容{hit_id}",
+    }}
+    if retrievers is not None:
+        hit["retrievers"] = retrievers
+    return hit
+
+
+def test_threshold_is_configured_per_embedding_model():
+    config = Settings(
+        embedding_provider="glm",
+        embedding_model="embedding-3",
+        relevance_threshold_default=0.3,
+        relevance_thresholds_raw="text-embedding-3-small=0.25, Embedding-3=0.45",
+    )
+    assert config.relevance_threshold == 0.45
+
+    config.embedding_model = "embedding-2"
+    assert config.relevance_threshold == 0.3
+
+
+def test_identifier_detection():
+    assert has_identifier("ERR-1042 是什么意思")
+    assert has_identifier("SKU88 还有库存吗")
+    assert has_identifier("VPN 怎么连")
+    assert not has_identifier("今天天气怎么样")
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "relevance_threshold_default", 0.5)
+    monkeypatch.setattr(rag_settings, "relevance_thresholds_raw", "")
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="LLM 回答"))
+    )
+    return service
+
+
+def _search_returns(monkeypatch, results):
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=results))
+
+
+async def test_irrelevant_results_skip_the_llm(service, monkeypatch):
+    _search_returns(monkeypatch, [
+        _hit("a", 0.31, document_id=1, filename="差旅制度.pdf"),
+        _hit("b", 0.30, document_id=1, filename="差旅制度.pdf"),
+        _hit("c", 0.22, document_id=2, filename="报销流程.docx"),
+    ])
+    before = rag_module.no_context_answers.value()
+
+    result = await service.query("今天天气怎么样", department_id=1)
+
+    service.llm.ainvoke.assert_not_awaited()
+    assert result["answer"].startswith(rag_module.NO_CONTEXT_ANSWER)
+    assert "- 差旅制度.pdf\n- 报销流程.docx" in result["answer"]
+    assert result["suggestions"] == [
+        {"document_id": 1, "filename": "差旅制度.pdf"},
+        {"document_id": 2, "filename": "报销流程.docx"},
+    ]
+    assert result["sources"] == []
+    assert result["cached"] is False
+    assert rag_module.no_context_answers.value() == before + 1
+
+
+async def test_low_score_chunks_are_kept_out_of_the_prompt(service, monkeypatch):
+    _search_returns(monkeypatch, [_hit("good", 0.8), _hit("weak", 0.2)])
+
+    result = await service.query("年假几天？", department_id=1)
+
+    prompt = service.llm.ainvoke.await_args.args[0]
+    assert "内容good" in prompt
+    assert "内容weak" not in prompt
+    assert [s["chunk_id"] for s in result["sources"]] == ["good"]
+    assert "suggestions" not in result
+
+
+async def test_lexical_only_hits_count_for_identifiers(service, monkeypatch):
+    _search_returns(monkeypatch, [_hit("sku", 0.4, retrievers=["lexical"])])
+    await service.query("SKU-88 的库存", department_id=1)
+    service.llm.ainvoke.assert_awaited_once()
+
+    service.llm.ainvoke.reset_mock()
+    await service.query("今天天气怎么样", department_id=1)
+    service.llm.ainvoke.assert_not_awaited()
+
+
+async def test_fast_path_can_be_disabled(service, monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "no_context_fast_path_enabled", False)
+    _search_returns(monkeypatch, [])
+
+    result = await service.query("今天天气怎么样", department_id=1)
+
+    assert result["answer"] == "LLM 回答"
+    assert "知识库中没有找到相关信息" in service.llm.ainvoke.await_args.args[0]
+
+
+async def test_follow_up_questions_still_reach_the_llm(service, monkeypatch):
+    _search_returns(monkeypatch, [])
+    history = [{"role": "user", "content": "年假几天？"}, {"role": "assistant", "content": "十五天"}]
+
+    result = await service.query("那病假呢？", department_id=1, history=history)
+
+    assert result["answer"] == "LLM 回答"
+
+
+async def test_stream_reports_suggestions_in_done_event(service, monkeypatch):
+    _search_returns(monkeypatch, [_hit("a", 0.1, filename="差旅制度.pdf")])
+
+    events = [event async for event in service.stream_query("今天天气怎么样", department_id=1)]
+
+    assert [name for name, _ in events] == ["sources", "token", "done"]
+    assert events[-1][1]["suggestions"] == [{"document_id": 1, "filename": "差旅制度.pdf"}]
+    assert events[-1][1]["cached"] is False
+
+
+def test_threshold_is_resolved_once_per_selection(service, monkeypatch, rag_settings):
+    reads = []
+    counting = property(lambda self: reads.append(1) or 0.5)
+    monkeypatch.setattr(type(rag_settings), "relevance_threshold", counting)
+
+    relevant = service._select_relevant("年假几天？", [_hit(f"v{i}", 0.4 + i * 0.05) for i in range(6)])
+
+    assert [r["id"] for r in relevant] == ["v2", "v3", "v4", "v5"]
+    assert len(reads) == 1
@@ -0,0 +1,165 @@
+"""
+批量 RAG 查询测试
+"""
+import asyncio
+import types
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import query as query_api
+from app.core.auth import get_current_user
+from app.services import rag as rag_module
+from app.services.embedding_cache import EmbeddingCache
+from app.services.hybrid_search import LexicalSearcher
+from app.services.vector_store import VectorStore
+
+
+def _hit(hit_id, content):
+    return {"id": hit_id, "score": 0.9, "payload": {
+        "document_id": 1, "chunk_id": hit_id, "filename": "faq.md", "content": content,
+    }}
+
+
+class SlowLLM:
+    """记录最大并发数的 LLM"""
+
+    def __init__(self, delay=0.02, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail_on and self.fail_on in prompt:
+                raise RuntimeError("llm timeout")
+            return types.SimpleNamespace(content=f"回答{self.calls}")
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    service = rag_module.RAGService()
+    service.llm = SlowLLM()
+    service.embedding_service = types.SimpleNamespace(
+        embed_texts=AsyncMock(side_effect=lambda texts: [[float(i), 1.0] for i in range(len(texts))])
+    )
+    monkeypatch.setattr(
+        rag_module.vector_store,
+        "search_many",
+        AsyncMock(side_effect=lambda vectors, **kwargs: [
+            [_hit(f"vec-{i}", f"内容{i}")] for i in range(len(vectors))
+        ]),
+    )
+    return service
+
+
+async def test_search_many_issues_one_multi_vector_query():
+    store = VectorStore()
+    store.collection = MagicMock()
+    store.collection.query.return_value = {
+        "ids": [["a"], ["b", "c"]],
+        "distances": [[0.1], [0.2, 0.9]],
+        "metadatas": [[{"n": 1}], [{"n": 2}, {"n": 3}]],
+    }
+
+    results = await store.search_many(
+        [[1.0, 0.0], [0.0, 1.0]], limit=2, score_threshold=0.5, department_id=4
+    )
+
+    store.collection.query.assert_called_once()
+    kwargs = store.collection.query.call_args.kwargs
+    assert kwargs["query_embeddings"] == [[1.0, 0.0], [0.0, 1.0]]
+    assert kwargs["where"] == {"department_id": 4}
+    assert [[r["id"] for r in hits] for hits in results] == [["a"], ["b"]]
+    assert results[1][0]["score"] == pytest.approx(0.8)
+
+
+async def test_lexical_search_many_maps_rows_back_to_questions():
+    rows = [
+        {"idx": 2, "id": 9, "document_id": 3, "chunk_index": 0, "content": "SKU-88 库存",
+         "vector_id": "vec-9", "page_number": None, "chunk_metadata": None,
+         "original_filename": "stock.md", "department_id": 5, "score": 0.4},
+    ]
+    session = AsyncMock()
+    session.execute.return_value.mappings = lambda: types.SimpleNamespace(all=lambda: rows)
+    session_context = MagicMock()
+    session_context.__aenter__ = AsyncMock(return_value=session)
+    session_context.__aexit__ = AsyncMock(return_value=False)
+
+    searcher = LexicalSearcher(session_factory=lambda: session_context)
+    results = await searcher.search_many(["？？", "年假", "SKU-88"], department_id=5, limit=3)
+
+    assert session.execute.await_count == 1
+    params = session.execute.await_args.args[1]
+    assert len(params["tsqueries"]) == 2
+    assert [len(r) for r in results] == [0, 0, 1]
+    assert results[2][0]["id"] == "vec-9"
+
+
+async def test_batch_query_shares_embedding_and_search_calls(service, rag_settings, monkeypatch):
+    monkeypatch.setattr(rag_settings, "query_batch_concurrency", 3)
+    questions = [f"问题{i}" for i in range(10)]
+
+    result = await service.batch_query(questions, department_id=2, top_k=3)
+
+    service.embedding_service.embed_texts.assert_awaited_once_with(questions)
+    rag_module.vector_store.search_many.assert_awaited_once()
+    assert rag_module.vector_store.search_many.await_args.kwargs["department_id"] == 2
+    assert service.llm.calls == 10
+    assert service.llm.max_active == 3
+    assert [r["question"] for r in result["results"]] == questions
+    assert result["results"][4]["sources"][0]["chunk_id"] == "vec-4"
+    assert {"embedding_ms", "retrieval_ms", "llm_ms", "total_ms"} <= set(result["timings"])
+
+
+async def test_batch_query_embeds_only_cache_misses(service, rag_settings, monkeypatch):
+    cache = EmbeddingCache(model="m", dimension=2)
+    await cache.set("问题1", [0.5, 0.5])
+    monkeypatch.setattr(rag_module, "embedding_cache", cache)
+    monkeypatch.setattr(rag_settings, "embedding_cache_enabled", True)
+
+    await service.batch_query(["问题1", "问题2"], department_id=1)
+
+    service.embedding_service.embed_texts.assert_awaited_once_with(["问题2"])
+    assert await cache.get("问题2") == [0.0, 1.0]
+
+
+async def test_batch_query_isolates_generation_failures(service):
+    service.llm = SlowLLM(fail_on="坏问题")
+
+    result = await service.batch_query(["好问题", "坏问题"], department_id=1)
+
+    assert result["results"][0]["answer"].startswith("回答")
+    assert result["results"][1]["answer"] is None
+    assert result["results"][1]["error"] == "llm timeout"
+
+
+def test_batch_endpoint_validates_size(service, rag_settings, monkeypatch):
+    monkeypatch.setattr(rag_settings, "query_batch_max_size", 2)
+    monkeypatch.setattr(query_api, "rag_service", service)
+    app = FastAPI()
+    app.include_router(query_api.router)
+    app.dependency_overrides[get_current_user] = lambda: types.SimpleNamespace(id=1, department_id=3)
+
+    with TestClient(app) as client:
+        too_many = client.post("/query/batch", json={"questions": ["a", "b", "c"]})
+        empty = client.post("/query/batch", json={"questions": []})
+        ok = client.post("/query/batch", json={"questions": ["年假几天？", "报销流程？"]})
+
+    assert too_many.status_code == 400
+    assert empty.status_code == 400
+    assert ok.status_code == 200
+    body = ok.json()
+    assert [item["question"] for item in body["results"]] == ["年假几天？", "报销流程？"]
+    assert body["results"][0]["cached"] is False
+    assert rag_module.vector_store.search_many.await_args.kwargs["department_id"] == 3
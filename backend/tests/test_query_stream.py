@@ -0,0 +1,108 @@
+"""
+流式 RAG 查询测试
+"""
+import json
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import query as query_api
+from app.core.auth import get_current_user
+from app.services import rag as rag_module
+
+
+SEARCH_RESULTS = [
+    {
+        "id": "vec-1",
+        "score": 0.91,
+        "payload": {
+            "document_id": 1,
+            "chunk_id": 10,
+            "filename": "handbook.pdf",
+            "content": "年假为每年十五天",
+        },
+    }
+]
+
+
+class FakeStreamingLLM:
+    """按顺序产出预设 token 的 LLM"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    async def astream(self, prompt):
+        for token in self.tokens:
+            yield types.SimpleNamespace(content=token)
+
+    async def ainvoke(self, prompt):
+        return types.SimpleNamespace(content="".join(self.tokens))
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    service = rag_module.RAGService()
+    service.llm = FakeStreamingLLM(["年假", "", "十五天"])
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    monkeypatch.setattr(
+        rag_module.vector_store, "search", AsyncMock(return_value=SEARCH_RESULTS)
+    )
+    return service
+
+
+async def test_stream_query_emits_sources_before_tokens(service):
+    events = [event async for event in service.stream_query("年假几天？", department_id=1)]
+
+    names = [name for name, _ in events]
+    assert names == ["sources", "token", "token", "done"]
+    assert events[0][1]["sources"][0]["filename"] == "handbook.pdf"
+    assert "retrieval_ms" in events[0][1]["timings"]
+    assert [data["content"] for name, data in events if name == "token"] == ["年假", "十五天"]
+    assert {"retrieval_ms", "first_token_ms", "llm_ms", "total_ms"} <= set(events[-1][1]["timings"])
+
+
+async def test_query_returns_timings(service):
+    result = await service.query("年假几天？", department_id=1)
+
+    assert result["answer"] == "年假十五天"
+    assert result["sources"][0]["chunk_id"] == 10
+    assert {"retrieval_ms", "llm_ms", "total_ms"} <= set(result["timings"])
+
+
+def test_stream_endpoint_returns_event_stream(service, monkeypatch):
+    monkeypatch.setattr(query_api, "rag_service", service)
+    app = FastAPI()
+    app.include_router(query_api.router)
+    app.dependency_overrides[get_current_user] = lambda: types.SimpleNamespace(id=1, department_id=3)
+
+    with TestClient(app) as client:
+        response = client.post("/query/stream", json={"question": "年假几天？"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = [b for b in response.text.split("\n\n") if b]
+    assert blocks[0].startswith("event: sources\n")
+    assert blocks[-1].startswith("event: done\n")
+    payload = json.loads(blocks[1].split("data: ", 1)[1])
+    assert payload == {"content": "年假"}
+    rag_module.vector_store.search.assert_awaited_with(
+        vector=[0.1, 0.2], limit=5, department_id=3
+    )
+
+
+def test_stream_endpoint_reports_errors_as_event(service, monkeypatch):
+    service.embedding_service.embed_query.side_effect = RuntimeError("embedding down")
+    monkeypatch.setattr(query_api, "rag_service", service)
+    app = FastAPI()
+    app.include_router(query_api.router)
+    app.dependency_overrides[get_current_user] = lambda: types.SimpleNamespace(id=1, department_id=None)
+
+    with TestClient(app) as client:
+        response = client.post("/query/stream", json={"question": "年假几天？"})
+
+    assert response.text == query_api.format_sse("error", {"detail": "embedding down"})
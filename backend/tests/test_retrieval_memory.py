@@ -0,0 +1,152 @@
+"""
+会话检索结果延续测试
+"""
+import importlib
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services import rag as rag_module
+from app.services import retrieval_memory as memory_module
+from app.services.retrieval_memory import RetrievalMemory
+
+vector_store_module = importlib.import_module("app.services.vector_store")
+
+HISTORY = [{"role": "user", "content": "报销流程有哪些要点？"}, {"role": "assistant", "content": "一、二、三"}]
+
+
+def _hit(hit_id, score=0.9, document_id=1):
+    return {"id": hit_id, "score": score, "payload": {
+        "document_id": document_id, "chunk_id": hit_id, "filename": "报销流程.pdf", "content": f"内容{hit_id}",
+    }}
+
+
+async def test_similarity_decides_reuse_augment_or_miss():
+    memory = RetrievalMemory(reuse_similarity=0.9, augment_similarity=0.7)
+    await memory.remember("c1", [1.0, 0.0], 1, 5, [_hit("a")])
+    before = memory.stats()
+
+    reuse = await memory.lookup("c1", [0.99, 0.05], 1, 5)
+    augment = await memory.lookup("c1", [0.8, 0.6], 1, 5)
+    miss = await memory.lookup("c1", [0.0, 1.0], 1, 5)
+
+    assert reuse.outcome == "reuse" and reuse.results == [_hit("a")]
+    assert augment.outcome == "augment"
+    assert miss is None
+    assert await memory.lookup("c1", [1.0, 0.0], 2, 5) is None
+    assert await memory.lookup("c1", [1.0, 0.0], 1, 3) is None
+    stats = memory.stats()
+    assert stats["reuse"] == before["reuse"] + 1
+    assert stats["miss"] == before["miss"] + 3
+    assert memory_module.carry_over_hit_ratio.value() == stats["hit_ratio"]
+
+
+async def test_entries_are_shared_through_redis(fake_redis):
+    writer = RetrievalMemory(redis_client=fake_redis)
+    await writer.remember("c1", [1.0, 0.0], 1, 5, [_hit("a")])
+
+    carry_over = await RetrievalMemory(redis_client=fake_redis).lookup("c1", [1.0, 0.0], 1, 5)
+
+    assert carry_over.outcome == "reuse"
+    assert carry_over.results[0]["id"] == "a"
+
+
+async def test_changed_documents_and_departments_are_not_reused(fake_redis):
+    writer = RetrievalMemory(redis_client=fake_redis)
+    reader = RetrievalMemory(redis_client=fake_redis)
+    await writer.remember("c1", [1.0, 0.0], 1, 5, [_hit("a", document_id=7)])
+    await writer.remember("c2", [1.0, 0.0], 1, 5, [_hit("b", document_id=8)])
+    await writer.remember("c3", [1.0, 0.0], 2, 5, [_hit("c", document_id=9)])
+
+    await writer.invalidate_documents([7])
+    await writer.invalidate_department(2)
+
+    assert await writer.lookup("c1", [1.0, 0.0], 1, 5) is None
+    assert await reader.lookup("c1", [1.0, 0.0], 1, 5) is None       # 其他 worker 通过 Redis 得知
+    assert (await reader.lookup("c2", [1.0, 0.0], 1, 5)).outcome == "reuse"
+    assert await reader.lookup("c3", [1.0, 0.0], 2, 5) is None
+
+    # 变更之后写入的结果照常复用
+    await writer.remember("c1", [1.0, 0.0], 1, 5, [_hit("a2", document_id=7)])
+    assert (await reader.lookup("c1", [1.0, 0.0], 1, 5)).outcome == "reuse"
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    monkeypatch.setattr(rag_settings, "retrieval_carryover_enabled", True)
+    monkeypatch.setattr(rag_settings, "retrieval_carryover_augment_k", 2)
+    memory = RetrievalMemory(reuse_similarity=0.9, augment_similarity=0.7)
+    monkeypatch.setattr(rag_module, "retrieval_memory", memory)
+    monkeypatch.setattr(vector_store_module, "retrieval_memory", memory)
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(embed_query=AsyncMock())
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="回答"))
+    )
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[_hit("a"), _hit("b")]))
+    return service
+
+
+async def _ask(service, vector, question, history=HISTORY):
+    service.embedding_service.embed_query.return_value = vector
+    return await service.query(question, department_id=1, history=history, conversation_key="u1:c1")
+
+
+async def test_close_follow_up_reuses_previous_chunks(service):
+    await _ask(service, [1.0, 0.0], "报销流程有哪些要点？", history=None)
+    search = rag_module.vector_store.search
+    assert search.await_count == 1
+
+    result = await _ask(service, [0.98, 0.1], "第二点呢？")
+
+    assert search.await_count == 1
+    assert result["timings"]["retrieval_carryover"] == "reuse"
+    assert [s["chunk_id"] for s in result["sources"]] == ["a", "b"]
+
+
+async def test_related_follow_up_augments_previous_chunks(service):
+    await _ask(service, [1.0, 0.0], "报销流程有哪些要点？", history=None)
+    rag_module.vector_store.search.return_value = [_hit("b"), _hit("c")]
+
+    result = await _ask(service, [0.8, 0.6], "那差旅呢？")
+
+    assert rag_module.vector_store.search.await_args.kwargs["limit"] == 2
+    assert result["timings"]["retrieval_carryover"] == "augment"
+    assert [s["chunk_id"] for s in result["sources"]] == ["a", "b", "c"]
+
+
+async def test_augmented_results_are_trimmed_to_top_k(service):
+    service.embedding_service.embed_query.return_value = [1.0, 0.0]
+    await service.query("报销流程有哪些要点？", department_id=1, top_k=2, conversation_key="u1:c1")
+    rag_module.vector_store.search.return_value = [_hit("c"), _hit("d")]
+
+    service.embedding_service.embed_query.return_value = [0.8, 0.6]
+    result = await service.query(
+        "那差旅呢？", department_id=1, history=HISTORY, top_k=2, conversation_key="u1:c1"
+    )
+
+    assert result["timings"]["retrieval_carryover"] == "augment"
+    assert [s["chunk_id"] for s in result["sources"]] == ["a", "b"]
+
+
+async def test_deleted_document_is_not_carried_over(service, monkeypatch):
+    await _ask(service, [1.0, 0.0], "报销流程有哪些要点？", history=None)
+    monkeypatch.setattr(rag_module.vector_store, "_run", AsyncMock(return_value=0))
+    monkeypatch.setattr(rag_module.vector_store, "_chunk_collections", AsyncMock(return_value=[]))
+    monkeypatch.setattr(rag_module.vector_store, "document_collection", types.SimpleNamespace(delete=None))
+
+    await rag_module.vector_store.delete_by_document(1)
+    result = await _ask(service, [0.98, 0.1], "第二点呢？")
+
+    assert rag_module.vector_store.search.await_count == 2
+    assert "retrieval_carryover" not in result["timings"]
+
+
+async def test_unrelated_follow_up_runs_full_retrieval(service):
+    await _ask(service, [1.0, 0.0], "报销流程有哪些要点？", history=None)
+
+    result = await _ask(service, [0.0, 1.0], "年假几天？")
+
+    assert rag_module.vector_store.search.await_count == 2
+    assert "retrieval_carryover" not in result["timings"]
@@ -0,0 +1,185 @@
+"""
+请求合并测试
+"""
+import asyncio
+import types
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services import rag as rag_module
+from app.services import single_flight as single_flight_module
+from app.services.single_flight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight("test-do")
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    results = await asyncio.gather(*(flights.do("k", compute) for _ in range(5)))
+
+    assert calls == 1
+    assert all(r == {"answer": 42} for r in results)
+    assert not flights.in_flight("k")
+    assert single_flight_module.coalesced_requests.value(kind="test-do") == 4
+    assert single_flight_module.fan_in.quantile(0.5, kind="test-do") == 5
+
+    await flights.do("k", compute)
+    assert calls == 2
+
+
+async def test_errors_are_shared_by_all_waiters():
+    flights = SingleFlight("test-error")
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("llm down")
+
+    results = await asyncio.gather(
+        *(flights.do("k", compute) for _ in range(3)), return_exceptions=True
+    )
+
+    assert [str(r) for r in results] == ["llm down"] * 3
+
+
+async def test_late_stream_subscriber_replays_buffered_events():
+    flights = SingleFlight("test-stream")
+    calls = 0
+    release = asyncio.Event()
+
+    async def produce():
+        nonlocal calls
+        calls += 1
+        yield "sources"
+        await release.wait()
+        yield "token"
+        yield "done"
+
+    async def consume():
+        return [event async for event in flights.stream("k", produce)]
+
+    leader = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await leader == ["sources", "token", "done"]
+    assert await follower == ["sources", "token", "done"]
+    assert calls == 1
+
+
+async def test_generation_is_cancelled_when_every_subscriber_leaves():
+    flights = SingleFlight("test-cancel")
+    cancelled = asyncio.Event()
+
+    async def produce():
+        try:
+            yield "sources"
+            await asyncio.sleep(10)
+            yield "done"
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    first = flights.stream("k", produce)
+    second = flights.stream("k", produce)
+    assert await first.__anext__() == "sources"
+    assert await second.__anext__() == "sources"
+
+    await first.aclose()
+    assert flights.in_flight("k")
+    await second.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert not flights.in_flight("k")
+
+
+class SlowLLM:
+    def __init__(self):
+        self.ainvoke = AsyncMock(side_effect=self._answer)
+        self.streams = 0
+
+    async def _answer(self, prompt):
+        await asyncio.sleep(0.02)
+        return types.SimpleNamespace(content="年假十五天")
+
+    async def astream(self, prompt):
+        self.streams += 1
+        for token in ("年假", "十五天"):
+            await asyncio.sleep(0.01)
+            yield types.SimpleNamespace(content=token)
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    service = rag_module.RAGService()
+    service.llm = SlowLLM()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=[
+        {"id": "vec-1", "score": 0.9, "payload": {
+            "document_id": 1, "chunk_id": 10, "filename": "handbook.pdf", "content": "年假为每年十五天",
+        }}
+    ]))
+    return service
+
+
+async def test_identical_queries_are_coalesced_per_department(service):
+    results = await asyncio.gather(
+        service.query("年假几天？", department_id=1),
+        service.query("年假几天？ ", department_id=1),
+        service.query("年假几天？", department_id=2),
+    )
+
+    assert [r["answer"] for r in results] == ["年假十五天"] * 3
+    assert service.llm.ainvoke.await_count == 2
+    assert service.embedding_service.embed_query.await_count == 2
+    assert results[0] is not results[1]
+
+
+async def test_different_history_is_not_coalesced(service):
+    history = [{"role": "user", "content": "你好"}]
+    await asyncio.gather(
+        service.query("年假几天？", department_id=1),
+        service.query("年假几天？", department_id=1, history=history),
+    )
+
+    assert service.llm.ainvoke.await_count == 2
+
+
+async def test_different_conversations_are_not_coalesced(service):
+    history = [{"role": "user", "content": "你好"}]
+    await asyncio.gather(
+        service.query("年假几天？", department_id=1, history=history, conversation_key="1:abc"),
+        service.query("年假几天？", department_id=1, history=history, conversation_key="2:abc"),
+        service.query("年假几天？", department_id=1, history=history, conversation_key="2:abc"),
+    )
+
+    assert service.llm.ainvoke.await_count == 2
+
+
+async def test_identical_streams_share_one_generation(service):
+    async def consume():
+        return [event async for event in service.stream_query("年假几天？", department_id=1)]
+
+    first, second = await asyncio.gather(consume(), consume())
+
+    assert service.llm.streams == 1
+    assert [name for name, _ in first] == ["sources", "token", "token", "done"]
+    assert first == second
+
+
+async def test_coalescing_can_be_disabled(service, rag_settings, monkeypatch):
+    monkeypatch.setattr(rag_settings, "single_flight_enabled", False)
+
+    await asyncio.gather(*(service.query("年假几天？", department_id=1) for _ in range(2)))
+
+    assert service.llm.ainvoke.await_count == 2
@@ -0,0 +1,102 @@
+"""
+RAG 阶段耗时与直方图测试
+"""
+import sys
+import types
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from loguru import logger
+
+from app.api import query as query_api
+from app.core.auth import get_current_user
+from app.core.metrics import Histogram
+from app.services import rag as rag_module
+
+
+SEARCH_RESULTS = [
+    {"id": "vec-1", "score": 0.91, "payload": {
+        "document_id": 1, "chunk_id": 10, "filename": "handbook.pdf", "content": "年假为每年十五天",
+    }}
+]
+STAGES = ("embed", "search", "context", "prompt", "llm")
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram("latency", buckets=(10, 100, 1000))
+    for value in (5, 8, 50, 500, 5000):
+        histogram.observe(value, stage="llm")
+
+    snapshot = histogram.snapshot()["stage=llm"]
+    assert snapshot["count"] == 5
+    assert snapshot["sum"] == 5563
+    assert snapshot["buckets"] == {"10": 2, "100": 3, "1000": 4, "+Inf": 5}
+    assert histogram.quantile(0.5, stage="llm") == 100
+    assert histogram.quantile(0.99, stage="llm") == 1000
+    assert histogram.quantile(0.5, stage="embed") is None
+
+
+@pytest.fixture()
+def service(monkeypatch, rag_settings):
+    service = rag_module.RAGService()
+    service.embedding_service = types.SimpleNamespace(
+        embed_query=AsyncMock(return_value=[0.1, 0.2])
+    )
+    service.llm = types.SimpleNamespace(
+        ainvoke=AsyncMock(return_value=types.SimpleNamespace(content="年假十五天"))
+    )
+    monkeypatch.setattr(rag_module.vector_store, "search", AsyncMock(return_value=SEARCH_RESULTS))
+    return service
+
+
+@pytest.fixture()
+def info_logs():
+    """只保留 INFO 及以上级别的日志输出"""
+    records = []
+    logger.remove()
+    logger.add(records.append, level="INFO", format="{message}")
+    yield records
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+async def test_query_records_each_stage(service):
+    before = {stage: rag_module.stage_latency.count(stage=stage) for stage in STAGES}
+
+    result = await service.query("年假几天？", department_id=1)
+
+    assert {f"{stage}_ms" for stage in STAGES} <= set(result["timings"])
+    for stage in STAGES:
+        assert rag_module.stage_latency.count(stage=stage) == before[stage] + 1
+    assert rag_module.stage_latency.count(stage="total", path="llm") >= 1
+
+
+async def test_previews_are_not_built_when_debug_is_off(service, monkeypatch, info_logs):
+    preview = MagicMock(return_value="")
+    preview_results = MagicMock(return_value="")
+    monkeypatch.setattr(rag_module, "_preview", preview)
+    monkeypatch.setattr(rag_module, "_preview_results", preview_results)
+
+    await service.query("年假几天？", department_id=1)
+
+    preview.assert_not_called()
+    preview_results.assert_not_called()
+    assert len(info_logs) == 1
+    assert info_logs[0].startswith("RAG 查询完成")
+    assert "年假十五天" not in info_logs[0]
+
+
+def test_timings_are_returned_only_on_request(service, monkeypatch):
+    monkeypatch.setattr(query_api, "rag_service", service)
+    app = FastAPI()
+    app.include_router(query_api.router)
+    app.dependency_overrides[get_current_user] = lambda: types.SimpleNamespace(id=1, department_id=1)
+
+    with TestClient(app) as client:
+        plain = client.post("/query/", json={"question": "年假几天？"})
+        timed = client.post("/query/", json={"question": "年假几天？", "include_timings": True})
+
+    assert plain.json()["timings"] is None
+    assert {f"{stage}_ms" for stage in STAGES} <= set(timed.json()["timings"])
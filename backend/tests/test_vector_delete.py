@@ -0,0 +1,137 @@
+"""
+按文档/部门删除向量测试
+"""
+import types
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import documents as documents_api
+from app.core.config import settings
+from app.services.answer_cache import answer_cache
+from app.services.vector_store import VectorStore, deleted_vectors, delete_latency
+
+IDS = ["1-0", "1-1", "1-2", "2-0", "3-0"]
+VECTORS = [[1.0, 0.0], [0.9, 0.1], [0.8, 0.2], [0.0, 1.0], [0.7, 0.3]]
+METADATAS = [
+    {"document_id": 1, "department_id": 1},
+    {"document_id": 1, "department_id": 1},
+    {"document_id": 1, "department_id": 1},
+    {"document_id": 2, "department_id": 1},
+    {"document_id": 3, "department_id": 2},
+]
+
+
+@pytest.fixture(params=[False, True], ids=["global", "partitioned"])
+def store(request, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "chroma_mode", "flat")
+    monkeypatch.setattr(settings, "flat_index_directory", str(tmp_path))
+    monkeypatch.setattr(settings, "document_index_enabled", True)
+    monkeypatch.setattr(settings, "vector_partition_by_department", request.param)
+    store = VectorStore()
+    yield store
+    store.shutdown()
+
+
+async def _ids(store, department_id):
+    return [hit["id"] for hit in await store.search([1.0, 0.0], limit=10, department_id=department_id)]
+
+
+async def test_delete_by_document_is_a_filtered_server_side_delete(store):
+    await store.insert_points(IDS, VECTORS, METADATAS)
+    collection = await store._chunk_collection(1)
+    calls = []
+    original = collection.delete
+    collection.delete = lambda **kwargs: calls.append(kwargs) or original(**kwargs)
+    before = deleted_vectors.value(scope="document")
+
+    removed = await store.delete_by_document(1, department_id=1)
+
+    assert removed == 3
+    assert calls == [{"where": {"document_id": 1}}]
+    assert await _ids(store, 1) == ["2-0"]
+    assert await _ids(store, 2) == ["3-0"]
+    assert store.document_collection.get(ids=["doc-1", "doc-2"])["ids"] == ["doc-2"]
+    assert deleted_vectors.value(scope="document") == before + 3
+    assert delete_latency.snapshot()["scope=document"]["count"] >= 1
+
+
+async def test_delete_by_department_removes_only_that_department(store):
+    await store.insert_points(IDS, VECTORS, METADATAS)
+    before = deleted_vectors.value(scope="department")
+
+    assert await store.delete_by_department(1) == 4
+
+    assert await _ids(store, 1) == []
+    assert await _ids(store, 2) == ["3-0"]
+    assert store.document_collection.get()["ids"] == ["doc-3"]
+    assert deleted_vectors.value(scope="department") == before + 4
+    if settings.vector_partition_by_department:
+        assert await store._partition_department_ids() == [2]
+
+
+async def test_vector_writes_and_department_delete_invalidate_answer_cache(store, monkeypatch):
+    invalidate = AsyncMock()
+    monkeypatch.setattr(answer_cache, "invalidate_department", invalidate)
+
+    await store.insert_points(IDS, VECTORS, METADATAS)
+    assert sorted(call.args[0] for call in invalidate.await_args_list) == [1, 2]
+
+    invalidate.reset_mock()
+    await store.delete_by_department(2)
+    invalidate.assert_awaited_once_with(2)
+
+
+def _db_with(document):
+    result = MagicMock()
+    result.scalar_one_or_none.return_value = document
+    db = AsyncMock()
+    db.execute.return_value = result
+    return db
+
+
+async def test_delete_document_endpoint_removes_vectors_before_the_record(monkeypatch):
+    order = []
+    delete_vectors = AsyncMock(side_effect=lambda *a, **k: order.append("vectors"))
+    monkeypatch.setattr(documents_api.vector_store, "delete_by_document", delete_vectors)
+    monkeypatch.setattr(documents_api.answer_cache, "invalidate_department", AsyncMock())
+    db = _db_with(types.SimpleNamespace(id=5, department_id=3))
+    db.delete.side_effect = lambda document: order.append("record")
+
+    await documents_api.delete_document(document_id=5, db=db)
+
+    delete_vectors.assert_awaited_once_with(5, department_id=3)
+    assert order == ["vectors", "record"]
+    db.commit.assert_awaited_once()
+
+
+async def test_upload_does_not_invalidate_answer_cache(monkeypatch):
+    invalidate = AsyncMock()
+    monkeypatch.setattr(documents_api.answer_cache, "invalidate_department", invalidate)
+    upload = types.SimpleNamespace(
+        filename="handbook.pdf", content_type="application/pdf", read=AsyncMock(return_value=b"%PDF")
+    )
+    db = AsyncMock()
+    db.add = MagicMock()
+
+    user = types.SimpleNamespace(id=1, department_id=3)
+
+    await documents_api.upload_document(file=upload, db=db, current_user=user)
+
+    db.commit.assert_awaited_once()
+    invalidate.assert_not_awaited()     # 文档仍在待处理，向量写入后才失效
+
+
+async def test_delete_document_keeps_record_when_vector_delete_fails(monkeypatch):
+    monkeypatch.setattr(
+        documents_api.vector_store, "delete_by_document", AsyncMock(side_effect=ConnectionError("down"))
+    )
+    db = _db_with(types.SimpleNamespace(id=5, department_id=3))
+
+    with pytest.raises(HTTPException) as exc_info:
+        await documents_api.delete_document(document_id=5, db=db)
+
+    assert exc_info.value.status_code == 503
+    db.delete.assert_not_called()
+    db.commit.assert_not_awaited()
@@ -0,0 +1,133 @@
+"""
+分片向量检索测试（以多个平铺索引目录模拟多个 Chroma 节点）
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import vector_shards
+from app.services.flat_index import FlatIndexClient
+from app.services.vector_shards import ShardedClient, partial_results, shard_failures, shard_for
+from app.services.vector_store import VectorStore
+
+
+class SlowCollection:
+    """检索前等待 delay 秒（或等到 release 被设置）、或直接抛错的分片集合"""
+
+    def __init__(self, collection, delay=0.0, error=None, release=None):
+        self.collection = collection
+        self.delay = delay
+        self.error = error
+        self.release = release
+
+    def query(self, **kwargs):
+        if self.error:
+            raise self.error
+        if self.release is not None:
+            self.release.wait()
+        time.sleep(self.delay)
+        return self.collection.query(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def _corpus(rows=120, dimension=8, documents=12):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((rows, dimension)).astype(np.float32)
+    metadatas = [{"department_id": 1, "document_id": i % documents + 1} for i in range(rows)]
+    return [f"chunk-{i}" for i in range(rows)], vectors.tolist(), metadatas
+
+
+@pytest.fixture()
+def sharded(tmp_path):
+    client = ShardedClient([FlatIndexClient(str(tmp_path / f"node-{i}")) for i in range(3)], timeout_ms=200)
+    collection = client.create_collection("documents")
+    collection.add(*_corpus())
+    return collection
+
+
+def test_writes_are_routed_by_document_and_search_merges_shards(tmp_path, sharded):
+    ids, vectors, metadatas = _corpus()
+    single = FlatIndexClient(str(tmp_path / "single")).create_collection("documents")
+    single.add(ids, vectors, metadatas)
+
+    for index, shard in enumerate(sharded.shards):
+        stored = shard.get(include=["metadatas"])["metadatas"]
+        assert stored and all(shard_for(m["document_id"], 3) == index for m in stored)
+    assert sharded.count() == 120
+
+    queries = vectors[:3]
+    merged = sharded.query(query_embeddings=queries, n_results=7, where={"department_id": 1})
+    expected = single.query(query_embeddings=queries, n_results=7, where={"department_id": 1})
+    assert merged["ids"] == expected["ids"]
+    assert np.allclose(merged["distances"], expected["distances"])
+
+    page = sharded.get(include=["embeddings"], limit=50, offset=30)
+    assert len(page["ids"]) == len(page["embeddings"]) == 50
+    assert len({*sharded.get(limit=70)["ids"], *sharded.get(limit=70, offset=70)["ids"]}) == 120
+
+
+def test_slow_or_failing_shards_degrade_to_partial_results(sharded):
+    healthy = sharded.shards[2]
+    sharded.shards[0] = SlowCollection(sharded.shards[0], delay=1.0)
+    sharded.shards[1] = SlowCollection(sharded.shards[1], error=ConnectionError("node down"))
+    before = partial_results.value()
+
+    start = time.perf_counter()
+    result = sharded.query(query_embeddings=[[1.0] * 8], n_results=5)
+
+    assert time.perf_counter() - start < 0.6
+    assert result["ids"] == healthy.query(query_embeddings=[[1.0] * 8], n_results=5)["ids"]
+    assert partial_results.value() == before + 1
+
+
+def test_stuck_shard_only_exhausts_its_own_workers(tmp_path):
+    nodes = [FlatIndexClient(str(tmp_path / f"node-{i}")) for i in range(3)]
+    client = ShardedClient(nodes, timeout_ms=100, workers_per_shard=2)
+    sharded = client.create_collection("documents")
+    sharded.add(*_corpus())
+    release = threading.Event()
+    sharded.shards[0] = SlowCollection(sharded.shards[0], release=release)
+    query = [[1.0] * 8]
+    healthy = [shard.query(query_embeddings=query, n_results=20) for shard in sharded.shards[1:]]
+    expected = sorted((d, i) for r in healthy for d, i in zip(r["distances"][0], r["ids"][0]))[:5]
+    before = shard_failures.value(shard="0", reason="saturated")
+
+    try:
+        start = time.perf_counter()
+        for _ in range(20):
+            result = sharded.query(query_embeddings=query, n_results=5)
+            assert result["ids"][0] == [row_id for _, row_id in expected]
+        # 只有前两次检索等待了超时，之后卡住的分片被直接跳过，健康分片照常响应
+        assert time.perf_counter() - start < 1.0
+        assert shard_failures.value(shard="0", reason="saturated") == before + 18
+    finally:
+        release.set()
+
+
+def test_all_shards_failing_raises(sharded):
+    sharded.shards = [SlowCollection(shard, error=ConnectionError("down")) for shard in sharded.shards]
+
+    with pytest.raises(RuntimeError):
+        sharded.query(query_embeddings=[[1.0] * 8], n_results=5)
+
+
+async def test_vector_store_in_sharded_mode(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "chroma_mode", "sharded")
+    monkeypatch.setattr(settings, "vector_shards_raw", f"{tmp_path}/a, {tmp_path}/b")
+    monkeypatch.setattr(settings, "document_index_enabled", True)
+    monkeypatch.setattr(vector_shards, "create_shard_client", lambda location: FlatIndexClient(location))
+    store = VectorStore()
+    try:
+        await store.insert_points(*_corpus(rows=40, documents=4))
+
+        hits = await store.search_hierarchical([1.0] * 8, limit=3, department_id=1, top_documents=2)
+        assert len(hits) == 3
+        assert await store.rebuild_document_index(batch_size=7) == 4
+        assert (await store.get_collection_stats())["count"] == 40
+    finally:
+        store.shutdown()
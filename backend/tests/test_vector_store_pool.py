@@ -0,0 +1,91 @@
+"""
+Chroma 线程池测试 - 慢查询不阻塞事件循环和其他请求
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.vector_store import (
+    VectorStore,
+    operation_latency,
+    pool_in_flight,
+    pool_queue_depth,
+    pool_wait,
+)
+
+SLOW_DEPARTMENT = 99
+
+
+class SlowCollection:
+    """指定部门的查询同步阻塞 0.3 秒的集合"""
+
+    name = "documents"
+
+    def __init__(self):
+        self.threads = set()
+
+    def query(self, query_embeddings, n_results, where=None):
+        self.threads.add(threading.current_thread().name)
+        if where == {"department_id": SLOW_DEPARTMENT}:
+            time.sleep(0.3)
+        return {
+            "ids": [["chunk-1"]],
+            "distances": [[0.1]],
+            "metadatas": [[{"department_id": where["department_id"], "document_id": 1}]],
+        }
+
+    def count(self):
+        return 1
+
+
+@pytest.fixture()
+def store(monkeypatch):
+    monkeypatch.setattr(settings, "chroma_mode", "local")
+    store = VectorStore()
+    store.collection = SlowCollection()
+    yield store
+    store.shutdown()
+
+
+async def test_slow_search_does_not_block_other_requests(store):
+    finished = {}
+
+    async def search(department_id):
+        start = time.perf_counter()
+        await store.search([0.1, 0.2], limit=1, department_id=department_id)
+        finished[department_id] = time.perf_counter() - start
+
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while SLOW_DEPARTMENT not in finished:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(search(SLOW_DEPARTMENT), heartbeat(), *(search(d) for d in range(1, 5)))
+
+    assert finished[SLOW_DEPARTMENT] >= 0.3
+    assert all(finished[d] < 0.15 for d in range(1, 5))
+    # 慢查询执行期间事件循环仍在调度其他协程
+    assert ticks >= 10
+    assert all(name.startswith("chroma") for name in store.collection.threads)
+
+
+def _count(histogram, key):
+    return histogram.snapshot().get(key, {}).get("count", 0)
+
+
+async def test_pool_records_queue_and_latency_metrics(store):
+    latency_before = _count(operation_latency, "operation=count")
+    wait_before = _count(pool_wait, "")
+
+    await store.get_collection_stats()
+
+    assert _count(operation_latency, "operation=count") == latency_before + 1
+    assert _count(pool_wait, "") == wait_before + 1
+    assert pool_queue_depth.value() == 0
+    assert pool_in_flight.value() == 0